@@ -1,11 +1,11 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from password_hashing import pwd_context
 
 load_dotenv()
 
@@ -13,9 +13,9 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your_super_secret_key_change_this_in_produ
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Blocking; async code uses get_password_hasher() from password_hashing
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
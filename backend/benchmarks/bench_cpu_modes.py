@@ -0,0 +1,105 @@
+# CPU Execution Mode Benchmark
+# Runs one try-on per CPU configuration and reports per-step denoising time, so
+# operators can pick the settings that suit their core count. Thread counts and
+# compiled UNets are process-wide, so every configuration runs in a fresh process.
+#
+# Usage:
+#   python benchmarks/bench_cpu_modes.py --person person.jpg --garment shirt.png
+#   python benchmarks/bench_cpu_modes.py --person p.jpg --garment g.png --threads 4 8 --modes baseline bf16 compile --steps 10 --output cpu.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Environment overrides for each mode (see cpu_execution.py)
+MODES = {
+    "baseline": {},
+    "bf16": {"TRYON_CPU_BF16": "true"},
+    "channels_last": {"TRYON_CPU_CHANNELS_LAST": "true"},
+    "bf16_channels_last": {"TRYON_CPU_BF16": "true", "TRYON_CPU_CHANNELS_LAST": "true"},
+    "compile": {"TRYON_CPU_COMPILE": "compile"},
+    "torchscript": {"TRYON_CPU_COMPILE": "torchscript"},
+    "sliced_attention": {"TRYON_ATTENTION_SLICE": "1024"},
+    "all": {"TRYON_CPU_BF16": "true", "TRYON_CPU_CHANNELS_LAST": "true", "TRYON_CPU_COMPILE": "compile"},
+}
+
+CPU_ENV_VARS = ("TRYON_CPU_BF16", "TRYON_CPU_CHANNELS_LAST", "TRYON_CPU_COMPILE", "TRYON_ATTENTION_SLICE", "TRYON_CPU_THREADS")
+
+
+def run_worker(args):
+    """Child process: load the engine with the configuration from the environment and time one run."""
+    from catvton_tryon import CatVTONProcessor
+
+    processor = CatVTONProcessor()
+    with open(args.person, "rb") as f:
+        person = f.read()
+    with open(args.garment, "rb") as f:
+        garment = f.read()
+
+    run_kwargs = dict(num_inference_steps=args.steps, height=args.height, width=args.width)
+    if args.warmup:
+        processor.run_virtual_tryon(person, garment, **{**run_kwargs, "num_inference_steps": 2})
+
+    start = time.perf_counter()
+    result = processor.run_virtual_tryon(person, garment, **run_kwargs)
+    total = time.perf_counter() - start
+
+    print(json.dumps({
+        "ok": result is not None,
+        "total_s": round(total, 2),
+        "execution": processor.execution,
+        "step_timings": processor.sampler.step_timings.summary(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-step timings for each CPU execution mode")
+    parser.add_argument("--person", required=True)
+    parser.add_argument("--garment", required=True)
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--threads", nargs="*", type=int, default=[0], help="Thread counts to try (0 = torch default)")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--width", type=int, default=576)
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Include compile/trace time in the timed run")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    base_env = {k: v for k, v in os.environ.items() if k not in CPU_ENV_VARS}
+    report = []
+    for threads in args.threads:
+        for mode in args.modes:
+            env = {**base_env, **MODES[mode], "TRYON_CPU_THREADS": str(threads), "TRYON_BATCH_MAX_SIZE": "1"}
+            command = [
+                sys.executable, __file__, "--worker",
+                "--person", args.person, "--garment", args.garment,
+                "--steps", str(args.steps), "--height", str(args.height), "--width", str(args.width),
+            ] + ([] if args.warmup else ["--no-warmup"])
+            print(f"Running {mode} with {threads or 'default'} threads...", file=sys.stderr)
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            lines = completed.stdout.strip().splitlines()
+            try:
+                result = json.loads(lines[-1])
+            except (IndexError, json.JSONDecodeError):
+                result = {"ok": False, "error": completed.stderr.strip().splitlines()[-1:] or "no output"}
+            report.append({"mode": mode, "threads": threads, **result})
+
+    output = json.dumps({"steps": args.steps, "resolution": f"{args.height}x{args.width}", "runs": report}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# HTTP Load Test
+# Drives the API over real HTTP at increasing concurrency to find where throughput
+# tops out per endpoint. The app runs in this process under uvicorn (on its own
+# thread and event loop) with in-memory collections (DATABASE_BACKEND=memory) and
+# local storage, seeded with users, products and try-on history, so neither MongoDB
+# nor Supabase is needed. Scenarios:
+#   login     POST /login as a random seeded user (bcrypt verify)
+#   products  GET /products, alternating between all products and one category
+#   history   GET /api/tryon/history at a random page
+#   tryon     POST /api/tryon/jobs on the offline engine (benchmarks/offline_engine.py);
+#             the queue drains between levels
+# Every level runs --concurrency closed-loop clients for --duration seconds and
+# reports throughput, p50/p95/p99 latency and non-2xx responses (e.g. 503 when the
+# try-on queue is full), plus the level with the highest throughput per scenario.
+#
+# Usage:
+#   python benchmarks/bench_load.py
+#   python benchmarks/bench_load.py --scenarios login history --concurrency 1 4 16 64 --duration 10 --output load.json
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ["DATABASE_BACKEND"] = "memory"
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["LOCAL_STORAGE_DIR"] = tempfile.mkdtemp(prefix="tryon-load-storage-")
+os.environ["TRYON_RESULT_CACHE"] = "false"  # every try-on job runs the pipeline
+os.environ.setdefault("TRYON_ENGINE_MODE", "disabled")  # the tryon scenario installs the offline engine
+
+import httpx
+import uvicorn
+
+import main as api
+from auth import get_password_hash
+from database import products_collection, tryon_history_collection, users_collection
+from local_image_server import LocalImageServer
+
+SCENARIOS = ("login", "products", "history", "tryon")
+CATEGORIES = ("Upper Body", "Lower Body", "Dress", "Accessories")
+TRYON_TYPES = {"Upper Body": "Upper body", "Lower Body": "Lower body", "Dress": "Full body", "Accessories": "Face"}
+PASSWORD = "load-test-password"
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))]
+
+
+async def seed(args, garment_url):
+    """Users, products and one user's try-on history, straight into the in-memory collections."""
+    password_hash = get_password_hash(PASSWORD)  # one hash for everyone, so seeding stays fast
+    users = []
+    for i in range(args.users):
+        user = {
+            "full_name": f"Load Test {i}",
+            "email": f"load{i}@virtualtryon.com",
+            "password": password_hash,
+            "role": "user",
+            "is_active": True,
+            "hq_rendering": False,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        await users_collection.insert_one(user)
+        users.append(user)
+
+    now = datetime.utcnow()
+    products = []
+    for i in range(args.products):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        product = {
+            "name": f"Product {i}",
+            "category": category,
+            "gender": "Unisex",
+            "tryon_type": TRYON_TYPES[category],
+            "image_url": garment_url,
+            "is_active": True,
+            "created_at": now - timedelta(minutes=i),
+        }
+        await products_collection.insert_one(product)
+        products.append(product)
+
+    for i in range(args.history):
+        product = products[i % len(products)]
+        await tryon_history_collection.insert_one({
+            "user_id": users[0]["_id"],
+            "product_id": product["_id"],
+            "product_name": product["name"],
+            "product_category": product["category"],
+            "original_image_url": f"{garment_url}?original={i}",
+            "result_image_url": f"{garment_url}?result={i}",
+            "processing_time": 1.0,
+            "status": "completed",
+            "created_at": now - timedelta(minutes=i),
+        })
+    return users, products
+
+
+def start_server(port):
+    server = uvicorn.Server(uvicorn.Config(
+        api.app, host="127.0.0.1", port=port, log_level="warning", access_log=False
+    ))
+    thread = threading.Thread(target=server.run, name="load-test-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("API server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_level(request, concurrency, duration):
+    """`concurrency` clients issuing `request()` back to back for `duration` seconds."""
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = (await request()).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] += 1
+            if status in (200, 201, 202):
+                latencies.append((time.perf_counter() - start) * 1000.0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": sum(statuses.values()),
+        "ok": len(latencies),
+        "failed": {str(status): count for status, count in statuses.items() if status not in (200, 201, 202)},
+        "throughput_per_s": round(len(latencies) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+async def wait_for_idle_queue(timeout=600):
+    deadline = time.perf_counter() + timeout
+    while api.INFERENCE_POOL.in_flight and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def run_scenarios(args, base_url, users, products, person):
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as http:
+        # Tokens for the authenticated scenarios, fetched up front (not timed)
+        token = (await http.post("/login", json={"email": users[0]["email"], "password": PASSWORD})).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        pages = max(1, args.history // args.page_size)
+
+        requests = {
+            "login": lambda: http.post("/login", json={"email": random.choice(users)["email"], "password": PASSWORD}),
+            "products": lambda: http.get(
+                "/products", params={"category": random.choice(CATEGORIES)} if random.random() < 0.5 else None
+            ),
+            "history": lambda: http.get(
+                "/api/tryon/history",
+                params={"limit": args.page_size, "skip": random.randrange(pages) * args.page_size},
+                headers=auth,
+            ),
+            "tryon": lambda: http.post(
+                "/api/tryon/jobs",
+                files={"user_image": ("person.jpg", person, "image/jpeg")},
+                data={"product_id": str(random.choice(products)["_id"]), "profile": args.profile},
+                headers=auth,
+            ),
+        }
+
+        for name in args.scenarios:
+            levels = []
+            for concurrency in args.concurrency:
+                print(f"{name}: {concurrency} clients...", file=sys.stderr)
+                levels.append(await run_level(requests[name], concurrency, args.duration))
+                if name == "tryon":
+                    await wait_for_idle_queue()
+            peak = max(levels, key=lambda level: level["throughput_per_s"])
+            results[name] = {
+                "levels": levels,
+                "peak": {key: peak[key] for key in ("concurrency", "throughput_per_s", "p95_ms")},
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-endpoint throughput under increasing concurrency")
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per concurrency level")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--history", type=int, default=500, help="Try-on history records of the test user")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--profile", default="preview", help="Inference profile for the tryon scenario")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    person = garment = None
+    if "tryon" in args.scenarios:
+        from model_manager import ModelManager
+        from offline_engine import create_offline_processor, synthetic_pair
+        person, garment = synthetic_pair()
+        # Replaces the app's engine before startup, which loads it
+        api.MODEL_MANAGER = ModelManager(create_offline_processor, mode="eager")
+
+    garment_dir = tempfile.mkdtemp(prefix="tryon-load-garments-")
+    if garment is not None:
+        with open(os.path.join(garment_dir, "garment.jpg"), "wb") as f:
+            f.write(garment)
+
+    server = None
+    try:
+        with LocalImageServer(directory=garment_dir) as image_server:
+            users, products = asyncio.run(seed(args, image_server.url_for("garment.jpg")))
+            port = free_port()
+            server, thread = start_server(port)
+            results = asyncio.run(run_scenarios(args, f"http://127.0.0.1:{port}", users, products, person))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=30)
+        shutil.rmtree(garment_dir, ignore_errors=True)
+        shutil.rmtree(os.environ["LOCAL_STORAGE_DIR"], ignore_errors=True)
+
+    output = json.dumps({
+        "settings": {
+            "duration_s": args.duration,
+            "users": args.users,
+            "products": args.products,
+            "history": args.history,
+            "page_size": args.page_size,
+        },
+        "scenarios": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
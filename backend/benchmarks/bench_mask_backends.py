@@ -0,0 +1,130 @@
+# Masking Backend Benchmark
+# Runs pose detection and segmentation through the ultralytics/rembg backend and the
+# ONNX Runtime backend (FP32 and INT8) on the same photos. Reports latency and how
+# closely each ONNX variant agrees with ultralytics: keypoint distance, PCK and
+# silhouette IoU.
+#
+# Usage (export the ONNX models first with `python onnx_masking.py --quantize`):
+#   python benchmarks/bench_mask_backends.py --images person1.jpg person2.jpg
+#   python benchmarks/bench_mask_backends.py --images photos/*.jpg --threads 4 --repeat 5 --output backends.json
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from PIL import Image
+
+from masking import create_mask_models
+
+# A keypoint "agrees" if it is within this fraction of the image diagonal
+PCK_THRESHOLD = 0.02
+
+
+def timed(fn, image, repeat):
+    fn(image)  # warm up (session creation, lazy loading)
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(image)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return result, statistics.median(timings)
+
+
+def keypoint_agreement(reference, candidate, diagonal):
+    """Mean pixel distance and PCK over keypoints that both backends detected."""
+    if reference is None or candidate is None:
+        return {"detected_by_both": reference is not None and candidate is not None}
+    both = np.all(reference > 0, axis=1) & np.all(candidate > 0, axis=1)
+    visibility_match = float(np.mean(np.all(reference > 0, axis=1) == np.all(candidate > 0, axis=1)))
+    if not both.any():
+        return {"detected_by_both": True, "common_keypoints": 0, "visibility_agreement": visibility_match}
+    distances = np.linalg.norm(reference[both] - candidate[both], axis=1)
+    return {
+        "detected_by_both": True,
+        "common_keypoints": int(both.sum()),
+        "visibility_agreement": round(visibility_match, 3),
+        "mean_distance_px": round(float(distances.mean()), 2),
+        "max_distance_px": round(float(distances.max()), 2),
+        "pck": round(float(np.mean(distances <= PCK_THRESHOLD * diagonal)), 3),
+    }
+
+
+def silhouette_iou(reference, candidate):
+    if reference is None or candidate is None:
+        return None
+    a, b = reference >= 128, candidate >= 128
+    union = np.logical_or(a, b).sum()
+    return round(float(np.logical_and(a, b).sum() / union), 4) if union else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the ultralytics/rembg and ONNX Runtime masking backends")
+    parser.add_argument("--images", nargs="+", required=True)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = default)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image (median is reported)")
+    parser.add_argument("--no-int8", action="store_true", help="Skip the INT8-quantized variant")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    from onnx_masking import OnnxMaskModels
+
+    backends = {
+        "ultralytics": create_mask_models("ultralytics"),
+        "onnx": OnnxMaskModels(quantize=False, intra_op_threads=args.threads),
+    }
+    if not args.no_int8:
+        backends["onnx-int8"] = OnnxMaskModels(quantize=True, intra_op_threads=args.threads)
+
+    per_image = []
+    for path in args.images:
+        image = Image.open(path).convert("RGB")
+        diagonal = float(np.hypot(*image.size))
+        results = {}
+        for name, models in backends.items():
+            keypoints, pose_ms = timed(models.detect_keypoints, image, args.repeat)
+            silhouette, seg_ms = timed(models.segment, image, args.repeat)
+            results[name] = {"keypoints": keypoints, "silhouette": silhouette, "pose_ms": pose_ms, "seg_ms": seg_ms}
+
+        reference = results["ultralytics"]
+        row = {"image": path, "size": list(image.size), "backends": {}}
+        for name, result in results.items():
+            entry = {"pose_ms": round(result["pose_ms"], 2), "seg_ms": round(result["seg_ms"], 2)}
+            if name != "ultralytics":
+                entry["keypoints"] = keypoint_agreement(reference["keypoints"], result["keypoints"], diagonal)
+                entry["silhouette_iou"] = silhouette_iou(reference["silhouette"], result["silhouette"])
+            row["backends"][name] = entry
+        per_image.append(row)
+
+    summary = {}
+    for name in backends:
+        rows = [row["backends"][name] for row in per_image]
+        summary[name] = {
+            "median_pose_ms": round(statistics.median(r["pose_ms"] for r in rows), 2),
+            "median_seg_ms": round(statistics.median(r["seg_ms"] for r in rows), 2),
+        }
+        if name != "ultralytics":
+            pck = [r["keypoints"]["pck"] for r in rows if "pck" in r["keypoints"]]
+            iou = [r["silhouette_iou"] for r in rows if r["silhouette_iou"] is not None]
+            summary[name]["mean_pck"] = round(statistics.mean(pck), 3) if pck else None
+            summary[name]["mean_silhouette_iou"] = round(statistics.mean(iou), 4) if iou else None
+
+    output = json.dumps({
+        "threads": args.threads,
+        "pck_threshold": PCK_THRESHOLD,
+        "summary": summary,
+        "images": per_image,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
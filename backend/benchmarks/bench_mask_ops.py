@@ -0,0 +1,104 @@
+# Mask Construction Micro-Benchmark
+# Times the NumPy/OpenCV mask stages against the previous PIL implementation
+# (ImageDraw polygon, MaxFilter(25), GaussianBlur(7)) at both resolution tiers, and
+# checks that the masks agree. Uses fixed synthetic keypoints, so no models are needed.
+#
+# Usage:
+#   python benchmarks/bench_mask_ops.py
+#   python benchmarks/bench_mask_ops.py --repeat 20 --tolerance 8 --output mask_ops.json
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from masking import MaskModels, UpperBodyMask
+
+RESOLUTIONS = [(768, 576), (1024, 768)]
+
+# Standing person, as fractions of (width, height): nose, shoulders, hips
+KEYPOINT_FRACTIONS = {0: (0.50, 0.12), 5: (0.64, 0.24), 6: (0.36, 0.24), 11: (0.60, 0.55), 12: (0.40, 0.55)}
+
+
+def synthetic_keypoints(height, width):
+    keypoints = np.zeros((17, 2), dtype=np.float32)
+    for index, (fx, fy) in KEYPOINT_FRACTIONS.items():
+        keypoints[index] = (fx * width, fy * height)
+    return keypoints
+
+
+def pil_reference_mask(keypoints, height, width):
+    """The mask exactly as generate_mask built it with PIL filters."""
+    pose_mask = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(pose_mask)
+    l_shoulder, r_shoulder, r_hip, l_hip, nose = keypoints[5], keypoints[6], keypoints[12], keypoints[11], keypoints[0]
+    draw.polygon([tuple(l_shoulder), tuple(r_shoulder), tuple(r_hip), tuple(l_hip)], fill=255)
+
+    neck_base_x = (l_shoulder[0] + r_shoulder[0]) / 2
+    neck_base_y = (l_shoulder[1] + r_shoulder[1]) / 2
+    neck_top_y = max((nose[1] + neck_base_y) / 2, nose[1] + (neck_base_y - nose[1]) * 0.2)
+    neck_width = abs(l_shoulder[0] - r_shoulder[0]) * 0.4
+    draw.rectangle([neck_base_x - neck_width / 2, neck_top_y, neck_base_x + neck_width / 2, neck_base_y + 10], fill=255)
+
+    pose_mask = pose_mask.filter(ImageFilter.MaxFilter(25))
+    return pose_mask.filter(ImageFilter.GaussianBlur(radius=7))
+
+
+def time_it(fn, repeat):
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PIL vs NumPy/OpenCV mask construction")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per implementation (median is reported)")
+    parser.add_argument("--tolerance", type=int, default=8, help="Max per-pixel difference (0-255) allowed")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    masker = UpperBodyMask(MaskModels(), trim_with_silhouette=False)
+    report = []
+    ok = True
+
+    for height, width in RESOLUTIONS:
+        keypoints = synthetic_keypoints(height, width)
+        image = Image.new("RGB", (width, height))
+
+        reference, pil_ms = time_it(lambda: pil_reference_mask(keypoints, height, width), args.repeat)
+        mask, numpy_ms = time_it(lambda: masker(image, keypoints=keypoints)[0], args.repeat)
+
+        diff = np.abs(np.asarray(reference, dtype=np.int16) - np.asarray(mask, dtype=np.int16))
+        within = int(diff.max()) <= args.tolerance
+        ok = ok and within
+        report.append({
+            "resolution": f"{height}x{width}",
+            "pil_ms": round(pil_ms, 2),
+            "numpy_ms": round(numpy_ms, 2),
+            "speedup": round(pil_ms / numpy_ms, 1) if numpy_ms else None,
+            "max_abs_diff": int(diff.max()),
+            "mean_abs_diff": round(float(diff.mean()), 4),
+            "within_tolerance": within,
+        })
+
+    output = json.dumps({"tolerance": args.tolerance, "results": report}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
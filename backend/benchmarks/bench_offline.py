@@ -0,0 +1,300 @@
+# Offline Try-On Benchmark
+# Reproducible latency, throughput and memory numbers for the try-on path, with no
+# network access or model downloads: synthetic (or given) person and garment images
+# through the offline engine in benchmarks/offline_engine.py (tiny random VAE/UNet,
+# keypoints and silhouette from the synthetic person). Scenarios:
+#   masking     mask stages for the try-on type, bypassing the mask cache
+#   preprocess  decode and alignment of the person photo and the garment
+#   inference   VAE encode, denoising loop and decode (loop overhead, the UNet is tiny)
+#   encode      result image and thumbnail encoding (TRYON_OUTPUT_FORMAT)
+#   tryon       one whole engine call (run_virtual_tryon)
+#   http        POST /api/tryon/process through the ASGI app, with the garment on a
+#               local image server, in-memory collections and local storage
+# Each scenario runs --requests calls at every --concurrency and reports p50/p95/p99
+# latency, throughput and peak RSS as JSON, tagged with the git commit. --compare
+# adds the change against an earlier report.
+#
+# Usage:
+#   python benchmarks/bench_offline.py
+#   python benchmarks/bench_offline.py --scenarios masking inference --concurrency 1 4 --requests 50 --output bench.json
+#   python benchmarks/bench_offline.py --scenarios http --profile fast --compare bench_main.json
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+# Deterministic engine settings, and nothing that leaves the machine
+os.environ.setdefault("TRYON_MEMORY_MODE", "full")
+os.environ.setdefault("TRYON_ENGINE_MODE", "disabled")  # the benchmark installs the offline engine itself
+os.environ["TRYON_RESULT_CACHE"] = "false"  # every request runs the pipeline
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["LOCAL_STORAGE_DIR"] = tempfile.mkdtemp(prefix="tryon-bench-storage-")
+os.environ["DATABASE_BACKEND"] = "memory"
+
+import torch
+
+from catvton_tryon import load_image
+from masking import normalize_tryon_type
+from memory_budget import PeakMemoryMonitor
+from offline_engine import create_offline_processor, synthetic_pair
+from result_encoding import encode_result
+
+SCENARIOS = ("masking", "preprocess", "inference", "encode", "tryon", "http")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))]
+
+
+def summarize(latencies_ms, seconds, monitor, concurrency, errors=0):
+    memory = monitor.result()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies_ms) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies_ms, 50), 2) if latencies_ms else None,
+        "p95_ms": round(percentile(latencies_ms, 95), 2) if latencies_ms else None,
+        "p99_ms": round(percentile(latencies_ms, 99), 2) if latencies_ms else None,
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else None,
+        "throughput_per_s": round(len(latencies_ms) / seconds, 2),
+        "peak_rss_mb": memory["peak_rss_mb"],
+        "rss_growth_mb": round(memory["peak_rss_mb"] - memory["start_rss_mb"], 1),
+    }
+
+
+def run_threaded(call, requests, concurrency):
+    """Time `requests` calls of `call` from `concurrency` threads, after one warm-up call per thread."""
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        return (time.perf_counter() - start) * 1000.0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: call(), range(concurrency)))
+        with PeakMemoryMonitor() as monitor:
+            start = time.perf_counter()
+            latencies = list(executor.map(timed, range(requests)))
+            seconds = time.perf_counter() - start
+    return summarize(latencies, seconds, monitor, concurrency)
+
+
+def engine_scenarios(processor, person, garment, args):
+    """Blocking callables for the in-process scenarios."""
+    height, width = args.height, args.width
+    aligned = processor._align_person(person, height, width)
+    masker = processor.maskers[normalize_tryon_type(args.tryon_type)]
+    mask_tensor = processor._mask_person(aligned, args.tryon_type)
+    garment_latent = processor.prepare_garment(garment, height, width)["latent"]
+
+    def infer():
+        return processor.sampler(
+            aligned.tensor,
+            mask_tensor,
+            garment_latent,
+            num_inference_steps=args.steps,
+            generator=torch.Generator(device=str(processor.device)).manual_seed(555),
+        )[0]
+
+    result_image = infer()
+
+    def tryon():
+        if processor.run_virtual_tryon(
+            person, garment, num_inference_steps=args.steps, height=height, width=width, tryon_type=args.tryon_type
+        ) is None:
+            raise RuntimeError("run_virtual_tryon failed")
+
+    return {
+        "masking": lambda: masker(aligned.image),
+        "preprocess": lambda: (
+            processor._align_person(person, height, width),
+            processor.vae_processor.preprocess(load_image(garment), height, width),
+        ),
+        "inference": infer,
+        "encode": lambda: encode_result(result_image),
+        "tryon": tryon,
+    }
+
+
+async def run_http(person, garment, args):
+    """POST /api/tryon/process through the ASGI app at each concurrency level."""
+    import httpx
+    from bson import ObjectId
+
+    import main
+    from auth import get_current_user
+    from http_client import get_image_fetcher
+    from local_image_server import LocalImageServer
+    from model_manager import ModelManager
+    from storage import get_storage
+
+    garment_dir = tempfile.mkdtemp(prefix="tryon-bench-garments-")
+    with open(os.path.join(garment_dir, "garment.jpg"), "wb") as f:
+        f.write(garment)
+
+    manager = ModelManager(create_offline_processor, mode="eager")
+    manager.start()
+    main.MODEL_MANAGER = manager
+
+    user = {"_id": ObjectId(), "email": "bench@example.com", "full_name": "Benchmark", "hq_rendering": False}
+    main.app.dependency_overrides[get_current_user] = lambda: user
+
+    results = []
+    with LocalImageServer(directory=garment_dir) as image_server:
+        product = {
+            "name": "Benchmark garment",
+            "category": "Upper Body",
+            "tryon_type": args.tryon_type,
+            "image_url": image_server.url_for("garment.jpg"),
+            "is_active": True,
+        }
+        product_id = (await main.products_collection.insert_one(product)).inserted_id
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+                async def post():
+                    start = time.perf_counter()
+                    response = await http.post(
+                        "/api/tryon/process",
+                        files={"user_image": ("person.jpg", person, "image/jpeg")},
+                        data={"product_id": str(product_id), "profile": args.profile},
+                    )
+                    return (time.perf_counter() - start) * 1000.0, response.status_code == 200
+
+                for concurrency in args.concurrency:
+                    semaphore = asyncio.Semaphore(concurrency)
+
+                    async def limited():
+                        async with semaphore:
+                            return await post()
+
+                    await asyncio.gather(*[post() for _ in range(concurrency)])
+                    with PeakMemoryMonitor() as monitor:
+                        start = time.perf_counter()
+                        outcomes = await asyncio.gather(*[limited() for _ in range(args.requests)])
+                        seconds = time.perf_counter() - start
+                    latencies = [ms for ms, ok in outcomes if ok]
+                    results.append(summarize(latencies, seconds, monitor, concurrency, len(outcomes) - len(latencies)))
+        finally:
+            main.app.dependency_overrides.pop(get_current_user, None)
+            await get_image_fetcher().aclose()
+            await get_storage().drain()
+            manager.shutdown()
+            shutil.rmtree(garment_dir, ignore_errors=True)
+    return {"profile": args.profile, "runs": results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Ratios against an earlier report, per scenario and concurrency (new / old)."""
+    def runs(data):
+        return {
+            (name, run["concurrency"]): run
+            for name, scenario in data["scenarios"].items()
+            for run in scenario.get("runs", [])
+        }
+
+    old_runs = runs(baseline)
+    comparison = []
+    for key, new in runs(report).items():
+        old = old_runs.get(key)
+        if old is None:
+            continue
+        row = {"scenario": key[0], "concurrency": key[1]}
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_per_s", "peak_rss_mb"):
+            if new.get(metric) and old.get(metric):
+                row[metric] = round(new[metric] / old[metric], 3)
+        comparison.append(row)
+    return {"baseline_commit": baseline.get("commit"), "ratios": comparison}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline try-on benchmark (synthetic images, tiny pipeline)")
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4])
+    parser.add_argument("--requests", type=int, default=20, help="Timed calls per scenario and concurrency")
+    parser.add_argument("--steps", type=int, default=10, help="Denoising steps for the engine scenarios")
+    parser.add_argument("--profile", default="preview", help="Inference profile for the http scenario")
+    parser.add_argument("--tryon-type", default="Upper body")
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--width", type=int, default=576)
+    parser.add_argument("--person", help="Person image (default: synthetic)")
+    parser.add_argument("--garment", help="Garment image (default: synthetic)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    person, garment = synthetic_pair(args.height, args.width)
+    if args.person:
+        with open(args.person, "rb") as f:
+            person = f.read()
+    if args.garment:
+        with open(args.garment, "rb") as f:
+            garment = f.read()
+
+    scenarios = {}
+    engine_names = [name for name in args.scenarios if name != "http"]
+    if engine_names:
+        processor = create_offline_processor()
+        calls = engine_scenarios(processor, person, garment, args)
+        for name in engine_names:
+            print(f"Running {name}...", file=sys.stderr)
+            scenarios[name] = {
+                "runs": [run_threaded(calls[name], args.requests, concurrency) for concurrency in args.concurrency]
+            }
+        processor.shutdown()
+    if "http" in args.scenarios:
+        print("Running http...", file=sys.stderr)
+        scenarios["http"] = asyncio.run(run_http(person, garment, args))
+
+    report = {
+        "commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpus": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "settings": {
+            "requests": args.requests,
+            "steps": args.steps,
+            "resolution": f"{args.height}x{args.width}",
+            "tryon_type": args.tryon_type,
+            "synthetic_images": not (args.person or args.garment),
+        },
+        "scenarios": scenarios,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    shutil.rmtree(os.environ["LOCAL_STORAGE_DIR"], ignore_errors=True)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Output Encoding Benchmark
+# Encodes try-on results in every output format and quality and reports encode time,
+# size and PSNR against the lossless image, plus the thumbnail, so
+# TRYON_OUTPUT_FORMAT / TRYON_OUTPUT_QUALITY can be chosen with numbers.
+#
+# Usage:
+#   python benchmarks/bench_output_encoding.py --images result1.png result2.png
+#   python benchmarks/bench_output_encoding.py --images results/*.png --qualities 75 85 90 --repeat 5 --output encoding.json
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from PIL import Image
+
+from result_encoding import OUTPUT_FORMATS, TRYON_THUMBNAIL_QUALITY, encode_image, make_thumbnail
+
+
+def psnr(reference, data):
+    """PSNR in dB, or None if the decoded image is identical (lossless)."""
+    decoded = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"), dtype=np.float64)
+    mse = np.mean((reference - decoded) ** 2)
+    return None if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def timed_encode(image, output_format, quality, repeat):
+    timings, encoded = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = encode_image(image, output_format, quality)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return encoded, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Size, speed and fidelity of each result output format")
+    parser.add_argument("--images", nargs="+", required=True, help="Try-on results (ideally lossless PNGs)")
+    parser.add_argument("--qualities", nargs="*", type=int, default=[75, 85, 90, 95])
+    parser.add_argument("--repeat", type=int, default=3, help="Encodes per setting (median time is reported)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    settings = [("png", None)] + [(fmt, q) for fmt in OUTPUT_FORMATS if fmt != "png" for q in args.qualities]
+    rows = {setting: [] for setting in settings}
+    thumbnails = {fmt: [] for fmt in OUTPUT_FORMATS}
+
+    for path in args.images:
+        image = Image.open(path).convert("RGB")
+        reference = np.asarray(image, dtype=np.float64)
+        for output_format, quality in settings:
+            encoded, ms = timed_encode(image, output_format, quality or 0, args.repeat)
+            rows[(output_format, quality)].append({
+                "encode_ms": ms,
+                "kb": len(encoded.data) / 1024,
+                "psnr": psnr(reference, encoded.data),
+            })
+        thumbnail = make_thumbnail(image)
+        for output_format in OUTPUT_FORMATS:
+            encoded, ms = timed_encode(thumbnail, output_format, TRYON_THUMBNAIL_QUALITY, args.repeat)
+            thumbnails[output_format].append({"encode_ms": ms, "kb": len(encoded.data) / 1024})
+
+    report = []
+    for (output_format, quality), results in rows.items():
+        psnrs = [r["psnr"] for r in results if r["psnr"] is not None]
+        report.append({
+            "format": output_format,
+            "quality": quality,
+            "median_encode_ms": round(statistics.median(r["encode_ms"] for r in results), 2),
+            "mean_kb": round(statistics.mean(r["kb"] for r in results), 1),
+            "min_psnr": round(min(psnrs), 2) if psnrs else None,  # None = lossless
+        })
+
+    output = json.dumps({
+        "images": len(args.images),
+        "results": report,
+        "thumbnails": {
+            fmt: {
+                "median_encode_ms": round(statistics.median(r["encode_ms"] for r in results), 2),
+                "mean_kb": round(statistics.mean(r["kb"] for r in results), 1),
+            }
+            for fmt, results in thumbnails.items()
+        },
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Password Hashing Benchmark
+# Login-style bcrypt verification under concurrent load, the way the handlers used to
+# do it (pwd_context.verify inline on the event loop) against the auth thread pool
+# (password_hashing.PasswordHasher). Each mode runs --requests verifications from
+# every --concurrency closed-loop clients and reports throughput, p50/p95/p99 latency
+# and the event-loop lag seen by a 10 ms ticker, i.e. how long every other request on
+# the loop would have been stalled. For whole-API numbers run
+# `python benchmarks/bench_load.py --scenarios login` on both commits.
+#
+# Usage:
+#   python benchmarks/bench_password_hashing.py
+#   python benchmarks/bench_password_hashing.py --rounds 12 --workers 4 --concurrency 1 4 16 --requests 64 --output hashing.json
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+TICK_SECONDS = 0.01
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))]
+
+
+async def run_level(verify, requests, concurrency):
+    """`concurrency` clients sharing `requests` verifications, with a ticker measuring loop lag."""
+    latencies, lags = [], []
+    remaining = [requests]
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append((time.perf_counter() - start - TICK_SECONDS) * 1000.0)
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            if not await verify():
+                raise RuntimeError("Password verification failed")
+            latencies.append((time.perf_counter() - start) * 1000.0)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    done.set()
+    await tick
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_per_s": round(len(latencies) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "loop_lag_max_ms": round(max(lags), 2) if lags else None,
+        "loop_lag_p99_ms": round(percentile(lags, 99), 2) if lags else None,
+    }
+
+
+async def run(args):
+    from password_hashing import PasswordHasher, pwd_context
+
+    password = "benchmark-password"
+    hashed = pwd_context.hash(password)
+    hasher = PasswordHasher(max_workers=args.workers)
+
+    async def inline():
+        return pwd_context.verify(password, hashed)
+
+    async def pooled():
+        valid, _ = await hasher.verify_and_update(password, hashed)
+        return valid
+
+    modes = {}
+    try:
+        for name, verify in (("inline", inline), ("pool", pooled)):
+            await verify()
+            modes[name] = []
+            for concurrency in args.concurrency:
+                print(f"{name}: {concurrency} clients...", file=sys.stderr)
+                modes[name].append(await run_level(verify, args.requests, concurrency))
+    finally:
+        hasher.shutdown()
+
+    speedup = [
+        {
+            "concurrency": before["concurrency"],
+            "throughput": round(after["throughput_per_s"] / before["throughput_per_s"], 2),
+        }
+        for before, after in zip(modes["inline"], modes["pool"])
+    ]
+    return modes, speedup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bcrypt verification on the event loop vs the auth thread pool")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost (BCRYPT_ROUNDS)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Auth pool size (AUTH_MAX_WORKERS)")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Verifications per mode and concurrency")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Read by password_hashing at import
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    modes, speedup = asyncio.run(run(args))
+
+    output = json.dumps({
+        "settings": {"rounds": args.rounds, "workers": args.workers, "requests": args.requests, "cpus": os.cpu_count()},
+        "modes": modes,
+        "pool_vs_inline": speedup,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Inference Profile Benchmark
+# Runs every inference profile on the same person/garment pair and reports latency
+# and image similarity (SSIM, PSNR) against a 50-step DDIM baseline at the same
+# resolution.
+#
+# Usage:
+#   python benchmarks/bench_profiles.py --person person.jpg --garment shirt.png
+#   python benchmarks/bench_profiles.py --person p.jpg --garment g.png --profiles preview fast --repeat 3 --output profiles.json
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+# Compare lossless outputs, so encoding artifacts don't count against a profile
+os.environ["TRYON_OUTPUT_FORMAT"] = "png"
+
+import numpy as np
+from PIL import Image
+from skimage.metrics import peak_signal_noise_ratio, structural_similarity
+
+from inference_profiles import INFERENCE_PROFILES
+
+BASELINE_STEPS = 50
+BASELINE_SCHEDULER = "ddim"
+
+
+def to_array(result):
+    return np.asarray(Image.open(io.BytesIO(result.image.data)).convert("RGB"))
+
+
+def run(processor, person, garment, steps, scheduler, guidance, height, width):
+    start = time.perf_counter()
+    result = processor.run_virtual_tryon(
+        person,
+        garment,
+        num_inference_steps=steps,
+        guidance_scale=guidance,
+        height=height,
+        width=width,
+        scheduler=scheduler,
+    )
+    elapsed = time.perf_counter() - start
+    if result is None:
+        raise RuntimeError(f"Try-on failed ({steps} steps, {scheduler}, {height}x{width})")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference profiles against the 50-step baseline")
+    parser.add_argument("--person", required=True)
+    parser.add_argument("--garment", required=True)
+    parser.add_argument("--profiles", nargs="*", default=list(INFERENCE_PROFILES))
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per profile (median is reported)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    from catvton_tryon import CatVTONProcessor
+    processor = CatVTONProcessor()
+
+    with open(args.person, "rb") as f:
+        person = f.read()
+    with open(args.garment, "rb") as f:
+        garment = f.read()
+
+    baselines = {}
+    report = []
+    for name in args.profiles:
+        profile = INFERENCE_PROFILES[name]
+        resolution = (profile.height, profile.width)
+
+        # Mask is cached after the first run, so every timed run below sees the same work
+        if resolution not in baselines:
+            print(f"Baseline {BASELINE_STEPS}-step {BASELINE_SCHEDULER} at {profile.height}x{profile.width}...")
+            baseline, baseline_seconds = run(
+                processor, person, garment, BASELINE_STEPS, BASELINE_SCHEDULER,
+                profile.guidance_scale, profile.height, profile.width
+            )
+            baselines[resolution] = (to_array(baseline), baseline_seconds)
+
+        timings = []
+        for _ in range(max(1, args.repeat)):
+            result, seconds = run(
+                processor, person, garment, profile.num_inference_steps, profile.scheduler,
+                profile.guidance_scale, profile.height, profile.width
+            )
+            timings.append(seconds)
+
+        baseline_array, baseline_seconds = baselines[resolution]
+        result_array = to_array(result)
+        entry = {
+            **profile._asdict(),
+            "latency_s": float(np.median(timings)),
+            "baseline_latency_s": baseline_seconds,
+            "speedup": baseline_seconds / float(np.median(timings)),
+            "ssim": float(structural_similarity(baseline_array, result_array, channel_axis=2)),
+            "psnr": float(peak_signal_noise_ratio(baseline_array, result_array)),
+        }
+        report.append(entry)
+        print(f"{name:>10}: {entry['latency_s']:.2f}s ({entry['speedup']:.1f}x)  SSIM {entry['ssim']:.3f}  PSNR {entry['psnr']:.1f}dB")
+
+    output = json.dumps({"device": str(processor.device), "profiles": report}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
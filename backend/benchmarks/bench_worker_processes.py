@@ -0,0 +1,82 @@
+# Worker Process Scaling Benchmark
+# Runs the same batch of try-ons through 1, 2, 4... forked inference worker processes
+# and reports throughput next to memory: the RSS of one worker (what each process
+# appears to use) and the PSS summed over all workers (what they actually use
+# together, with the shared weights counted once).
+#
+# Usage:
+#   python benchmarks/bench_worker_processes.py --person person.jpg --garment shirt.png
+#   python benchmarks/bench_worker_processes.py --person p.jpg --garment g.png --processes 1 2 4 --requests 16 --steps 10 --output procs.json
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from inference_processes import ForkedProcessorPool
+
+
+def run_batch(pool, person, garment, requests, concurrency, run_kwargs):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda _: pool.run_virtual_tryon(person, garment, **run_kwargs), range(requests)
+        ))
+    return time.perf_counter() - start, sum(result is not None for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory for each worker process count")
+    parser.add_argument("--person", required=True)
+    parser.add_argument("--garment", required=True)
+    parser.add_argument("--processes", nargs="*", type=int, default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=8, help="Try-ons per process count")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--width", type=int, default=576)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    with open(args.person, "rb") as f:
+        person = f.read()
+    with open(args.garment, "rb") as f:
+        garment = f.read()
+    run_kwargs = dict(num_inference_steps=args.steps, height=args.height, width=args.width)
+
+    report = []
+    for processes in args.processes:
+        print(f"Starting {processes} worker processes...", file=sys.stderr)
+        pool = ForkedProcessorPool(processes)
+        try:
+            # One warm-up run per worker, so first-call costs stay out of the timing
+            run_batch(pool, person, garment, processes, processes, {**run_kwargs, "num_inference_steps": 2})
+            seconds, ok = run_batch(pool, person, garment, args.requests, processes, run_kwargs)
+            workers = pool.stats()["processes"]
+        finally:
+            pool.shutdown()
+
+        memory = [w["memory"]["process"] for w in workers if w["memory"].get("process")]
+        report.append({
+            "processes": processes,
+            "requests": args.requests,
+            "ok": ok,
+            "seconds": round(seconds, 2),
+            "throughput_per_min": round(args.requests / seconds * 60, 2),
+            "worker_rss_mb": max((m["rss_mb"] for m in memory), default=None),
+            "total_pss_mb": round(sum(m["pss_mb"] for m in memory), 1) if memory else None,
+            "total_private_mb": round(sum(m["private_mb"] for m in memory), 1) if memory else None,
+        })
+
+    output = json.dumps({"steps": args.steps, "resolution": f"{args.height}x{args.width}", "runs": report}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
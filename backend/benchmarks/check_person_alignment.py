@@ -0,0 +1,158 @@
+# Person Alignment Regression Check
+# Prepares each person photo both ways: the old chain (VaeImageProcessor preprocess,
+# postprocess back to PIL, mask, then the binarizing mask processor) and the single
+# alignment stage in person_alignment.py. Person tensors, masks and mask tensors must
+# be identical; with --garment the try-on is also rendered from both and the output
+# pixels compared. Exits with status 1 on any mismatch.
+# --synthetic N skips the model and the photos: it compares align_person's tensor and
+# mask_to_tensor against the two VaeImageProcessors on N random images and masks (odd
+# sizes, already-aligned sizes, mask values around the 128 threshold), so it can run
+# in CI.
+#
+# Usage:
+#   python benchmarks/check_person_alignment.py --synthetic 16
+#   python benchmarks/check_person_alignment.py --images person1.jpg person2.jpg
+#   python benchmarks/check_person_alignment.py --images p.jpg --garment shirt.png --tryon-types "Upper body" "Full body" --steps 10 --output alignment.json
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import torch
+from diffusers.image_processor import VaeImageProcessor
+from PIL import Image
+
+from masking import MASK_GENERATORS, DEFAULT_TRYON_TYPE, normalize_tryon_type
+from person_alignment import align_person, mask_to_tensor
+
+vae_processor = VaeImageProcessor(vae_scale_factor=8)
+mask_processor = VaeImageProcessor(
+    vae_scale_factor=8,
+    do_normalize=False,
+    do_binarize=True,
+    do_convert_grayscale=True
+)
+
+
+def old_prepare(processor, person_image, height, width, tryon_type):
+    """Person preparation as it was before the alignment stage."""
+    person_tensor = vae_processor.preprocess(person_image, height, width)[0].unsqueeze(0)
+    aligned_person_pil = vae_processor.postprocess(person_tensor, output_type="pil")[0]
+    img = aligned_person_pil.resize((width, height), Image.Resampling.LANCZOS)
+    mask, _ = processor.maskers[normalize_tryon_type(tryon_type)](img)
+    mask_tensor = mask_processor.preprocess(Image.fromarray(mask), height, width)[0].unsqueeze(0)
+    return person_tensor, mask, mask_tensor
+
+
+def synthetic_cases(count, height, width, seed=0):
+    """Random person images at varied sizes and random masks at the model resolution."""
+    rng = np.random.default_rng(seed)
+    sizes = [(width, height), (width * 2, height * 2), (width // 2 + 1, height // 2 + 3)]
+    for i in range(count):
+        size = sizes[i] if i < len(sizes) else (int(rng.integers(32, 2 * width)), int(rng.integers(32, 2 * height)))
+        pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        # Values either side of the binarize threshold plus blurred-edge values
+        mask = rng.choice(np.array([0, 1, 126, 127, 128, 129, 254, 255], dtype=np.uint8), size=(height, width))
+        if i % 2:
+            mask = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+        yield f"synthetic-{i}-{size[0]}x{size[1]}", Image.fromarray(pixels), mask
+
+
+def check_synthetic(count, height, width):
+    report = []
+    for name, person_image, mask in synthetic_cases(count, height, width):
+        old_tensor = vae_processor.preprocess(person_image, height, width)[0].unsqueeze(0)
+        old_mask_tensor = mask_processor.preprocess(Image.fromarray(mask), height, width)[0].unsqueeze(0)
+        report.append({
+            "image": name,
+            "person_tensor_equal": torch.equal(old_tensor, align_person(person_image, height, width).tensor),
+            "mask_tensor_equal": torch.equal(old_mask_tensor, mask_to_tensor(mask)),
+        })
+    return report
+
+
+def render(processor, person_tensor, mask_tensor, garment_latent, steps):
+    masked_latent, mask_latent = processor.sampler.encode_person(person_tensor, mask_tensor)
+    generator = torch.Generator(device=str(processor.device)).manual_seed(555)
+    latents = None
+    for _, _, latents, _ in processor.sampler.iter_denoise(
+        masked_latent,
+        mask_latent,
+        garment_latent.to(processor.device, dtype=processor.weight_dtype),
+        num_inference_steps=steps,
+        generator=generator,
+    ):
+        pass
+    return np.asarray(processor.sampler.decode(processor.sampler.person_half(latents))[0])
+
+
+def check_photos(args):
+    # Loads the full pipeline, so only imported when checking real photos
+    from catvton_tryon import CatVTONProcessor, load_image
+
+    processor = CatVTONProcessor()
+    garment_latent = None
+    if args.garment:
+        with open(args.garment, "rb") as f:
+            garment_latent = processor.prepare_garment(f.read(), args.height, args.width)["latent"]
+
+    report = []
+    for path in args.images:
+        person_image = load_image(path)
+        for tryon_type in args.tryon_types:
+            old_tensor, old_mask, old_mask_tensor = old_prepare(
+                processor, person_image, args.height, args.width, tryon_type
+            )
+            aligned = processor._align_person(path, args.height, args.width)
+            mask = processor._build_mask(aligned, tryon_type)
+            mask_tensor = processor._mask_person(aligned, tryon_type)
+
+            row = {
+                "image": path,
+                "tryon_type": tryon_type,
+                "person_tensor_equal": torch.equal(old_tensor, aligned.tensor),
+                "mask_equal": np.array_equal(old_mask, mask),
+                "mask_tensor_equal": torch.equal(old_mask_tensor, mask_tensor),
+            }
+            if garment_latent is not None:
+                old_output = render(processor, old_tensor, old_mask_tensor, garment_latent, args.steps)
+                new_output = render(processor, aligned.tensor, mask_tensor, garment_latent, args.steps)
+                row["output_equal"] = np.array_equal(old_output, new_output)
+            report.append(row)
+    return report
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the alignment stage against the old person preparation")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--images", nargs="+", help="Person photos")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Check N random images and masks, without loading the model")
+    parser.add_argument("--garment", help="Also render try-ons with this garment and compare the outputs")
+    parser.add_argument("--tryon-types", nargs="*", choices=list(MASK_GENERATORS), default=[DEFAULT_TRYON_TYPE])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--width", type=int, default=576)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        report = check_synthetic(args.synthetic, args.height, args.width)
+    else:
+        report = check_photos(args)
+    ok = all(value for row in report for key, value in row.items() if key.endswith("_equal"))
+
+    output = json.dumps({"resolution": f"{args.height}x{args.width}", "identical": ok, "results": report}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Offline Try-On Engine
+# A CatVTONProcessor that runs without network access or model downloads, for
+# benchmarks: a randomly initialised tiny VAE/UNet with the real pipeline's shapes
+# and interfaces in place of the CatVTON weights, and pose/segmentation answered
+# from the known geometry of the synthetic person (model_manager.warmup_inputs)
+# instead of YOLO/rembg. Everything between the models (decode, alignment, mask
+# stages, the denoising loop, encoding) is the production code.
+
+import io
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import torch
+from diffusers import AutoencoderKL, DDIMScheduler, UNet2DConditionModel
+
+from masking import MaskModels
+from model_manager import warmup_inputs
+
+# Joints of the synthetic person, as fractions of (width, height), COCO order
+SYNTHETIC_KEYPOINTS = np.array([
+    (0.50, 0.12),                # nose
+    (0.47, 0.10), (0.53, 0.10),  # eyes
+    (0.42, 0.12), (0.58, 0.12),  # ears
+    (0.68, 0.22), (0.32, 0.22),  # shoulders (person's left is image right)
+    (0.70, 0.40), (0.30, 0.40),  # elbows
+    (0.70, 0.58), (0.30, 0.58),  # wrists
+    (0.62, 0.58), (0.38, 0.58),  # hips
+    (0.60, 0.77), (0.40, 0.77),  # knees
+    (0.60, 0.93), (0.40, 0.93),  # ankles
+], dtype=np.float32)
+
+BACKGROUND = (200, 200, 200)  # warmup_inputs person background
+
+
+def synthetic_pair(height=768, width=576, image_format="JPEG"):
+    """Synthetic (person, garment) images, encoded like uploads."""
+    encoded = []
+    for image in warmup_inputs(height, width):
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, quality=95)
+        encoded.append(buffer.getvalue())
+    return tuple(encoded)
+
+
+class SyntheticMaskModels(MaskModels):
+    """Pose keypoints and silhouette of the synthetic person, without running any model."""
+
+    backend = "synthetic"
+
+    def __init__(self):
+        super().__init__(pose_model=None, rembg_model="synthetic")
+
+    def detect_keypoints(self, image):
+        width, height = image.size
+        return SYNTHETIC_KEYPOINTS * np.array([width, height], dtype=np.float32)
+
+    def segment(self, image):
+        pixels = np.asarray(image, dtype=np.int16)
+        # Everything that is not (close to) the flat background is the person
+        distance = np.abs(pixels - np.array(BACKGROUND, dtype=np.int16)).sum(axis=2)
+        return np.where(distance > 24, 255, 0).astype(np.uint8)
+
+
+class TinyCatVTONPipeline:
+    """
+    Stand-in for CatVTONPipeline with the attributes the sampler uses: an 8x VAE with
+    4 latent channels and a 9-channel inpainting UNet, randomly initialised and only a
+    few hundred KB, so a step costs milliseconds and the loop's own overhead shows.
+    """
+
+    def __init__(self, device="cpu", weight_dtype=torch.float32, seed=0):
+        torch.manual_seed(seed)
+        self.device = device
+        self.weight_dtype = weight_dtype
+        self.vae = AutoencoderKL(
+            in_channels=3,
+            out_channels=3,
+            down_block_types=("DownEncoderBlock2D",) * 4,
+            up_block_types=("UpDecoderBlock2D",) * 4,
+            block_out_channels=(8, 8, 8, 8),
+            layers_per_block=1,
+            latent_channels=4,
+            norm_num_groups=4,
+        ).to(device, dtype=weight_dtype).eval()
+        self.unet = UNet2DConditionModel(
+            in_channels=9,
+            out_channels=4,
+            down_block_types=("DownBlock2D", "DownBlock2D"),
+            up_block_types=("UpBlock2D", "UpBlock2D"),
+            mid_block_type=None,
+            block_out_channels=(16, 32),
+            layers_per_block=1,
+            norm_num_groups=8,
+            cross_attention_dim=8,
+        ).to(device, dtype=weight_dtype).eval()
+        self.noise_scheduler = DDIMScheduler()
+
+
+def create_offline_processor():
+    """CatVTONProcessor on the tiny pipeline and synthetic mask models (CPU, float32)."""
+    from catvton_tryon import CatVTONProcessor
+    return CatVTONProcessor(pipeline=TinyCatVTONPipeline(), mask_models=SyntheticMaskModels())
@@ -0,0 +1,261 @@
+# CatVTON Sampler
+# Stage-by-stage version of CatVTONPipeline.__call__, built from the pipeline's own
+# VAE / UNet / scheduler. Splitting encode, denoise and decode lets the backend reuse
+# encoded latents between requests instead of re-running the VAE every time.
+
+import contextlib
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import deque
+sys.path.append(os.path.join(os.path.dirname(__file__), 'CatVTON'))
+
+import torch
+import diffusers
+from diffusers.utils.torch_utils import randn_tensor
+from inference_profiles import SCHEDULERS
+from utils import compute_vae_encodings, numpy_to_pil, prepare_image, prepare_mask_image
+
+
+class StepTimings:
+    """Rolling per-step denoising times, grouped by latent shape (batch, height, width)."""
+
+    def __init__(self, window=200):
+        self._steps = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, shape, seconds):
+        with self._lock:
+            self._steps.setdefault(shape, deque(maxlen=self._window)).append(seconds)
+
+    def summary(self):
+        with self._lock:
+            report = {}
+            for (batch, height, width), times in self._steps.items():
+                ordered = sorted(times)
+                report[f"{batch}x{height}x{width}"] = {
+                    "steps": len(ordered),
+                    "mean_ms": round(sum(ordered) / len(ordered) * 1000.0, 1),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000.0, 1),
+                    "max_ms": round(ordered[-1] * 1000.0, 1),
+                }
+            return report
+
+
+class CatVTONSampler:
+    # CatVTON concatenates person and garment along the height (y) axis
+    CONCAT_DIM = -2
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        # Set by cpu_execution.configure_cpu_execution
+        self.autocast_dtype = None  # e.g. torch.bfloat16
+        self.channels_last = False
+        self.unet_forward = None  # compiled/traced UNet, used instead of pipeline.unet
+        # Set by memory_budget.apply_memory_plan in offload mode
+        self.offloader = None
+        self.step_timings = StepTimings()
+
+    @property
+    def vae(self):
+        return self.pipeline.vae
+
+    @property
+    def unet(self):
+        return self.pipeline.unet
+
+    def make_scheduler(self, name="ddim"):
+        """
+        Fresh scheduler instance built from the pipeline's scheduler config.
+
+        Schedulers keep per-run state (timesteps, solver history), so every
+        denoising run gets its own instance; this also keeps concurrent runs
+        on different worker threads from interfering.
+        """
+        if name not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler '{name}', expected one of {list(SCHEDULERS)}")
+        scheduler_class = getattr(diffusers, SCHEDULERS[name])
+        return scheduler_class.from_config(self.pipeline.noise_scheduler.config)
+
+    @property
+    def device(self):
+        return torch.device(self.pipeline.device)
+
+    @property
+    def dtype(self):
+        return self.pipeline.weight_dtype
+
+    def _use(self, module):
+        """Context in which `module` is on the device (moves it there and back in offload mode)."""
+        if self.offloader is None:
+            return contextlib.nullcontext(module)
+        return self.offloader.use(module)
+
+    def _autocast(self):
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype)
+
+    @torch.no_grad()
+    def encode_garment(self, cloth_tensor):
+        """VAE-encode preprocessed garment images [B, 3, H, W] into condition latents."""
+        cloth = prepare_image(cloth_tensor).to(self.device, dtype=self.dtype)
+        with self._use(self.vae), self._autocast():
+            return compute_vae_encodings(cloth, self.vae).to(dtype=self.dtype)
+
+    @torch.no_grad()
+    def encode_person(self, person_tensor, mask_tensor):
+        """
+        Mask out the garment region and VAE-encode the person.
+
+        Returns:
+            (masked_latent, mask_latent)
+        """
+        image = prepare_image(person_tensor).to(self.device, dtype=self.dtype)
+        mask = prepare_mask_image(mask_tensor).to(self.device, dtype=self.dtype)
+        masked_image = image * (mask < 0.5)
+        with self._use(self.vae), self._autocast():
+            masked_latent = compute_vae_encodings(masked_image, self.vae).to(dtype=self.dtype)
+        mask_latent = torch.nn.functional.interpolate(mask, size=masked_latent.shape[-2:], mode="nearest")
+        return masked_latent, mask_latent
+
+    def _extra_step_kwargs(self, scheduler, generator, eta):
+        step_params = set(inspect.signature(scheduler.step).parameters.keys())
+        kwargs = {}
+        if "eta" in step_params:
+            kwargs["eta"] = eta
+        if "generator" in step_params:
+            kwargs["generator"] = generator
+        return kwargs
+
+    def person_half(self, latents):
+        """Split off the person half of person+garment latents."""
+        return latents.split(latents.shape[self.CONCAT_DIM] // 2, dim=self.CONCAT_DIM)[0]
+
+    @torch.no_grad()
+    def iter_denoise(
+        self,
+        masked_latent,
+        mask_latent,
+        condition_latent,
+        num_inference_steps=50,
+        guidance_scale=2.5,
+        generator=None,
+        eta=1.0,
+        scheduler="ddim",
+    ):
+        """
+        Run the denoising loop one step at a time.
+
+        Yields:
+            (step_index, total_steps, latents, pred_original) after every step, where
+            `pred_original` is the scheduler's current estimate of the clean latents
+            (None for schedulers that don't expose it). Latents cover person+garment.
+
+        Each step's wall time is recorded in `step_timings`.
+        """
+        noise_scheduler = self.make_scheduler(scheduler)
+        concat_dim = self.CONCAT_DIM
+        masked_latent_concat = torch.cat([masked_latent, condition_latent], dim=concat_dim)
+        mask_latent_concat = torch.cat([mask_latent, torch.zeros_like(mask_latent)], dim=concat_dim)
+
+        latents = randn_tensor(
+            masked_latent_concat.shape,
+            generator=generator,
+            device=masked_latent_concat.device,
+            dtype=self.dtype,
+        )
+
+        noise_scheduler.set_timesteps(num_inference_steps, device=self.device)
+        timesteps = noise_scheduler.timesteps
+        latents = latents * noise_scheduler.init_noise_sigma
+
+        # Classifier-free guidance: unconditional branch sees a zeroed garment
+        do_classifier_free_guidance = guidance_scale > 1.0
+        if do_classifier_free_guidance:
+            masked_latent_concat = torch.cat([
+                torch.cat([masked_latent, torch.zeros_like(condition_latent)], dim=concat_dim),
+                masked_latent_concat,
+            ])
+            mask_latent_concat = torch.cat([mask_latent_concat] * 2)
+
+        extra_step_kwargs = self._extra_step_kwargs(noise_scheduler, generator, eta)
+        unet = self.unet_forward or self.unet
+        timing_shape = tuple(latents.shape[i] for i in (0, 2, 3))
+        step_times = []
+
+        with self._use(self.unet):
+            for i, t in enumerate(timesteps):
+                step_start = time.perf_counter()
+                latent_model_input = torch.cat([latents] * 2) if do_classifier_free_guidance else latents
+                latent_model_input = noise_scheduler.scale_model_input(latent_model_input, t)
+                inpainting_input = torch.cat([latent_model_input, mask_latent_concat, masked_latent_concat], dim=1)
+                if self.channels_last:
+                    inpainting_input = inpainting_input.contiguous(memory_format=torch.channels_last)
+
+                with self._autocast():
+                    noise_pred = unet(
+                        inpainting_input,
+                        t.to(self.device),
+                        encoder_hidden_states=None,
+                        return_dict=False,
+                    )[0]
+                noise_pred = noise_pred.to(dtype=latents.dtype)
+
+                if do_classifier_free_guidance:
+                    noise_pred_uncond, noise_pred_cond = noise_pred.chunk(2)
+                    noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+
+                output = noise_scheduler.step(noise_pred, t, latents, **extra_step_kwargs)
+                latents = output.prev_sample
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+                step_times.append(time.perf_counter() - step_start)
+                self.step_timings.record(timing_shape, step_times[-1])
+                yield i, len(timesteps), latents, getattr(output, "pred_original_sample", None)
+
+        if step_times:
+            print(f"Denoised {len(step_times)} steps at {timing_shape}: "
+                  f"{sum(step_times) / len(step_times) * 1000.0:.0f} ms/step (first {step_times[0] * 1000.0:.0f} ms)")
+
+    def denoise(self, *args, **kwargs):
+        """Run the denoising loop and return the person half of the final latents."""
+        latents = None
+        for _, _, latents, _ in self.iter_denoise(*args, **kwargs):
+            pass
+        return self.person_half(latents)
+
+    @torch.no_grad()
+    def decode(self, latents):
+        """Decode person latents to a list of PIL images."""
+        latents = 1 / self.vae.config.scaling_factor * latents
+        with self._use(self.vae), self._autocast():
+            image = self.vae.decode(latents.to(self.device, dtype=self.dtype)).sample
+        image = (image / 2 + 0.5).clamp(0, 1)
+        image = image.cpu().permute(0, 2, 3, 1).float().numpy()
+        return numpy_to_pil(image)
+
+    def __call__(
+        self,
+        person_tensor,
+        mask_tensor,
+        condition_latent,
+        num_inference_steps=50,
+        guidance_scale=2.5,
+        generator=None,
+        scheduler="ddim",
+    ):
+        masked_latent, mask_latent = self.encode_person(person_tensor, mask_tensor)
+        latents = self.denoise(
+            masked_latent,
+            mask_latent,
+            condition_latent.to(self.device, dtype=self.dtype),
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            generator=generator,
+            scheduler=scheduler,
+        )
+        return self.decode(latents)
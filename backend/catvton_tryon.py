@@ -5,255 +5,529 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'CatVTON'))
 
 import torch
-import numpy as np
-from PIL import Image, ImageDraw, ImageFilter
+from PIL import Image
 from model.pipeline import CatVTONPipeline
 from diffusers.image_processor import VaeImageProcessor
-import cv2
 import io
-# Intelligent Masking Libraries
-try:
-    from ultralytics import YOLO
-    from rembg import remove
-    HAS_SMART_MASK = True
-except ImportError:
-    print("⚠️ ultralytics or rembg not found. Smart masking disabled.")
-    HAS_SMART_MASK = False
+import asyncio
+import contextlib
+import functools
+from collections import deque
+from inference_batching import MicroBatchScheduler, TRYON_BATCH_MAX_SIZE
+from dotenv import load_dotenv
+from catvton_sampler import CatVTONSampler
+from cpu_execution import configure_cpu_execution
+from memory_budget import select_memory_plan, apply_memory_plan, PeakMemoryMonitor, process_memory_mb, TRYON_MEMORY_BUDGET_MB
+from tryon_jobs import TRYON_WORKERS
+from garment_cache import GarmentCache
+from http_client import get_image_fetcher, is_image_url
+from mask_cache import MaskCache
+from tryon_previews import latent_preview, encode_preview, TRYON_PREVIEW_EVERY
+from result_encoding import encode_result
+from person_alignment import AlignedPerson, align_person, mask_to_tensor
+from tryon_tracing import collect_spans, span
+from masking import create_mask_models, create_mask_generators, normalize_tryon_type, DEFAULT_TRYON_TYPE
+
+load_dotenv()
+
+# Garments denoised together per batch in a rack try-on (1 = one after another)
+TRYON_RACK_BATCH_SIZE = int(os.getenv("TRYON_RACK_BATCH_SIZE", 1))
+
+def load_image(source):
+    """
+    Open an RGB image from a file path, raw bytes, a file-like buffer or a PIL image.
+
+    Bytes are wrapped in a BytesIO (no copy), so uploads can be decoded straight
+    from the request body without touching the disk.
+    """
+    if isinstance(source, Image.Image):
+        return source.convert('RGB')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source).convert('RGB')
+
 
 class CatVTONProcessor:
-    def __init__(self):
-        """Initialize CatVTON pipeline with auto-mask generation"""
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"Loading CatVTON on {self.device}...")
+    def __init__(self, pipeline=None, mask_models=None):
+        """
+        Initialize CatVTON pipeline with auto-mask generation
+
+        `pipeline` and `mask_models` replace the CatVTON weights and the pose/segmentation
+        models, e.g. with the offline stand-ins in benchmarks/offline_engine.py.
+        """
+        if pipeline is None:
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            self.weight_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+            print(f"Loading CatVTON on {self.device}...")
+            
+            # Initialize pipeline
+            pipeline = CatVTONPipeline(
+                attn_ckpt_version="vitonhd",  # or "dresscode"
+                attn_ckpt="zhengchong/CatVTON",  # HuggingFace model
+                base_ckpt="booksforcharlie/stable-diffusion-inpainting",
+                weight_dtype=self.weight_dtype,
+                device=str(self.device),
+                skip_safety_check=True
+            )
+        else:
+            self.device = torch.device(pipeline.device)
+            self.weight_dtype = pipeline.weight_dtype
+        self.pipeline = pipeline
+        # Stage-wise access to the pipeline so encoded latents can be reused
+        self.sampler = CatVTONSampler(self.pipeline)
         
-        # Initialize pipeline
-        self.pipeline = CatVTONPipeline(
-            attn_ckpt_version="vitonhd",  # or "dresscode"
-            attn_ckpt="zhengchong/CatVTON",  # HuggingFace model
-            base_ckpt="booksforcharlie/stable-diffusion-inpainting",
-            weight_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            device=str(self.device),
-            skip_safety_check=True
+        # Peak-memory controls (VAE tiling, chunked attention, offload), sized for the
+        # largest request times the number of requests that can run at once
+        concurrency = max(TRYON_WORKERS, TRYON_BATCH_MAX_SIZE)
+        self.memory_plan, self.memory_estimate_mb = select_memory_plan(
+            self.pipeline, self.device.type, concurrency=concurrency
         )
+        apply_memory_plan(self.pipeline, self.sampler, self.memory_plan, self.device)
+        self.memory_usage = deque(maxlen=100)  # peak RSS (MB) of recent requests
+        print(f"Memory mode: {self.memory_plan.mode} (estimated peak {self.memory_estimate_mb:.0f} MB)")
         
-        # Image processors
+        # CPU tuning (threads, bf16 autocast, channels-last, compiled UNet, attention slicing)
+        self.execution = {"device": str(self.device)}
+        if self.device.type == "cpu":
+            self.execution.update(configure_cpu_execution(self.pipeline, self.sampler))
+        
+        # Preprocessed garment tensors + latents, keyed by product/image/resolution
+        self.garment_cache = GarmentCache()
+        
+        # Garment image processor (the person image goes through person_alignment.py)
         self.vae_processor = VaeImageProcessor(vae_scale_factor=8)
-        self.mask_processor = VaeImageProcessor(
-            vae_scale_factor=8, 
-            do_normalize=False, 
-            do_binarize=True, 
-            do_convert_grayscale=True
-        )
         
-        # Initialize YOLO for Smart Masking
-        self.pose_model = None
-        if HAS_SMART_MASK:
-            try:
-                print("Loading YOLOv8-Pose for smart masking...")
-                self.pose_model = YOLO("yolov8n-pose.pt")
-            except Exception as e:
-                print(f"Failed to load YOLO: {e}")
+        # Masks/keypoints per person photo, so repeat try-ons skip rembg and YOLO
+        self.mask_cache = MaskCache()
+        
+        # Pose + segmentation models for smart masking (ultralytics/rembg or ONNX Runtime, per MASK_BACKEND)
+        self.mask_models = mask_models or create_mask_models()
+        # One mask generator per product try-on type, sharing the models
+        self.maskers = create_mask_generators(self.mask_models)
+        
+        # Micro-batching across concurrent requests (disabled when max batch size is 1)
+        self.batcher = None
+        if TRYON_BATCH_MAX_SIZE > 1:
+            self.batcher = MicroBatchScheduler(self.run_pipeline_batch)
+            print(f"Micro-batching enabled (max batch size {self.batcher.max_batch_size})")
         
         print("CatVTON Models Loaded Successfully!")
+
+    def run_pipeline_batch(self, key, items):
+        """
+        Run one batched CatVTON call.
+
+        Args:
+            key: (height, width, num_inference_steps, guidance_scale, scheduler) shared by the batch
+            items: list of (person_tensor, garment_latent, mask_tensor, seed), each batched as [1, ...]
+
+        Returns:
+            list: one PIL image per item, in order
+        """
+        height, width, num_inference_steps, guidance_scale, scheduler = key
+        person = torch.cat([item[0] for item in items])
+        garment_latent = torch.cat([item[1].to(self.device, dtype=self.weight_dtype) for item in items])
+        mask = torch.cat([item[2] for item in items])
+        # One generator per sample keeps each result identical to an unbatched run
+        generators = [torch.Generator(device=str(self.device)).manual_seed(item[3]) for item in items]
+
+        return self.sampler(
+            person,
+            mask,
+            garment_latent,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            generator=generators if len(generators) > 1 else generators[0],
+            scheduler=scheduler,
+        )
+
+    @contextlib.contextmanager
+    def _measure_memory(self, report=None):
+        """Measure the peak RSS of the block; adds it to `report` (if given) and the rolling stats."""
+        with PeakMemoryMonitor(self.device) as monitor:
+            yield
+        usage = {"memory_mode": self.memory_plan.mode, **monitor.result()}
+        self.memory_usage.append(usage["peak_rss_mb"])
+        print(f"Peak RSS {usage['peak_rss_mb']:.0f} MB ({usage['concurrent']} concurrent, mode {self.memory_plan.mode})")
+        if report is not None:
+            report.update(usage)
+
+    def memory_stats(self):
+        recent = list(self.memory_usage)
+        return {
+            "plan": self.memory_plan._asdict(),
+            "budget_mb": TRYON_MEMORY_BUDGET_MB,
+            "estimated_peak_mb": round(self.memory_estimate_mb, 1),
+            "requests": len(recent),
+            "max_peak_rss_mb": max(recent) if recent else None,
+            "mean_peak_rss_mb": round(sum(recent) / len(recent), 1) if recent else None,
+            "process": process_memory_mb(),
+        }
+
+    def stats(self):
+        """Batching, cache, execution, step timing and memory stats for /admin/tryon/stats."""
+        return {
+            "batching": self.batcher.metrics() if self.batcher else None,
+            "garment_cache": self.garment_cache.stats(),
+            "mask_cache": self.mask_cache.stats(),
+            "execution": self.execution,
+            "step_timings": self.sampler.step_timings.summary(),
+            "memory": self.memory_stats(),
+        }
+
+    def after_fork(self):
+        """Restart the threads a forked worker process does not inherit (see inference_processes.py)."""
+        if self.batcher is not None:
+            self.batcher = MicroBatchScheduler(self.run_pipeline_batch)
+
+    def shutdown(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def garment_cache_key(self, product_id, image_url, height, width):
+        return GarmentCache.make_key(product_id, image_url, height, width, self.weight_dtype)
+
+    def has_garment(self, key):
+        return self.garment_cache.contains(key)
+
+    def invalidate_garment(self, product_id):
+        self.garment_cache.invalidate_product(product_id)
+
+    def prepare_garment(self, garment_image, height, width, cache_key=None):
+        """
+        Preprocess and VAE-encode a garment image, going through the garment cache.
+
+        `garment_image` may be the garment's URL when the caller found it cached
+        (see `has_garment`); it is downloaded here if the entry has been evicted since.
+
+        Returns:
+            dict: {"cloth": [1, 3, H, W] tensor, "latent": [1, 4, H/8, W/8] tensor}
+        """
+        if cache_key:
+            cached = self.garment_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        if garment_image is None:
+            raise ValueError("Garment is not cached and no garment image was given")
+        if is_image_url(garment_image):
+            with span("garment_fetch"):
+                garment_image = get_image_fetcher().fetch_blocking(garment_image)
+
+        with span("decode"):
+            cloth_image = load_image(garment_image)
+        with span("alignment"):
+            cloth_tensor = self.vae_processor.preprocess(cloth_image, height, width)[0].unsqueeze(0)
+        with span("inference"):
+            garment_latent = self.sampler.encode_garment(cloth_tensor)
+        entry = {
+            "cloth": cloth_tensor.to(dtype=self.weight_dtype),
+            "latent": garment_latent,
+        }
+
+        if cache_key:
+            entry = self.garment_cache.put(cache_key, entry)
+        return entry
     
-    def generate_mask(self, person_image, height=768, width=576):
+    def generate_mask(self, person_image, height=768, width=576, tryon_type=DEFAULT_TRYON_TYPE):
         """
-        Generate an intelligent mask for the upper body.
-        Combines Rembg (Silhouette) + YOLOv8-Pose (Structure) for perfect fit.
+        Generate an intelligent mask for the product's try-on type
+        (Upper body, Lower body, Full body, Face; see masking.py).
+
+        `person_image` is an RGB PIL image (resized to height x width if needed) or an
+        AlignedPerson. Returns the mask as an "L" PIL image.
         """
-        # Resize image to target dimensions first
-        img = person_image.resize((width, height), Image.Resampling.LANCZOS)
-        
-        # 1. Get Body Silhouette (Pixel Perfect)
-        try:
-            # Simple rembg call
-            from rembg import remove
-            # Get the alpha matte
-            no_bg = remove(img)
-            silhouette = no_bg.split()[-1] # Alpha channel
-            print("✅ Generated Silhouette with Rembg")
-        except Exception as e:
-            print(f"⚠️ Rembg failed: {e}")
-            silhouette = Image.new("L", (width, height), 0)
+        if not isinstance(person_image, AlignedPerson):
+            person_image = align_person(person_image, height, width)
+        return Image.fromarray(self._build_mask(person_image, tryon_type))
 
-        # 2. Get Geometric Torso Mask (Structure)
-        pose_mask = Image.new("L", (width, height), 0)
-        draw = ImageDraw.Draw(pose_mask)
+    def _build_mask(self, aligned, tryon_type=DEFAULT_TRYON_TYPE):
+        """(H, W) uint8 mask for an aligned person, through the mask cache."""
+        masker = self.maskers[normalize_tryon_type(tryon_type)]
+        height, width = aligned.array.shape[:2]
         
-        has_pose = False
+        # Same photo, resolution and try-on type -> reuse the previous mask
+        mask_key = MaskCache.make_key(aligned.array, height, width, masker.variant)
+        cached = self.mask_cache.get(mask_key)
+        if cached is not None:
+            print("✅ Reusing cached mask")
+            return cached["mask"]
         
-        if self.pose_model:
-            try:
-                results = self.pose_model(img, verbose=False)
-                if results and len(results[0].keypoints) > 0:
-                    keypoints = results[0].keypoints.xy.cpu().numpy()[0]
-                    
-                    # COCO Keypoints: 0=Nose, 5=L_Shoulder, 6=R_Shoulder, 11=L_Hip, 12=R_Hip
-                    if len(keypoints) > 12 and np.all(keypoints[5] > 0) and np.all(keypoints[12] > 0):
-                        
-                        l_shoulder = keypoints[5]
-                        r_shoulder = keypoints[6]
-                        r_hip = keypoints[12]
-                        l_hip = keypoints[11]
-                        
-                        # Define Torso Polygon (Trapezoid)
-                        polygon = [
-                            tuple(l_shoulder), 
-                            tuple(r_shoulder), 
-                            tuple(r_hip), 
-                            tuple(l_hip)
-                        ]
-                        draw.polygon(polygon, fill=255)
-                        
-                        # --- SAFE NECK MASKING ---
-                        # Instead of a fixed ellipse that hits the face, 
-                        # we detect the "Chin/Neck Line" using the Nose (0) and Shoulders.
-                        
-                        neck_base_x = (l_shoulder[0] + r_shoulder[0]) / 2
-                        neck_base_y = (l_shoulder[1] + r_shoulder[1]) / 2
-                        
-                        # If we have a nose, use it as the upper limit
-                        nose = keypoints[0] if keypoints[0][1] > 0 else None
-                        
-                        if nose is not None:
-                            # Neck top is halfway between nose and shoulder line
-                            neck_top_y = (nose[1] + neck_base_y) / 2
-                            # Don't go higher than 80% of the way to the nose
-                            safe_limit = nose[1] + (neck_base_y - nose[1]) * 0.2
-                            if neck_top_y < safe_limit:
-                                neck_top_y = safe_limit
-                        else:
-                            # Fallback if no nose: just go up 30-40 pixels from shoulders (conservative)
-                            neck_top_y = neck_base_y - 40
-
-                        # Draw subtle neck connection
-                        # Rectangle from neck base up to neck_top
-                        neck_width = abs(l_shoulder[0] - r_shoulder[0]) * 0.4
-                        draw.rectangle([
-                            neck_base_x - neck_width/2, 
-                            neck_top_y, 
-                            neck_base_x + neck_width/2, 
-                            neck_base_y + 10 # slightly overlaps torso
-                        ], fill=255)
-
-                        has_pose = True
-                        print("✅ Generated Structural Mask with Pose")
+        # Keypoints/silhouette already computed for this photo by another try-on type
+        inputs_key = MaskCache.make_key(aligned.array, height, width, f"inputs|{self.mask_models.backend}")
+        known_inputs = self.mask_cache.get(inputs_key) or {}
+        
+        mask, inputs = masker(aligned.image, **known_inputs)
+        
+        computed = inputs.computed()
+        if computed.keys() - known_inputs.keys():
+            self.mask_cache.put(inputs_key, {**known_inputs, **computed})
+        self.mask_cache.put(mask_key, {"mask": mask})
+        return mask
+    
+    def _encode_result(self, result_image):
+        # Encoded here, on the inference thread, so the event loop only uploads bytes
+        with span("encode"):
+            return encode_result(result_image)
 
+    def _align_person(self, user_image, height, width):
+        """Load and align the person image once; masking and the pipeline share the result."""
+        with span("decode"):
+            person_image = load_image(user_image)
+        with span("alignment"):
+            return align_person(person_image, height, width)
+
+    def _mask_person(self, aligned, tryon_type=DEFAULT_TRYON_TYPE):
+        return mask_to_tensor(self._build_mask(aligned, tryon_type))
+
+    def _prepare_person(self, user_image, height, width, tryon_type=DEFAULT_TRYON_TYPE):
+        """Load, align and mask the person image. Returns (person_tensor, mask_tensor)."""
+        aligned = self._align_person(user_image, height, width)
+        return aligned.tensor, self._mask_person(aligned, tryon_type)
+
+    def iter_rack_tryon(
+        self,
+        user_image,
+        garments,
+        num_inference_steps=50,
+        guidance_scale=2.5,
+        height=768,
+        width=576,
+        scheduler="ddim",
+        batch_size=TRYON_RACK_BATCH_SIZE,
+        report=None,
+        cancel=None
+    ):
+        """
+        Try several garments on one person photo (blocking generator).
+
+        The person image is aligned once, and masked and VAE-encoded once per
+        try-on type; each garment only pays for its own denoising and decode.
+        Garments of the same type are denoised `batch_size` at a time.
+
+        Args:
+            user_image: path, bytes, buffer or PIL image of the person
+            garments: list of (garment_image, garment_cache_key, tryon_type); the image
+                may be its URL when the garment is cached (see `prepare_garment`)
+
+        Yields:
+            (index, EncodedResult) as each garment finishes (grouped by try-on type, so not
+            necessarily in order); the result is None on failure
+
+        If `report` is a dict, the per-stage spans of the whole rack are added to it.
+        If `cancel` (a threading.Event) is set, the rack stops before its next batch.
+        """
+        with self._measure_memory(), collect_spans(report):
+            print(f"[Rack] Preparing person image for {len(garments)} garments...")
+            aligned = self._align_person(user_image, height, width)
+
+            by_type = {}
+            for index, (_, _, tryon_type) in enumerate(garments):
+                by_type.setdefault(normalize_tryon_type(tryon_type), []).append(index)
+
+            batch_size = max(1, batch_size)
+            for tryon_type, type_indices in by_type.items():
+                if cancel is not None and cancel.is_set():
+                    break
+                try:
+                    mask_tensor = self._mask_person(aligned, tryon_type)
+                    with span("inference"):
+                        masked_latent, mask_latent = self.sampler.encode_person(aligned.tensor, mask_tensor)
+                except Exception as e:
+                    print(f"❌ Rack masking failed ({tryon_type}): {e}")
+                    for index in type_indices:
+                        yield index, None
+                    continue
+
+                yield from self._iter_rack_batches(
+                    garments, type_indices, masked_latent, mask_latent,
+                    num_inference_steps, guidance_scale, height, width, scheduler, batch_size, cancel
+                )
+
+            if cancel is not None and cancel.is_set():
+                print(f"⚠️ Rack Try-On cancelled")
+            else:
+                print(f"✅ Rack Try-On Complete!")
+
+    def _iter_rack_batches(
+        self, garments, garment_indices, masked_latent, mask_latent,
+        num_inference_steps, guidance_scale, height, width, scheduler, batch_size, cancel=None
+    ):
+        """Denoise the given garments against one encoded person, `batch_size` at a time."""
+        for start in range(0, len(garment_indices), batch_size):
+            if cancel is not None and cancel.is_set():
+                return
+            indices, garment_latents = [], []
+            for index in garment_indices[start:start + batch_size]:
+                garment_image, garment_cache_key, _ = garments[index]
+                try:
+                    garment = self.prepare_garment(garment_image, height, width, garment_cache_key)
+                    indices.append(index)
+                    garment_latents.append(garment["latent"].to(self.device, dtype=self.weight_dtype))
+                except Exception as e:
+                    print(f"❌ Rack garment {index} failed: {e}")
+                    yield index, None
+
+            if not indices:
+                continue
+
+            n = len(indices)
+            generators = [torch.Generator(device=str(self.device)).manual_seed(555) for _ in range(n)]
+            try:
+                with span("inference"):
+                    latents = self.sampler.denoise(
+                        masked_latent.repeat(n, 1, 1, 1),
+                        mask_latent.repeat(n, 1, 1, 1),
+                        torch.cat(garment_latents),
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        generator=generators if n > 1 else generators[0],
+                        scheduler=scheduler,
+                    )
+                    images = self.sampler.decode(latents)
             except Exception as e:
-                print(f"⚠️ Smart mask failed: {e}")
-
-        # 3. Combine Masks
-        if has_pose:
-            # If we have pose, we want the Intersection of (Torso_Shape OR Background_Spill) AND Silhouette?
-            # Actually, we want: Where is the BODY (Silhouette) AND Where is the TORSO (Pose)
-            # But Rembg often removes the clothes we want to replace if strict.
-            # Strategy: 
-            # 1. Dilate Pose Mask to cover all clothing area loosely.
-            # 2. Intersect with Silhouette (if Rembg kept the clothes).
-            #    Problem: Rembg might remove the shirt if it thinks it's background? No, usually keeps person.
-            # Let's try: Pose Mask (Dilated) as the PRIMARY guide. 
-            
-            # Dilate pose mask heavily to ensure it covers the shirt fully
-            # (We want to mask OUT the old shirt)
-            pose_mask = pose_mask.filter(ImageFilter.MaxFilter(25)) # Expand struct
-            
-            # Improve: Use the silhouette to 'trim' the pose mask so it doesn't spill into background?
-            # intersection = ImageChops.multiply(pose_mask, silhouette) 
-            # But if pose mask is wider than silhouette, we might miss loose cloth. 
-            # If pose mask is narrower, we miss cloth.
-            
-            # Simple & Robust Strategy: 
-            # Use the Pose Mask (Dilated) but SUBTRACT the Face area?
-            # We already handled Face safety with `neck_top_y`.
-            
-            final_mask = pose_mask
-            
-        else:
-            # Fallback
-            print("⚠️ Using Fallback Rectangle Mask")
-            w, h = width, height
-            draw.rectangle([w*0.25, h*0.20, w*0.75, h*0.60], fill=255)
-            final_mask = pose_mask
-
-        # Blur edges
-        final_mask = final_mask.filter(ImageFilter.GaussianBlur(radius=7))
-        return final_mask
-    
-    async def process_virtual_tryon(
+                print(f"❌ Rack batch failed: {e}")
+                for index in indices:
+                    yield index, None
+                continue
+
+            for index, image in zip(indices, images):
+                yield index, self._encode_result(image)
+
+    def iter_virtual_tryon(
+        self,
+        user_image,
+        garment_image,
+        num_inference_steps=50,
+        guidance_scale=2.5,
+        height=768,
+        width=576,
+        scheduler="ddim",
+        garment_cache_key=None,
+        preview_every=TRYON_PREVIEW_EVERY,
+        tryon_type=DEFAULT_TRYON_TYPE,
+        report=None,
+        cancel=None
+    ):
+        """
+        Single try-on that reports progress (blocking generator).
+
+        Every `preview_every` denoising steps a low-resolution JPEG preview is decoded
+        cheaply from the scheduler's current estimate of the clean latent. Runs outside
+        the micro-batcher, since previews need this request's own denoising loop.
+
+        Yields:
+            ("preview", {"step", "total", "image": jpeg_bytes}) during denoising,
+            then ("result", EncodedResult)
+
+        If `report` is a dict, the run's peak memory and per-stage spans are added to it.
+        If `cancel` (a threading.Event) is set, denoising stops after the current step
+        and nothing more is yielded.
+        """
+        with self._measure_memory(report), collect_spans(report):
+            person_tensor, mask_tensor = self._prepare_person(user_image, height, width, tryon_type)
+            garment = self.prepare_garment(garment_image, height, width, garment_cache_key)
+            with span("inference"):
+                masked_latent, mask_latent = self.sampler.encode_person(person_tensor, mask_tensor)
+                generator = torch.Generator(device=str(self.device)).manual_seed(555)
+
+                latents = None
+                for step, total, latents, pred_original in self.sampler.iter_denoise(
+                    masked_latent,
+                    mask_latent,
+                    garment["latent"].to(self.device, dtype=self.weight_dtype),
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    generator=generator,
+                    scheduler=scheduler,
+                ):
+                    if cancel is not None and cancel.is_set():
+                        print(f"⚠️ Try-on cancelled at step {step + 1}/{total}")
+                        return
+                    if preview_every and (step + 1) % preview_every == 0 and step + 1 < total:
+                        with span("preview"):
+                            estimate = pred_original if pred_original is not None else latents
+                            preview = latent_preview(self.sampler.person_half(estimate))
+                            preview = encode_preview(preview)
+                        yield "preview", {"step": step + 1, "total": total, "image": preview}
+
+                result_image = self.sampler.decode(self.sampler.person_half(latents))[0]
+            yield "result", self._encode_result(result_image)
+
+    async def process_virtual_tryon(self, user_image, garment_image, **kwargs):
+        """
+        Async wrapper around `run_virtual_tryon`.
+
+        Inference is pushed to the default executor so the event loop is not blocked;
+        the API uses its own bounded pool (see tryon_jobs.py) and calls
+        `run_virtual_tryon` directly.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(self.run_virtual_tryon, user_image, garment_image, **kwargs)
+        )
+
+    def run_virtual_tryon(
         self, 
-        user_image_path, 
-        garment_image_path, 
+        user_image, 
+        garment_image, 
         product_name="", 
         product_category="Upper Body",
         num_inference_steps=50,
         guidance_scale=2.5,
         height=768, # Increased Resolution
-        width=576
+        width=576,
+        scheduler="ddim",
+        garment_cache_key=None,
+        tryon_type=DEFAULT_TRYON_TYPE,
+        report=None
     ):
         """
-        Process virtual try-on using CatVTON
+        Process virtual try-on using CatVTON (blocking)
         
         Args:
-            user_image_path: Path to user/person image
-            garment_image_path: Path to garment/cloth image
+            user_image: User/person image as a path, bytes, buffer or PIL image
+            garment_image: Garment/cloth image, same forms, or its URL if the garment is cached
+            garment_cache_key: Key from `garment_cache_key()`; reuses the cached garment latent
+            tryon_type: Product try-on type, selects the mask generator (default: Upper body)
             num_inference_steps: Number of diffusion steps (default: 50)
             guidance_scale: Classifier-free guidance scale (default: 2.5)
+            scheduler: Noise scheduler name from inference_profiles.SCHEDULERS (default: ddim)
             height: Output height (default: 512)
             width: Output width (default: 384)
+            report: Optional dict; the run's memory mode, peak RSS and per-stage spans
+                ("stages": [(stage, ms), ...]) are added to it
         
         Returns:
-            bytes: PNG image bytes
+            EncodedResult: the encoded image and its thumbnail (see result_encoding.py)
         """
         try:
-            print(f"[1/4] Loading Images...")
-            # Load images
-            person_image = Image.open(user_image_path).convert('RGB')
-            cloth_image = Image.open(garment_image_path).convert('RGB')
+            # Each stage is timed as a span (see tryon_tracing.py)
+            with self._measure_memory(report), collect_spans(report):
+                # Align the person image to the model's crop/resize, then mask it
+                person_tensor, mask_tensor = self._prepare_person(user_image, height, width, tryon_type)
             
-            print(f"[2/4] Preprocessing & Masking...")
-            # 1. Preprocess Person Image first to ensure we work with the exact crop/resize the model sees
-            # Returns [1, 3, H, W]
-            person_tensor = self.vae_processor.preprocess(person_image, height, width)[0].unsqueeze(0)
+                # Garment comes from the cache when possible
+                garment = self.prepare_garment(garment_image, height, width, garment_cache_key)
             
-            # 2. Get the aligned PIL image back for masking
-            # This ensures (height, width) and aspect ratio are consistent
-            aligned_person_pil = self.vae_processor.postprocess(person_tensor, output_type="pil")[0]
+                # Dimensions are already batched from unsqueeze(0)
             
-            # 3. Generate Mask on the aligned image
-            mask = self.generate_mask(aligned_person_pil, height, width)
-            
-            # 4. Preprocess other inputs
-            cloth_tensor = self.vae_processor.preprocess(cloth_image, height, width)[0].unsqueeze(0)
-            mask_tensor = self.mask_processor.preprocess(mask, height, width)[0].unsqueeze(0)
-            
-            # Dimensions are already batched from unsqueeze(0)
-            
-            print(f"[4/4] Running CatVTON Inference...")
-            # Run inference
-            generator = torch.Generator(device=str(self.device)).manual_seed(555)
-            
-            results = self.pipeline(
-                person_tensor,
-                cloth_tensor,
-                mask_tensor,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                height=height,
-                width=width,
-                generator=generator,
-            )
+                # Run inference, sharing a batch with concurrent requests of the same shape if enabled
+                key = (height, width, num_inference_steps, guidance_scale, scheduler)
+                item = (person_tensor, garment["latent"], mask_tensor, 555)
             
-            # Get first result
-            result_image = results[0]
+                with span("inference"):
+                    if self.batcher:
+                        result_image = self.batcher.run(key, item)
+                    else:
+                        result_image = self.run_pipeline_batch(key, [item])[0]
             
-            # Convert to bytes
-            import io
-            img_byte_arr = io.BytesIO()
-            result_image.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
+                # Encode the image and its thumbnail
+                encoded = self._encode_result(result_image)
             
             print(f"✅ Try-On Complete!")
-            return img_byte_arr
+            return encoded
             
         except Exception as e:
             print(f"❌ Error in CatVTON: {e}")
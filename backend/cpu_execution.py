@@ -0,0 +1,155 @@
+# CPU Execution Mode
+# Tuning knobs for running the diffusion UNet on CPU-only nodes: thread counts,
+# bfloat16 autocast, channels-last tensors, a compiled or traced UNet and chunked
+# attention. Every option defaults to off, i.e. the plain float32 eager pipeline.
+
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import NamedTuple
+
+import torch
+from dotenv import load_dotenv
+
+from memory_budget import apply_attention_chunking
+
+load_dotenv()
+
+TRYON_CPU_THREADS = int(os.getenv("TRYON_CPU_THREADS", 0))  # 0 = torch default (one per physical core)
+TRYON_CPU_INTEROP_THREADS = int(os.getenv("TRYON_CPU_INTEROP_THREADS", 0))
+TRYON_CPU_BF16 = os.getenv("TRYON_CPU_BF16", "false").lower()  # true, false, auto (only if the CPU has native bf16)
+TRYON_CPU_CHANNELS_LAST = os.getenv("TRYON_CPU_CHANNELS_LAST", "false").lower() in ("1", "true", "yes")
+TRYON_CPU_COMPILE = os.getenv("TRYON_CPU_COMPILE", "none")  # none, compile, torchscript
+TRYON_ATTENTION_SLICE = int(os.getenv("TRYON_ATTENTION_SLICE", 0))  # 0 = off, N = query tokens per attention chunk
+
+COMPILE_MODES = ("none", "compile", "torchscript")
+
+
+class CPUExecutionConfig(NamedTuple):
+    threads: int = TRYON_CPU_THREADS
+    interop_threads: int = TRYON_CPU_INTEROP_THREADS
+    bf16: str = TRYON_CPU_BF16
+    channels_last: bool = TRYON_CPU_CHANNELS_LAST
+    compile: str = TRYON_CPU_COMPILE
+    attention_slice: int = TRYON_ATTENTION_SLICE
+
+
+def bf16_supported():
+    """True if oneDNN has native bfloat16 kernels on this CPU (AVX512-BF16 / AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+class _UNetForward(torch.nn.Module):
+    """Positional-only UNet forward, so it can be traced."""
+
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep):
+        return self.unet(sample, timestep, encoder_hidden_states=None, return_dict=False)[0]
+
+
+_jit_autocast_lock = threading.Lock()
+_jit_autocast_users = 0
+_jit_autocast_previous = None
+
+
+@contextmanager
+def jit_autocast_disabled():
+    """
+    Turn off the JIT autocast pass while tracing or running a trace recorded under
+    autocast, then restore it. The flag is process-wide, so overlapping users share
+    one change, undone when the last leaves; other scripted modules run at the same
+    time see it too.
+    """
+    global _jit_autocast_users, _jit_autocast_previous
+    with _jit_autocast_lock:
+        if _jit_autocast_users == 0:
+            _jit_autocast_previous = torch._C._jit_set_autocast_mode(False)
+        _jit_autocast_users += 1
+    try:
+        yield
+    finally:
+        with _jit_autocast_lock:
+            _jit_autocast_users -= 1
+            if _jit_autocast_users == 0:
+                torch._C._jit_set_autocast_mode(_jit_autocast_previous)
+
+
+class TracedUNet:
+    """
+    TorchScript UNet. Traced lazily, once per input shape and dtype, since a trace
+    is only valid for the shapes it was recorded with.
+    """
+
+    def __init__(self, unet):
+        self.module = _UNetForward(unet).eval()
+        self._traced = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, sample, timestep, encoder_hidden_states=None, return_dict=False):
+        autocast = torch.is_autocast_cpu_enabled()
+        key = (tuple(sample.shape), sample.dtype, autocast)
+        # Under autocast the trace records the casts, so autocast must not be re-applied when it runs
+        with jit_autocast_disabled() if autocast else nullcontext():
+            with self._lock:
+                traced = self._traced.get(key)
+                if traced is None:
+                    print(f"Tracing UNet for input {tuple(sample.shape)}...")
+                    with torch.no_grad():
+                        traced = torch.jit.freeze(torch.jit.trace(self.module, (sample, timestep), check_trace=False))
+                    self._traced[key] = traced
+            return (traced(sample, timestep),)
+
+
+def configure_cpu_execution(pipeline, sampler, config=None):
+    """
+    Apply `config` to the pipeline/sampler. Returns a dict describing what was enabled.
+    """
+    config = config or CPUExecutionConfig()
+    if config.compile not in COMPILE_MODES:
+        raise ValueError(f"Unknown TRYON_CPU_COMPILE '{config.compile}', expected one of {COMPILE_MODES}")
+
+    if config.threads > 0:
+        torch.set_num_threads(config.threads)
+    if config.interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(config.interop_threads)
+        except RuntimeError as e:
+            # Can only be set before the first parallel op in the process
+            print(f"⚠️ Could not set inter-op threads: {e}")
+
+    use_bf16 = config.bf16 == "true" or (config.bf16 == "auto" and bf16_supported())
+    sampler.autocast_dtype = torch.bfloat16 if use_bf16 else None
+
+    if config.channels_last:
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+        sampler.channels_last = True
+
+    slices = 0
+    if config.attention_slice > 0:
+        slices = apply_attention_chunking(pipeline.unet, config.attention_slice)
+
+    # Compile last, so the compiled graph sees the final memory format and processors
+    if config.compile == "compile":
+        sampler.unet_forward = torch.compile(pipeline.unet, dynamic=False)
+    elif config.compile == "torchscript":
+        sampler.unet_forward = TracedUNet(pipeline.unet)
+
+    summary = {
+        "threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "bf16_autocast": use_bf16,
+        "bf16_native": bf16_supported(),
+        "channels_last": config.channels_last,
+        "compile": config.compile,
+        "attention_slice": config.attention_slice,
+        "sliced_attention_layers": slices,
+    }
+    print(f"CPU execution: {summary}")
+    return summary
@@ -1,6 +1,6 @@
 import asyncio
 from database import users_collection
-from auth import get_password_hash
+from password_hashing import get_password_hasher
 from datetime import datetime
 import uuid
 
@@ -20,7 +20,7 @@ async def create_default_admin():
     admin_user = {
         "full_name": full_name,
         "email": email,
-        "password": get_password_hash(password),
+        "password": await get_password_hasher().hash(password),
         "role": "admin",
         "supabase_uid": str(uuid.uuid4()),
         "created_at": datetime.utcnow().isoformat(),
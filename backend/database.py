@@ -1,18 +1,29 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "virtual_try_on")
+# mongo, or memory: process-local collections for tests and load tests (see memory_database.py)
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "mongo")
+
+if DATABASE_BACKEND == "memory":
+    from memory_database import InMemoryDatabase
+    client = None
+    database = InMemoryDatabase(DB_NAME)
+elif DATABASE_BACKEND == "mongo":
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(MONGO_URL)
+    database = client[DB_NAME]
+else:
+    raise ValueError(f"Unknown DATABASE_BACKEND '{DATABASE_BACKEND}', expected 'mongo' or 'memory'")
 
-client = AsyncIOMotorClient(MONGO_URL)
-database = client[DB_NAME]
 users_collection = database["users"]
 products_collection = database["products"]
 categories_collection = database["categories"]
 tryon_history_collection = database["tryon_history"]
+tryon_results_collection = database["tryon_results"]
 
 async def get_database():
     return database
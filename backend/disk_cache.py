@@ -0,0 +1,79 @@
+# Disk Cache
+# Size cap for the on-disk tiers of the garment and mask caches. Files are evicted
+# least recently used first, by mtime: writes set it and hits refresh it. Each process
+# keeps a running total and only rescans the directory once that passes the cap, so
+# worker processes sharing a directory still converge on it without a listdir per put.
+
+import os
+import threading
+
+# Evict down to this fraction of the cap, so the directory isn't rescanned on every put
+EVICT_TO = 0.9
+
+
+class DiskCacheBudget:
+    """Keeps the `suffix` files in `directory` under `max_bytes` (0 = unbounded)."""
+
+    def __init__(self, directory, max_bytes, suffix):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self._size = sum(size for _, _, size in self._scan())
+
+    def _scan(self):
+        """(mtime, path, size) of every cache file; in-flight temp files are skipped."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix) or ".tmp" in name:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            files.append((stat.st_mtime, path, stat.st_size))
+        return files
+
+    @staticmethod
+    def touch(path):
+        """Mark a cache file as recently used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def added(self, path):
+        """Account for a file just written, evicting the least recently used files if over the cap."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size += size
+            if self.max_bytes > 0 and self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = sorted(self._scan())
+        total = sum(size for _, _, size in files)
+        target = self.max_bytes * EVICT_TO
+        for _, path, size in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except OSError:
+                pass  # already gone
+            total -= size
+        self._size = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "disk_mb": round(self._size / (1024 * 1024), 2),
+                "disk_max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "disk_evictions": self.evictions,
+            }
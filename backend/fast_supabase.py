@@ -7,10 +7,13 @@ load_dotenv()
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 
-if not url or not key:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file.")
-
-supabase: Client = create_client(url, key)
+# Created on first use, so importing this module never needs Supabase credentials
+supabase: Client = None
 
 def get_supabase() -> Client:
+    global supabase
+    if supabase is None:
+        if not url or not key:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file.")
+        supabase = create_client(url, key)
     return supabase
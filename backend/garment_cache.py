@@ -0,0 +1,150 @@
+# Garment Cache
+# A product's garment image never changes between try-ons, so its preprocessed tensor
+# and VAE latent are cached per (product, image URL, resolution, dtype).
+# Both tiers are LRU-bounded by size; the optional disk tier survives restarts.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+from dotenv import load_dotenv
+
+from disk_cache import DiskCacheBudget
+
+load_dotenv()
+
+GARMENT_CACHE_MAX_MB = float(os.getenv("GARMENT_CACHE_MAX_MB", 512))
+GARMENT_CACHE_DIR = os.getenv("GARMENT_CACHE_DIR")  # unset = memory only
+GARMENT_CACHE_DIR_MAX_MB = float(os.getenv("GARMENT_CACHE_DIR_MAX_MB", 4096))  # 0 = unbounded
+
+
+def _tensor_bytes(entry):
+    return sum(t.numel() * t.element_size() for t in entry.values() if isinstance(t, torch.Tensor))
+
+
+class GarmentCache:
+    """
+    Thread-safe LRU cache of garment entries: {"cloth": tensor, "latent": tensor}.
+
+    Tensors are kept on the CPU; callers move them to the inference device.
+    """
+
+    def __init__(self, max_mb=GARMENT_CACHE_MAX_MB, disk_dir=GARMENT_CACHE_DIR, disk_max_mb=GARMENT_CACHE_DIR_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.disk_dir = disk_dir
+        self.disk_budget = None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.disk_budget = DiskCacheBudget(self.disk_dir, int(disk_max_mb * 1024 * 1024), ".pt")
+
+        self._entries = OrderedDict()  # key -> (product_id, entry, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(product_id, image_url, height, width, dtype):
+        digest = hashlib.sha1(f"{image_url}|{height}x{width}|{dtype}".encode()).hexdigest()[:16]
+        return f"{product_id}_{digest}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pt")
+
+    def get(self, key):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if cached is not None:
+            if self.disk_budget:
+                self.disk_budget.touch(self._disk_path(key))
+            return cached[1]
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                entry = torch.load(self._disk_path(key), map_location="cpu")
+                self.disk_budget.touch(self._disk_path(key))
+                self._put_memory(key, entry)
+                with self._lock:
+                    self.disk_hits += 1
+                return entry
+            except Exception as e:
+                print(f"⚠️ Garment cache entry unreadable, dropping: {e}")
+                self._remove_file(self._disk_path(key))
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def contains(self, key):
+        """True if `key` is cached in memory or on disk; no LRU update and not counted in the stats."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.on_disk(key)
+
+    def on_disk(self, key):
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(key))
+
+    def put(self, key, entry):
+        entry = {name: t.detach().cpu() for name, t in entry.items() if t is not None}
+        self._put_memory(key, entry)
+        if self.disk_dir:
+            try:
+                tmp_path = self._disk_path(key) + ".tmp"
+                torch.save(entry, tmp_path)
+                os.replace(tmp_path, self._disk_path(key))
+                self.disk_budget.added(self._disk_path(key))
+            except Exception as e:
+                print(f"⚠️ Failed to persist garment cache entry: {e}")
+        return entry
+
+    def _put_memory(self, key, entry):
+        size = _tensor_bytes(entry)
+        product_id = key.rsplit("_", 1)[0]
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[2]
+            self._entries[key] = (product_id, entry, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def invalidate_product(self, product_id):
+        """Drop every cached entry for a product (e.g. after its image is replaced)."""
+        product_id = str(product_id)
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if v[0] == product_id]:
+                self._size -= self._entries.pop(key)[2]
+
+        if self.disk_dir:
+            for filename in os.listdir(self.disk_dir):
+                if filename.startswith(f"{product_id}_"):
+                    self._remove_file(os.path.join(self.disk_dir, filename))
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "size_mb": round(self._size / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+        if self.disk_budget:
+            stats.update(self.disk_budget.stats())
+        return stats
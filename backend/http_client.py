@@ -0,0 +1,132 @@
+# Shared Async HTTP Client
+# One pooled httpx client for all remote image fetches (garments, stored user photos),
+# so requests reuse keep-alive connections instead of opening a new TCP/TLS session
+# each time, and never block the event loop.
+
+import asyncio
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 15))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", 8))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+
+# Worth retrying: rate limiting and transient upstream errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class ImageFetchError(Exception):
+    """Raised when a remote image cannot be downloaded."""
+
+    def __init__(self, url, reason, status_code=None):
+        super().__init__(f"Failed to fetch {url}: {reason}")
+        self.url = url
+        self.status_code = status_code
+
+
+class ImageFetcher:
+    """
+    Pooled async downloader with bounded concurrency and retry with exponential backoff.
+
+    The underlying client is created lazily on first use so the module can be
+    imported outside an event loop.
+    """
+
+    def __init__(
+        self,
+        timeout=HTTP_TIMEOUT,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_concurrency=HTTP_MAX_CONCURRENCY,
+        retries=HTTP_RETRIES,
+        backoff=HTTP_RETRY_BACKOFF,
+        transport=None
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.transport = transport
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                follow_redirects=True,
+                transport=self.transport,
+            )
+        return self._client
+
+    async def fetch(self, url):
+        """Download `url` and return the response body as bytes."""
+        client = self._get_client()
+        error = None
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await client.get(url)
+                if response.status_code == 200:
+                    return response.content
+                error = ImageFetchError(url, f"HTTP {response.status_code}", response.status_code)
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise error
+            except httpx.HTTPError as e:
+                error = ImageFetchError(url, str(e) or type(e).__name__)
+
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+        raise error
+
+    def fetch_blocking(self, url):
+        """
+        Download `url` from a worker thread or process, with the same retry policy.
+
+        For the rare fetch that cannot be done up front on the event loop (a garment
+        evicted from the cache after the API checked it); uses a one-off client.
+        """
+        error = None
+        with httpx.Client(timeout=self.timeout, follow_redirects=True) as client:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = client.get(url)
+                    if response.status_code == 200:
+                        return response.content
+                    error = ImageFetchError(url, f"HTTP {response.status_code}", response.status_code)
+                    if response.status_code not in RETRYABLE_STATUS:
+                        raise error
+                except httpx.HTTPError as e:
+                    error = ImageFetchError(url, str(e) or type(e).__name__)
+
+                if attempt < self.retries:
+                    time.sleep(self.backoff * (2 ** attempt))
+
+        raise error
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+image_fetcher = ImageFetcher()
+
+def get_image_fetcher() -> ImageFetcher:
+    return image_fetcher
+
+
+def is_image_url(value):
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
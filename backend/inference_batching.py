@@ -0,0 +1,121 @@
+# Micro-Batching Scheduler
+# Groups concurrent try-on requests that share the same diffusion shape into a single
+# batched pipeline call, so the per-step UNet overhead is paid once per batch.
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_BATCH_MAX_SIZE = int(os.getenv("TRYON_BATCH_MAX_SIZE", 1))
+TRYON_BATCH_MAX_WAIT_MS = float(os.getenv("TRYON_BATCH_MAX_WAIT_MS", 50))
+
+
+class MicroBatchScheduler:
+    """
+    Collects requests for a short window and runs them as one batch.
+
+    Requests are grouped by `key` (e.g. height, width, steps, guidance, scheduler); only requests
+    with the same key can share a batch. A group is dispatched as soon as it holds
+    `max_batch_size` requests or its oldest request has waited `max_wait_ms`.
+
+    `run_batch(key, items)` is called on the scheduler thread and must return one
+    result per item, in order.
+    """
+
+    def __init__(self, run_batch, max_batch_size=TRYON_BATCH_MAX_SIZE, max_wait_ms=TRYON_BATCH_MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._groups = OrderedDict()  # key -> [(enqueued_at, item, future)]
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._batch_sizes = Counter()
+        self._wait_time_total = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="tryon-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, item):
+        """Queue an item and return a Future for its result."""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batch scheduler is closed")
+            self._groups.setdefault(key, []).append((time.monotonic(), item, future))
+            self._cond.notify()
+        return future
+
+    def run(self, key, item):
+        """Blocking helper: queue an item and wait for its result."""
+        return self.submit(key, item).result()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def metrics(self):
+        with self._cond:
+            batches = sum(self._batch_sizes.values())
+            requests = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": batches,
+                "requests": requests,
+                "avg_batch_size": requests / batches if batches else 0.0,
+                "avg_wait_ms": (self._wait_time_total / requests * 1000.0) if requests else 0.0,
+                "batch_size_counts": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "queued": sum(len(group) for group in self._groups.values()),
+            }
+
+    def _next_batch(self):
+        """Wait until a group is ready and pop it. Must be called with the lock held."""
+        while True:
+            if self._closed and not self._groups:
+                return None, []
+
+            now = time.monotonic()
+            next_deadline = None
+            for key, group in self._groups.items():
+                deadline = group[0][0] + self.max_wait
+                if len(group) >= self.max_batch_size or deadline <= now or self._closed:
+                    batch = group[:self.max_batch_size]
+                    del group[:self.max_batch_size]
+                    if not group:
+                        del self._groups[key]
+                    return key, batch
+                if next_deadline is None or deadline < next_deadline:
+                    next_deadline = deadline
+
+            self._cond.wait(timeout=None if next_deadline is None else next_deadline - now)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                key, batch = self._next_batch()
+                if not batch:
+                    return
+                dispatched_at = time.monotonic()
+                self._batch_sizes[len(batch)] += 1
+                self._wait_time_total += sum(dispatched_at - enqueued_at for enqueued_at, _, _ in batch)
+
+            try:
+                results = self.run_batch(key, [item for _, item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} requests")
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
@@ -0,0 +1,460 @@
+# Multi-Process Inference
+# Runs the try-on engine in several worker processes that share one copy of the model
+# weights. A "zygote" process loads the processor once and then forks the workers, so
+# the weights are shared copy-on-write instead of loaded per process. Every worker has
+# its own pair of pipes, created fresh each time it is forked, and the API dispatches
+# each request to the least busy worker. Nothing is shared between workers, so one that
+# is killed mid-message cannot block the others or its replacement. CPU inference
+# only: CUDA cannot be used in a process forked after it was initialized.
+
+import gc
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection, wait
+from multiprocessing.reduction import recv_handle, send_handle
+
+from dotenv import load_dotenv
+
+from garment_cache import GarmentCache
+from tryon_jobs import TRYON_WORKERS
+
+load_dotenv()
+
+# Seconds to wait for the zygote to load the model and every worker to report ready
+TRYON_WORKER_READY_TIMEOUT = float(os.getenv("TRYON_WORKER_READY_TIMEOUT", 300))
+
+
+class WorkerProcessError(Exception):
+    """Raised in the API process when a job fails in (or loses) its worker process."""
+
+
+def _load_processor():
+    from catvton_tryon import CatVTONProcessor
+    return CatVTONProcessor()
+
+
+def _threads_per_process(processes):
+    """torch intra-op threads for each worker: TRYON_CPU_THREADS, or the cores split evenly."""
+    from cpu_execution import TRYON_CPU_THREADS
+    return TRYON_CPU_THREADS or max(1, (os.cpu_count() or 1) // processes)
+
+
+def _exit_with_parent(parent_pid):
+    """Exit this process once its parent is gone, so workers never outlive the API."""
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(1)
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+
+def _run_job(processor, job, send, cancel):
+    job_id, method, args, kwargs, want_report = job
+    report = {} if want_report else None
+    if want_report:
+        kwargs["report"] = report
+    try:
+        fn = getattr(processor, method)
+        value = None
+        if method.startswith("iter_"):
+            for item in fn(*args, cancel=cancel, **kwargs):
+                if cancel.is_set():
+                    break
+                send((job_id, "item", item))
+        else:
+            value = fn(*args, **kwargs)
+        send((job_id, "done", (value, report)))
+    except Exception as e:
+        send((job_id, "error", str(e)))
+
+
+def _worker_main(processor, index, threads, zygote_pid, requests, results):
+    """Entry point of a forked worker: serve the jobs the API sends on `requests` until told to stop."""
+    import torch
+
+    _exit_with_parent(zygote_pid)
+    torch.set_num_threads(threads)
+    processor.after_fork()
+
+    # The job threads share this process's results pipe
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            results.send(message)
+
+    send((None, "ready", (index, os.getpid(), str(processor.weight_dtype), processor.stats())))
+
+    cancels = {}  # job_id -> threading.Event of the jobs running here
+
+    def run(job):
+        try:
+            _run_job(processor, job, send, cancels[job[0]])
+        finally:
+            cancels.pop(job[0], None)
+            send((None, "stats", (index, os.getpid(), processor.stats())))
+
+    # The API sends each worker at most TRYON_WORKERS jobs at a time
+    with ThreadPoolExecutor(max_workers=TRYON_WORKERS, thread_name_prefix="tryon-worker") as executor:
+        while True:
+            message = requests.recv()
+            if message is None:
+                break
+            command, payload = message
+            if command == "job":
+                # Registered here, so a cancel_job sent after the job is never missed
+                cancels[payload[0]] = threading.Event()
+                executor.submit(run, payload)
+            elif command == "cancel_job" and payload in cancels:
+                cancels[payload].set()
+            elif command == "invalidate_garment":
+                processor.invalidate_garment(payload)
+
+
+def _fork_worker(processor, index, threads, api, api_pid):
+    """Fork a worker with a fresh pair of pipes and hand the API its ends of them."""
+    requests_read, requests_write = multiprocessing.Pipe(duplex=False)
+    results_read, results_write = multiprocessing.Pipe(duplex=False)
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            for conn in (api, requests_write, results_read):
+                conn.close()
+            _worker_main(processor, index, threads, os.getppid(), requests_read, results_write)
+        except BaseException as e:
+            print(f"❌ Inference worker {index} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    # Only the worker and the API may hold these, so a worker's death shows up as EOF
+    requests_read.close()
+    results_write.close()
+    api.send(("worker", (index, pid)))
+    send_handle(api, requests_write.fileno(), api_pid)
+    send_handle(api, results_read.fileno(), api_pid)
+    requests_write.close()
+    results_read.close()
+    return pid
+
+
+def _zygote_main(processes, parent_pid, api):
+    """Load the processor once, fork the workers and replace any that die."""
+    try:
+        processor = _load_processor()
+        if processor.device.type != "cpu":
+            raise RuntimeError("TRYON_WORKER_PROCESSES requires CPU inference; CUDA cannot be shared with forked workers")
+        threads = _threads_per_process(processes)
+    except Exception as e:
+        api.send(("failed", str(e)))
+        return
+
+    # Move everything loaded so far out of the collector's reach, so collections in
+    # the workers do not write to (and un-share) the pages holding those objects
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    for index in range(processes):
+        children[_fork_worker(processor, index, threads, api, parent_pid)] = index
+    print(f"Forked {processes} inference workers ({threads} threads each)")
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if os.getppid() != parent_pid:
+                # API process is gone; its workers exit on their own
+                return
+            time.sleep(0.5)
+            continue
+        index = children.pop(pid, None)
+        code = os.waitstatus_to_exitcode(status)
+        if index is None or code == 0:
+            continue  # clean exit after a shutdown sentinel
+        print(f"⚠️ Inference worker {index} (pid {pid}) exited with code {code}, restarting")
+        api.send(("exited", (index, pid, code)))
+        children[_fork_worker(processor, index, threads, api, parent_pid)] = index
+
+
+class WorkerChannel:
+    """The API's ends of one forked worker's pipes, and the jobs dispatched to it."""
+
+    def __init__(self, index, pid, requests, results):
+        self.index = index
+        self.pid = pid
+        self.requests = requests
+        self.results = results
+        self.ready = False
+        self.jobs = set()
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        with self._send_lock:
+            self.requests.send(message)
+
+    def close(self):
+        for conn in (self.requests, self.results):
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class ForkedProcessorPool:
+    """
+    Stands in for CatVTONProcessor in the API process and forwards each call to one
+    of `processes` forked worker processes.
+
+    Each worker runs TRYON_WORKERS jobs at a time, so the API's InferenceWorkerPool
+    needs `processes * TRYON_WORKERS` threads to keep every worker busy. The blocking
+    methods below are meant to run on those threads, exactly like the local ones.
+    """
+
+    def __init__(self, processes, ready_timeout=TRYON_WORKER_READY_TIMEOUT):
+        self.processes = processes
+        self.ready_timeout = ready_timeout
+        context = multiprocessing.get_context("spawn")
+        # A socket pair (duplex), so the zygote can pass each new worker's pipe ends over it
+        self._zygote_conn, zygote_conn = context.Pipe()
+
+        self.garment_cache = GarmentCache(max_mb=0)
+        self.weight_dtype = None
+        self.restarts = 0
+        self._worker_stats = {}
+        self._workers = {}  # index -> WorkerChannel of the live worker
+        self._jobs = {}  # job_id -> (queue.Queue of (kind, payload), WorkerChannel)
+        self._lock = threading.Lock()
+        self._worker_ready = threading.Condition(self._lock)
+        self._failed = None
+        self._closing = False
+
+        self.zygote = context.Process(
+            target=_zygote_main,
+            args=(processes, os.getpid(), zygote_conn),
+            name="tryon-zygote",
+            daemon=True
+        )
+        self.zygote.start()
+        zygote_conn.close()
+        self._reader = threading.Thread(target=self._read_results, name="tryon-results", daemon=True)
+        self._reader.start()
+        self._wait_ready()
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.ready_timeout
+        while True:
+            with self._lock:
+                if self._failed:
+                    raise RuntimeError(self._failed)
+                ready = sum(worker.ready for worker in self._workers.values())
+                if ready == self.processes:
+                    break
+            if not self.zygote.is_alive():
+                raise RuntimeError(f"Inference zygote exited with code {self.zygote.exitcode}")
+            if time.monotonic() > deadline:
+                # A worker (or the zygote's model load) is stuck; don't leave them running
+                self.shutdown()
+                raise RuntimeError(
+                    f"Inference workers not ready after {self.ready_timeout:.0f}s ({ready}/{self.processes} ready)"
+                )
+            time.sleep(0.2)
+        print(f"✅ {self.processes} inference worker processes ready")
+
+    def _read_results(self):
+        while not self._closing:
+            with self._lock:
+                workers = {worker.results: worker for worker in self._workers.values()}
+            sources = list(workers) + ([self._zygote_conn] if self._zygote_conn else [])
+            for conn in wait(sources, timeout=0.5):
+                if conn is self._zygote_conn:
+                    self._read_zygote()
+                    continue
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._worker_lost(workers[conn])
+                    continue
+                self._handle(workers[conn], message)
+
+    def _read_zygote(self):
+        try:
+            kind, payload = self._zygote_conn.recv()
+            if kind == "worker":
+                index, pid = payload
+                requests = Connection(recv_handle(self._zygote_conn), readable=False)
+                results = Connection(recv_handle(self._zygote_conn), writable=False)
+                with self._lock:
+                    self._workers[index] = WorkerChannel(index, pid, requests, results)
+                return
+        except (EOFError, OSError):
+            if not self._closing:
+                print("⚠️ Inference zygote exited; dead workers can no longer be replaced")
+            self._zygote_conn = None
+            return
+
+        with self._lock:
+            if kind == "failed":
+                self._failed = payload
+                self._worker_ready.notify_all()
+            elif kind == "exited":
+                self.restarts += 1
+
+    def _handle(self, worker, message):
+        job_id, kind, payload = message
+        with self._lock:
+            if kind == "ready":
+                index, pid, self.weight_dtype, stats = payload
+                worker.ready = True
+                self._worker_stats[index] = {"pid": pid, **stats}
+                self._worker_ready.notify_all()
+            elif kind == "stats":
+                index, pid, stats = payload
+                self._worker_stats[index] = {"pid": pid, **stats}
+            elif job_id in self._jobs:
+                self._jobs[job_id][0].put((kind, payload))
+
+    def _worker_lost(self, worker):
+        """The worker's results pipe hit EOF: it has exited, taking its jobs with it."""
+        with self._lock:
+            if self._workers.get(worker.index) is worker:
+                del self._workers[worker.index]
+            for job_id in worker.jobs:
+                if job_id in self._jobs:
+                    self._jobs[job_id][0].put(("error", f"Inference worker {worker.index} (pid {worker.pid}) exited"))
+        worker.close()
+
+    def _submit(self, method, args, kwargs, report):
+        job_id = uuid.uuid4().hex
+        inbox = queue.Queue()
+        with self._lock:
+            # Normally immediate; only waits while every worker is being re-forked
+            self._worker_ready.wait_for(
+                lambda: self._failed or any(worker.ready for worker in self._workers.values()),
+                timeout=self.ready_timeout
+            )
+            ready = [worker for worker in self._workers.values() if worker.ready]
+            if not ready:
+                raise WorkerProcessError(self._failed or "No inference worker available")
+            worker = min(ready, key=lambda w: len(w.jobs))
+            worker.jobs.add(job_id)
+            self._jobs[job_id] = (inbox, worker)
+        try:
+            worker.send(("job", (job_id, method, args, kwargs, report is not None)))
+        except OSError as e:
+            inbox.put(("error", f"Inference worker {worker.index} is gone: {e}"))
+        return job_id, inbox
+
+    def _finish(self, job_id):
+        with self._lock:
+            _, worker = self._jobs.pop(job_id, (None, None))
+            if worker is not None:
+                worker.jobs.discard(job_id)
+
+    def _cancel(self, job_id):
+        with self._lock:
+            _, worker = self._jobs.get(job_id, (None, None))
+        if worker is not None:
+            try:
+                worker.send(("cancel_job", job_id))
+            except OSError:
+                pass  # already gone; its jobs are failed by _worker_lost
+
+    def _stream(self, method, args, kwargs, report=None, cancel=None):
+        """
+        Yield a remote call's items; its return value is set on StopIteration.
+
+        When `cancel` is set, or the caller closes this generator early, the worker
+        is told to stop the job and this waits until it has, so the calling thread
+        stays busy exactly as long as the worker is.
+        """
+        job_id, inbox = self._submit(method, args, kwargs, report)
+        finished = cancel_sent = False
+        try:
+            while True:
+                if cancel is not None and cancel.is_set() and not cancel_sent:
+                    self._cancel(job_id)
+                    cancel_sent = True
+                try:
+                    kind, payload = inbox.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if kind == "item":
+                    yield payload
+                    continue
+                finished = True
+                if kind == "done":
+                    value, remote_report = payload
+                    if report is not None and remote_report:
+                        report.update(remote_report)
+                    return value
+                raise WorkerProcessError(payload)
+        finally:
+            if not finished:
+                if not cancel_sent:
+                    self._cancel(job_id)
+                while inbox.get()[0] == "item":
+                    pass
+            self._finish(job_id)
+
+    def run_virtual_tryon(self, *args, report=None, **kwargs):
+        stream = self._stream("run_virtual_tryon", args, kwargs, report)
+        while True:
+            try:
+                next(stream)
+            except StopIteration as done:
+                return done.value
+
+    def iter_virtual_tryon(self, *args, report=None, cancel=None, **kwargs):
+        yield from self._stream("iter_virtual_tryon", args, kwargs, report, cancel)
+
+    def iter_rack_tryon(self, *args, report=None, cancel=None, **kwargs):
+        yield from self._stream("iter_rack_tryon", args, kwargs, report, cancel)
+
+    def garment_cache_key(self, product_id, image_url, height, width):
+        return GarmentCache.make_key(product_id, image_url, height, width, self.weight_dtype)
+
+    def has_garment(self, key):
+        # Latents are cached per worker, and any worker may take the job, so only
+        # the shared disk tier (GARMENT_CACHE_DIR) counts
+        return self.garment_cache.on_disk(key)
+
+    def invalidate_garment(self, product_id):
+        self.garment_cache.invalidate_product(product_id)
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.send(("invalidate_garment", str(product_id)))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            workers = [{"index": index, **stats} for index, stats in sorted(self._worker_stats.items())]
+        return {
+            "worker_processes": {"processes": self.processes, "restarts": self.restarts, "in_flight": len(self._jobs)},
+            "processes": workers,
+        }
+
+    def shutdown(self):
+        self._closing = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.send(None)
+            except OSError:
+                pass
+        self.zygote.join(timeout=10)
+        if self.zygote.is_alive():
+            self.zygote.terminate()
+            self.zygote.join(timeout=5)
+        self._reader.join(timeout=5)
+        for worker in workers:
+            worker.close()
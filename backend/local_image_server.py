@@ -0,0 +1,148 @@
+# Local Image Server
+# Stand-in for the Supabase public bucket when testing or benchmarking offline.
+# Serves files from a directory (or generated placeholder images) over plain HTTP,
+# with optional latency and failure injection to exercise timeouts and retries.
+#
+# Usage:
+#   python local_image_server.py --dir ./images --port 8765
+#
+#   with LocalImageServer(directory="images", fail_first=1) as server:
+#       url = server.url_for("shirt.png")
+
+import argparse
+import io
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
+
+
+def placeholder_png(name, size=(576, 768)):
+    """Deterministic solid-color PNG for names that don't exist on disk."""
+    from PIL import Image
+    rng = random.Random(name)
+    color = tuple(rng.randrange(256) for _ in range(3))
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LocalImageServer:
+    """
+    Threaded HTTP server serving images, for use as a context manager.
+
+    Args:
+        directory: folder to serve; unknown names get a generated placeholder PNG
+        latency: seconds to sleep before each response
+        fail_first: number of initial requests per path answered with HTTP 503
+        failure_rate: probability of answering any request with HTTP 503
+    """
+
+    def __init__(self, directory=None, host="127.0.0.1", port=0, latency=0.0, fail_first=0, failure_rate=0.0):
+        self.directory = directory
+        self.latency = latency
+        self.fail_first = fail_first
+        self.failure_rate = failure_rate
+        self.request_count = 0
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._placeholders = {}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real CDN
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, name):
+        return f"{self.base_url}/{name.lstrip('/')}"
+
+    def _should_fail(self, path):
+        with self._lock:
+            self.request_count += 1
+            failures = self._failures.get(path, 0)
+            if failures < self.fail_first:
+                self._failures[path] = failures + 1
+                return True
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+    def _load(self, path):
+        name = path.split("?", 1)[0].lstrip("/")
+        if self.directory:
+            file_path = os.path.normpath(os.path.join(self.directory, name))
+            if file_path.startswith(os.path.normpath(self.directory)) and os.path.isfile(file_path):
+                with open(file_path, "rb") as f:
+                    return f.read(), CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+        if name not in self._placeholders:
+            self._placeholders[name] = placeholder_png(name)
+        return self._placeholders[name], "image/png"
+
+    def _handle(self, handler):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self._should_fail(handler.path):
+            handler.send_response(503)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        body, content_type = self._load(handler.path)
+        handler.send_response(200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="local-image-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve images locally in place of the Supabase bucket")
+    parser.add_argument("--dir", default=None, help="Directory to serve (placeholders are generated otherwise)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = LocalImageServer(args.dir, port=args.port, latency=args.latency, failure_rate=args.failure_rate)
+    print(f"Serving images at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
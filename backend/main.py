@@ -1,21 +1,36 @@
 from fastapi import FastAPI, HTTPException, status, Depends, UploadFile, File, Form, Body
 from fastapi.middleware.cors import CORSMiddleware
-from database import users_collection, products_collection, categories_collection, tryon_history_collection
-from models import UserCreate, UserLogin, Token, UserResponse, UserInDB, UserUpdate, ChangePassword, ForgotPasswordRequest, ResetPasswordConfirm, ProductCreate, ProductUpdate, ProductResponse, CategoryResponse, TryOnRequest, TryOnResponse, TryOnHistoryResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
+from database import users_collection, products_collection, categories_collection, tryon_history_collection, tryon_results_collection
+from models import UserCreate, UserLogin, Token, UserResponse, UserInDB, UserUpdate, ChangePassword, ForgotPasswordRequest, ResetPasswordConfirm, ProductCreate, ProductUpdate, ProductResponse, CategoryResponse, TryOnRequest, TryOnResponse, TryOnHistoryResponse, TryOnJobResponse
 from bson import ObjectId
 # Keeping auth.py for legacy/token management if needed, but primarily moving to Supabase Auth check? 
 # The plan says "Authenticate via Supabase Auth". This usually means the frontend gets the token from Supabase.
 # But existing code has its own JWT. To avoid breaking everything too fast, I will focus on the SIGNUP part as requested.
 # The user can then login via Supabase on frontend, or we'll update login later.
 # For now, I will implement the SIGNUP that puts data into MongoDB and Supabase.
-from auth import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user, verify_password
+from auth import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user
+from password_hashing import get_password_hasher
 from datetime import datetime
-from fast_supabase import get_supabase
+from typing import List
+from storage import get_storage, StorageError, STORAGE_BACKEND, LOCAL_STORAGE_DIR
 import uuid
 import os
+import json
+import base64
+import asyncio
 import tempfile
 import time
-from catvton_tryon import CatVTONProcessor
+from model_manager import ModelManager, EngineUnavailableError
+from inference_profiles import INFERENCE_PROFILES, resolve_profile
+from tryon_previews import TRYON_PREVIEW_EVERY
+from tryon_jobs import InferenceWorkerPool, TryOnJobQueue, QueueFullError, create_job_store, TRYON_WORKER_PROCESSES
+from http_client import get_image_fetcher, ImageFetchError
+from result_cache import TryOnResultCache
+from result_encoding import EncodedResult, sniff_image_type
+from tryon_tracing import TryOnTrace, render_metrics
 import aiofiles
 
 from create_admin import create_default_admin
@@ -28,6 +43,11 @@ app = FastAPI()
 async def startup_event():
     await create_default_admin()
 
+# Serve locally stored uploads when running without Supabase
+if STORAGE_BACKEND == "local":
+    os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount("/storage", StaticFiles(directory=LOCAL_STORAGE_DIR), name="storage")
+
 # CORS
 origins = ["*"]
 app.add_middleware(
@@ -125,7 +145,7 @@ async def signup(
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    supabase = get_supabase()
+    storage = get_storage()
     
     # Generate a random ID for the user's storage folder since we aren't using Supabase Auth
     storage_uid = str(uuid.uuid4())
@@ -144,33 +164,24 @@ async def signup(
         file_content = await file.read()
         
         try:
-            supabase.storage.from_(bucket).upload(
-                file_path,
-                file_content,
-                {"content-type": file.content_type}
-            )
-            
-            # Get Public URL
-            public_url = supabase.storage.from_(bucket).get_public_url(file_path)
-            return public_url
+            # Returns the Public URL
+            return await storage.upload(bucket, file_path, file_content, file.content_type)
 
-        except Exception as e:
+        except StorageError as e:
             print(f"Upload failed: {e}")
             return None
 
-    if profile_image:
-        profile_image_url = await upload_image(profile_image, "user-images", "profile-images")
-    
-    if tryon_image:
-        tryon_image_url = await upload_image(tryon_image, "user-images", "try-on-images")
-
-    from auth import get_password_hash
+    # Both images upload concurrently
+    profile_image_url, tryon_image_url = await asyncio.gather(
+        upload_image(profile_image, "user-images", "profile-images"),
+        upload_image(tryon_image, "user-images", "try-on-images")
+    )
 
     # 3. Store in MongoDB with Hashed Password
     new_user = UserInDB(
         full_name=full_name,
         email=email,
-        password=get_password_hash(password), # Hash the password
+        password=await get_password_hasher().hash(password), # Hash the password
         phone=phone,
         gender=gender,
         height=height,
@@ -207,14 +218,21 @@ async def login(user_credentials: UserLogin):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verify Password (passlib handles the hash comparison)
+    # Verify Password (passlib handles the hash comparison, off the event loop)
     # Since we are now Mongo-only, we expect ALL valid users to have a password hash in Mongo.
-    if "password" not in user or not verify_password(user_credentials.password, user["password"]):
+    valid, new_hash = False, None
+    if "password" in user:
+        valid, new_hash = await get_password_hasher().verify_and_update(user_credentials.password, user["password"])
+    if not valid:
          raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Stored with an outdated bcrypt cost: replace it now that we have the plain password
+    if new_hash:
+        await users_collection.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
     
     if not user.get("is_active", True):
          raise HTTPException(
@@ -303,12 +321,12 @@ async def update_user_me(user_update: UserUpdate, current_user: dict = Depends(g
 
 @app.post("/users/change-password")
 async def change_password(password_data: ChangePassword, current_user: dict = Depends(get_current_user)):
-    from auth import get_password_hash, verify_password
-    
-    if not verify_password(password_data.old_password, current_user["password"]):
+    hasher = get_password_hasher()
+
+    if not await hasher.verify(password_data.old_password, current_user["password"]):
          raise HTTPException(status_code=400, detail="Incorrect old password")
          
-    new_hash = get_password_hash(password_data.new_password)
+    new_hash = await hasher.hash(password_data.new_password)
     
     await users_collection.update_one(
         {"_id": current_user["_id"]},
@@ -341,8 +359,6 @@ async def verify_email(request: ForgotPasswordRequest):
 @app.post("/reset-password-direct")
 async def reset_password_direct(reset_data: ResetPasswordConfirm):
     """Reset password directly after email verification"""
-    from auth import get_password_hash
-    
     # Validate passwords match
     if reset_data.new_password != reset_data.confirm_password:
         raise HTTPException(
@@ -360,7 +376,7 @@ async def reset_password_direct(reset_data: ResetPasswordConfirm):
         )
     
     # Update password
-    new_hash = get_password_hash(reset_data.new_password)
+    new_hash = await get_password_hasher().hash(reset_data.new_password)
     
     await users_collection.update_one(
         {"_id": user["_id"]},
@@ -371,19 +387,13 @@ async def reset_password_direct(reset_data: ResetPasswordConfirm):
 
 # New Helper for Uploads
 async def upload_file_to_supabase(file: UploadFile, bucket: str, path_prefix: str):
-    supabase = get_supabase()
     file_ext = file.filename.split(".")[-1]
     file_path = f"{path_prefix}/{uuid.uuid4()}.{file_ext}"
     file_content = await file.read()
     
     try:
-        supabase.storage.from_(bucket).upload(
-            file_path,
-            file_content,
-            {"content-type": file.content_type}
-        )
-        return supabase.storage.from_(bucket).get_public_url(file_path)
-    except Exception as e:
+        return await get_storage().upload(bucket, file_path, file_content, file.content_type)
+    except StorageError as e:
         print(f"Upload Error: {e}")
         return None
 
@@ -531,6 +541,8 @@ async def update_product(
         image_url = await upload_file_to_supabase(image, "user-images", "products/updated")
         if image_url:
              update_data["image_url"] = image_url
+             # Cached garment tensors/latents and try-on results belong to the old image
+             await invalidate_product_caches(product_id)
 
     # 2. Collect other fields
     if name is not None: update_data["name"] = name
@@ -566,6 +578,7 @@ async def delete_product(product_id: str):
     result = await products_collection.delete_one({"_id": ObjectId(product_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await invalidate_product_caches(product_id)
     return {"message": "Product deleted successfully"}
 
 @app.put("/admin/products/{product_id}/status")
@@ -665,163 +678,730 @@ async def delete_category(category_id: str):
 # VIRTUAL TRY-ON ENDPOINTS
 # --------------------------------------------------------------------------------
 
-# CatVTON Processor (Diffusion-based, better quality than CP-VTON+)
-CAT_PROCESSOR = CatVTONProcessor()
+def create_tryon_processor():
+    # Imported here so API-only replicas never import torch/diffusers
+    if TRYON_WORKER_PROCESSES > 0:
+        from inference_processes import ForkedProcessorPool
+        return ForkedProcessorPool(TRYON_WORKER_PROCESSES)
+    from catvton_tryon import CatVTONProcessor
+    return CatVTONProcessor()
+
+# CatVTON Processor (Diffusion-based, better quality than CP-VTON+),
+# loaded eagerly, in the background, lazily or not at all (TRYON_ENGINE_MODE)
+MODEL_MANAGER = ModelManager(create_tryon_processor)
+
+# Inference runs on its own bounded pool so diffusion never blocks the event loop
+INFERENCE_POOL = InferenceWorkerPool()
+JOB_QUEUE = TryOnJobQueue(create_job_store(), INFERENCE_POOL)
+
+# Identical earlier try-ons (same photo, garment image and parameters), in MongoDB
+RESULT_CACHE = TryOnResultCache(tryon_results_collection)
+
+TRYON_RACK_MAX_ITEMS = int(os.getenv("TRYON_RACK_MAX_ITEMS", 10))
+
+@app.on_event("startup")
+async def start_tryon_engine():
+    MODEL_MANAGER.start()
+    await RESULT_CACHE.ensure_indexes()
+    await JOB_QUEUE.start()
+
+@app.on_event("shutdown")
+async def shutdown_inference_pool():
+    JOB_QUEUE.stop()
+    INFERENCE_POOL.shutdown()
+    MODEL_MANAGER.shutdown()
+    await get_image_fetcher().aclose()
+    await get_storage().drain()
+    get_storage().shutdown()
+    get_password_hasher().shutdown()
+
+
+def get_tryon_processor():
+    """Return the loaded processor or fail the request with 503."""
+    try:
+        return MODEL_MANAGER.get()
+    except EngineUnavailableError as e:
+        retry = e.state in ("not_loaded", "loading", "warming_up")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"} if retry else None,
+        )
+
+
+async def invalidate_product_caches(product_id: str):
+    await RESULT_CACHE.invalidate_product(product_id)
+    # Nothing is cached in the engine until it has loaded
+    processor = MODEL_MANAGER.processor
+    if processor:
+        processor.invalidate_garment(product_id)
+
+
+@app.get("/health")
+def liveness():
+    """Liveness: the API process is up, regardless of model state."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def readiness():
+    """
+    Readiness: the replica can serve all of its routes.
+
+    API-only replicas (TRYON_ENGINE_MODE=disabled) are ready immediately;
+    inference replicas only once the engine has loaded.
+    """
+    engine = MODEL_MANAGER.status()
+    is_ready = MODEL_MANAGER.ready or MODEL_MANAGER.mode == "disabled"
+    if not is_ready:
+        return JSONResponse(status_code=503, content={"status": "not_ready", "engine": engine})
+    return {"status": "ready", "engine": engine}
+
+
+@app.get("/api/tryon/profiles")
+def list_inference_profiles():
+    """Available inference profiles (steps, scheduler, guidance, resolution)."""
+    return [p._asdict() for p in INFERENCE_PROFILES.values()]
+
+
+@app.get("/admin/tryon/stats")
+async def get_tryon_stats():
+    """Inference queue occupancy, engine state, achieved micro-batch sizes, cache hit rates, per-step timings and memory (per worker process, if any)."""
+    processor = MODEL_MANAGER.processor
+    return {
+        "engine": MODEL_MANAGER.status(),
+        "queue": {
+            "in_flight": INFERENCE_POOL.in_flight,
+            "capacity": INFERENCE_POOL.capacity,
+            "workers": INFERENCE_POOL.max_workers,
+        },
+        "result_cache": RESULT_CACHE.stats(),
+        **(processor.stats() if processor else {}),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Per-stage and end-to-end try-on latency histograms, in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+async def get_tryon_product(product_id: str):
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(status_code=400, detail="Invalid product ID")
+
+    product = await products_collection.find_one({"_id": ObjectId(product_id)})
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    if not product.get("image_url"):
+        raise HTTPException(status_code=400, detail="Product has no image")
+
+    return product
+
+
+def get_inference_profile(profile_name: str, current_user: dict):
+    """Requested profile, or the user's default from their quality settings."""
+    try:
+        return resolve_profile(profile_name, current_user)
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profile '{profile_name}'. Available: {', '.join(INFERENCE_PROFILES)}"
+        )
+
+
+async def fetch_garment(processor, product: dict, height: int, width: int):
+    """
+    Resolve the garment for a product at a resolution.
+
+    Returns (garment_cache_key, garment): the downloaded image bytes, or the image
+    URL when its latent is already cached. The engine downloads the URL itself if the
+    entry is evicted before the try-on runs (see CatVTONProcessor.prepare_garment).
+    """
+    garment_key = processor.garment_cache_key(product['_id'], product['image_url'], height, width)
+    if processor.has_garment(garment_key):
+        return garment_key, product['image_url']
+
+    try:
+        garment = await get_image_fetcher().fetch(product['image_url'])
+    except ImageFetchError as e:
+        print(f"Garment download failed: {e}")
+        raise HTTPException(status_code=502, detail="Failed to download product image")
+    return garment_key, garment
+
+
+def upload_tryon_original(content: bytes, user_id_str: str):
+    """
+    Upload the user's original photo in the background and return its URL.
+
+    The original is non-critical, so the response does not wait for it. If the upload
+    fails, the URL is cleared from any record already saved with it (see remember_tryon
+    for records saved later).
+    """
+    content_type, extension = sniff_image_type(content)
+    original_path = f"tryon-originals/{user_id_str}/{uuid.uuid4()}.{extension}"
+    return get_storage().upload_in_background(
+        "user-images", original_path, content, content_type, on_failure=drop_failed_original
+    )
+
+
+async def drop_failed_original(url: str):
+    """The original photo at `url` was never stored: stop history records and cached results pointing at it."""
+    await tryon_history_collection.update_many({"original_image_url": url}, {"$set": {"original_image_url": None}})
+    await RESULT_CACHE.forget_original(url)
+
+
+async def upload_tryon_result(result: EncodedResult, user_id_str: str, trace: TryOnTrace):
+    """Upload the result image and its thumbnail in parallel; returns (result_url, thumbnail_url)."""
+    name = f"tryon-results/{user_id_str}/{uuid.uuid4()}"
+    storage = get_storage()
+
+    async def upload(stage: str, path: str, encoded):
+        with trace.span(stage):
+            return await storage.upload("user-images", path, encoded.data, encoded.content_type)
+
+    try:
+        result_url, thumbnail_url = await asyncio.gather(
+            upload("upload_result", f"{name}.{result.image.extension}", result.image),
+            upload("upload_thumbnail", f"{name}_thumb.{result.thumbnail.extension}", result.thumbnail),
+        )
+    except StorageError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save result: {str(e)}")
+    return result_url, thumbnail_url
+
+
+def tryon_output_metadata(result: EncodedResult) -> dict:
+    return {
+        "content_type": result.image.content_type,
+        "bytes": len(result.image.data),
+        "thumbnail_bytes": len(result.thumbnail.data),
+    }
+
+
+async def run_tryon_pipeline(content: bytes, product: dict, current_user: dict, profile, on_start=None):
+    """
+    Run the full try-on for one user image and product.
+
+    Downloads the garment, runs CatVTON on the inference pool and uploads the
+    original and result images. Returns the fields to store on the history record.
+    `on_start` is called once an inference worker starts the run.
+    """
+    start_time = time.time()
+    trace = TryOnTrace()
+    processor = get_tryon_processor()
+
+    # 1. Download garment image from Supabase, unless its latent is already cached
+    with trace.span("garment_fetch"):
+        garment_key, garment = await fetch_garment(processor, product, profile.height, profile.width)
+
+    # 2. Process virtual try-on using CatVTON on the inference pool.
+    #    Images are decoded straight from memory, no temp files.
+    run_report = {}
+    try:
+        result = await INFERENCE_POOL.run(
+            processor.run_virtual_tryon,
+            user_image=content,
+            garment_image=garment,
+            product_name=product.get('name', 'clothing item'),
+            product_category=product.get('category', 'Dress'),
+            num_inference_steps=profile.num_inference_steps,
+            guidance_scale=profile.guidance_scale,
+            height=profile.height,
+            width=profile.width,
+            scheduler=profile.scheduler,
+            garment_cache_key=garment_key,
+            tryon_type=product.get('tryon_type'),
+            report=run_report,
+            on_start=on_start
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Virtual try-on processing failed: {str(e)}"
+        )
+
+    if result is None:
+        raise HTTPException(status_code=500, detail="Virtual try-on processing failed")
+
+    # 3. Upload original and result images to storage
+    return await store_tryon_images(content, result, current_user, profile, start_time, trace, run_report)
+
+
+async def store_tryon_images(
+    content: bytes, result: EncodedResult, current_user: dict, profile, start_time: float,
+    trace: TryOnTrace, run_report: dict = None
+):
+    """
+    Upload the original (in the background), the result and its thumbnail in parallel; return the history fields.
+
+    `run_report` holds what the processor measured during the run (memory mode, peak RSS,
+    stage spans). The request's spans are stored as a per-stage breakdown (ms) and
+    recorded in the /metrics histograms.
+    """
+    run_report = dict(run_report or {})
+    trace.extend(run_report.pop("stages", []))
+
+    user_id_str = str(current_user['_id'])
+    original_url = upload_tryon_original(content, user_id_str)
+    result_url, thumbnail_url = await upload_tryon_result(result, user_id_str, trace)
+
+    processing_time = time.time() - start_time
+    trace.observe(processing_time)
+    return {
+        "original_image_url": original_url,
+        "result_image_url": result_url,
+        "thumbnail_url": thumbnail_url,
+        "processing_time": processing_time,
+        "metadata": {
+            "model_used": "CatVTON-Diffusion",
+            "api_provider": "local",
+            "profile": profile._asdict(),
+            "output": tryon_output_metadata(result),
+            "memory": run_report or None,
+            "stages": trace.breakdown()
+        }
+    }
+
+
+async def save_tryon_record(product: dict, current_user: dict, fields: dict):
+    """Insert a completed try-on into the history and return the stored record."""
+    tryon_record = {
+        "user_id": current_user['_id'],
+        "product_id": product['_id'],
+        "product_name": product.get('name', 'Unknown'),
+        "product_category": product.get('category', 'Unknown'),
+        "status": "completed",
+        "created_at": datetime.utcnow(),
+        **fields
+    }
+
+    result = await tryon_history_collection.insert_one(tryon_record)
+    tryon_record["_id"] = result.inserted_id
+    return tryon_record
+
+
+def tryon_cache_key(content: bytes, product: dict, current_user: dict, profile) -> str:
+    return RESULT_CACHE.make_key(current_user['_id'], RESULT_CACHE.person_hash(content), product, profile)
+
+
+async def find_cached_tryon(cache_key: str, product: dict, current_user: dict):
+    """
+    History record of an identical earlier try-on by this user, or None.
+
+    If the user has since deleted that record, it is recreated from the cached result.
+    """
+    entry = await RESULT_CACHE.get(cache_key)
+    if entry is None:
+        return None
+
+    record = await tryon_history_collection.find_one({"_id": entry["tryon_id"], "user_id": current_user['_id']})
+    if record is None:
+        record = await save_tryon_record(product, current_user, entry["fields"])
+        await remember_tryon(cache_key, record)
+    return record
+
+
+async def remember_tryon(cache_key: str, record: dict):
+    """
+    Add a saved try-on to the result cache.
+
+    Its original photo may still be uploading. If that upload already failed, the
+    failure handler only cleared what existed then, so clear this record's URL now.
+    """
+    await RESULT_CACHE.put(cache_key, record)
+    original_url = record.get("original_image_url")
+    if original_url and get_storage().upload_failed(original_url):
+        await drop_failed_original(original_url)
+        record["original_image_url"] = None
+
+
+def tryon_record_to_response(item: dict) -> TryOnResponse:
+    return TryOnResponse(
+        id=str(item['_id']),
+        user_id=str(item['user_id']),
+        product_id=str(item['product_id']),
+        product_name=item.get('product_name', 'Unknown'),
+        product_category=item.get('product_category', 'Unknown'),
+        original_image_url=item.get('original_image_url') or '',
+        result_image_url=item.get('result_image_url') or '',
+        thumbnail_url=item.get('thumbnail_url'),
+        processing_time=item.get('processing_time', 0.0),
+        status=item.get('status', 'completed'),
+        created_at=item.get('created_at', datetime.utcnow())
+    )
+
+
+def tryon_queue_full_error(e: QueueFullError):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Try-on service is busy, please retry shortly",
+        headers={"Retry-After": "10"},
+    )
+
 
 @app.post("/api/tryon/process", response_model=TryOnResponse)
 async def process_virtual_tryon(
     user_image: UploadFile = File(...),
     product_id: str = Form(...),
+    profile: str = Form(None),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Process virtual try-on request
+    Process virtual try-on request and wait for the result
     
     Args:
         user_image: User's full-body photo
         product_id: ID of the product to try on
+        profile: Inference profile (preview, fast, standard, hq); defaults from user settings
         current_user: Authenticated user
         
     Returns:
         TryOnResponse with result image URL
     """
-    start_time = time.time()
-    temp_user_image = None
-    temp_garment_image = None
-    temp_result_image = None
-    
     try:
-        # Using ONNX + OpenCV pipeline
-        
         # 1. Fetch product details
-        product = await products_collection.find_one({"_id": ObjectId(product_id)})
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
-        if not product.get("image_url"):
-            raise HTTPException(status_code=400, detail="Product has no image")
-        
-        # 2. Save user image temporarily
-        temp_user_image = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
+        inference_profile = get_inference_profile(profile, current_user)
+        product = await get_tryon_product(product_id)
         content = await user_image.read()
-        async with aiofiles.open(temp_user_image.name, 'wb') as f:
-            await f.write(content)
-        
-        # 3. Download garment image from Supabase
-        temp_garment_image = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        # For now, we'll use a simple approach - in production, download from URL
-        # This is a placeholder - you'd actually download the image from product['image_url']
-        import requests
-        garment_response = requests.get(product['image_url'])
-        if garment_response.status_code == 200:
-            async with aiofiles.open(temp_garment_image.name, 'wb') as f:
-                await f.write(garment_response.content)
-        else:
-            raise HTTPException(status_code=500, detail="Failed to download product image")
-        
-        # 4. Process virtual try-on using CatVTON
-        processor = CAT_PROCESSOR
-        
-        try:
-            # Check user preferences for Quality
-            hq_mode = current_user.get('hq_rendering', True) # Default to True now for better quality
-            
-            target_h = 1024 if hq_mode else 768
-            target_w = 768 if hq_mode else 576
-
-            result_image_bytes = await processor.process_virtual_tryon(
-                user_image_path=temp_user_image.name,
-                garment_image_path=temp_garment_image.name,
-                product_name=product.get('name', 'clothing item'),
-                product_category=product.get('category', 'Dress'),
-                height=target_h,
-                width=target_w
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Virtual try-on processing failed: {str(e)}"
-            )
-        
-        # 5. Upload user's original image to Supabase
-        supabase = get_supabase()
-        user_id_str = str(current_user['_id'])
-        
-        # Upload original image
-        original_path = f"tryon-originals/{user_id_str}/{uuid.uuid4()}.jpg"
-        try:
-            supabase.storage.from_("user-images").upload(
-                original_path,
-                content,
-                {"content-type": "image/jpeg"}
-            )
-            original_url = supabase.storage.from_("user-images").get_public_url(original_path)
-        except Exception as e:
-            print(f"Failed to upload original image: {e}")
-            original_url = None
-        
-        # 8. Upload result image to Supabase
-        result_path = f"tryon-results/{user_id_str}/{uuid.uuid4()}.jpg"
+
+        # 2. Return the earlier result if this exact try-on has been run before
+        cache_key = tryon_cache_key(content, product, current_user, inference_profile)
+        cached_record = await find_cached_tryon(cache_key, product, current_user)
+        if cached_record:
+            return tryon_record_to_response(cached_record)
+
+        # 3. Run the try-on, holding a slot in the inference queue
         try:
-            supabase.storage.from_("user-images").upload(
-                result_path,
-                result_image_bytes,
-                {"content-type": "image/jpeg"}
-            )
-            result_url = supabase.storage.from_("user-images").get_public_url(result_path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save result: {str(e)}")
-        
-        # 9. Calculate processing time
-        processing_time = time.time() - start_time
-        
-        # 10. Save to database
-        tryon_record = {
-            "user_id": current_user['_id'],
-            "product_id": ObjectId(product_id),
-            "product_name": product.get('name', 'Unknown'),
-            "product_category": product.get('category', 'Unknown'),
-            "original_image_url": original_url,
-            "result_image_url": result_url,
-            "processing_time": processing_time,
-            "status": "completed",
-            "created_at": datetime.utcnow(),
-            "metadata": {
-                "model_used": "CatVTON-Diffusion",
-                "api_provider": "local"
-            }
-        }
+            with INFERENCE_POOL.slot():
+                fields = await run_tryon_pipeline(content, product, current_user, inference_profile)
+        except QueueFullError as e:
+            raise tryon_queue_full_error(e)
+
+        # 4. Save to database
+        tryon_record = await save_tryon_record(product, current_user, fields)
+        await remember_tryon(cache_key, tryon_record)
         
-        result = await tryon_history_collection.insert_one(tryon_record)
-        
-        # 11. Return response
-        return TryOnResponse(
-            id=str(result.inserted_id),
-            user_id=user_id_str,
-            product_id=product_id,
-            product_name=product.get('name', 'Unknown'),
-            product_category=product.get('category', 'Unknown'),
-            original_image_url=original_url or "",
-            result_image_url=result_url,
-            processing_time=processing_time,
-            status="completed",
-            created_at=tryon_record['created_at']
-        )
+        # 5. Return response
+        return tryon_record_to_response(tryon_record)
         
     except HTTPException:
         raise
     except Exception as e:
         print(f"Unexpected error in virtual try-on: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    
-    finally:
-        # Cleanup temporary files
-        for temp_file in [temp_user_image, temp_garment_image, temp_result_image]:
-            if temp_file and os.path.exists(temp_file.name):
+
+
+@app.post("/api/tryon/process/stream")
+async def process_virtual_tryon_stream(
+    user_image: UploadFile = File(...),
+    product_id: str = Form(...),
+    profile: str = Form(None),
+    preview_every: int = Form(TRYON_PREVIEW_EVERY),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Process a virtual try-on, streaming progress as Server-Sent Events.
+
+    Events:
+        preview: {"step", "total", "image": JPEG data URL} every `preview_every` steps
+        result:  the TryOnResponse, once the result is stored
+        error:   {"detail"} if the try-on fails
+
+    A repeat of an earlier try-on sends only the `result` event.
+    """
+    inference_profile = get_inference_profile(profile, current_user)
+    product = await get_tryon_product(product_id)
+    content = await user_image.read()
+
+    def sse(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+    cache_key = tryon_cache_key(content, product, current_user, inference_profile)
+    cached_record = await find_cached_tryon(cache_key, product, current_user)
+    if cached_record:
+        async def cached_event():
+            yield sse("result", tryon_record_to_response(cached_record))
+        return StreamingResponse(cached_event(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    processor = get_tryon_processor()
+    # Reject overload up front; the slot itself is reserved by INFERENCE_POOL.stream
+    # once the response body runs, and held until denoising stops on its worker
+    try:
+        INFERENCE_POOL.check_capacity()
+    except QueueFullError as e:
+        raise tryon_queue_full_error(e)
+
+    async def stream_events():
+        try:
+            start_time = time.time()
+            trace = TryOnTrace()
+            with trace.span("garment_fetch"):
+                garment_key, garment = await fetch_garment(
+                    processor, product, inference_profile.height, inference_profile.width
+                )
+
+            result = None
+            run_report = {}
+            async for kind, payload in INFERENCE_POOL.stream(
+                processor.iter_virtual_tryon,
+                content,
+                garment,
+                num_inference_steps=inference_profile.num_inference_steps,
+                guidance_scale=inference_profile.guidance_scale,
+                height=inference_profile.height,
+                width=inference_profile.width,
+                scheduler=inference_profile.scheduler,
+                garment_cache_key=garment_key,
+                preview_every=max(0, preview_every),
+                tryon_type=product.get('tryon_type'),
+                report=run_report
+            ):
+                if kind == "preview":
+                    image_b64 = base64.b64encode(payload["image"]).decode()
+                    yield sse("preview", {
+                        "step": payload["step"],
+                        "total": payload["total"],
+                        "image": f"data:image/jpeg;base64,{image_b64}"
+                    })
+                else:
+                    result = payload
+
+            fields = await store_tryon_images(content, result, current_user, inference_profile, start_time, trace, run_report)
+            tryon_record = await save_tryon_record(product, current_user, fields)
+            await remember_tryon(cache_key, tryon_record)
+            yield sse("result", tryon_record_to_response(tryon_record))
+
+        except QueueFullError as e:
+            # The pool filled up between the capacity check and the body starting
+            yield sse("error", {"detail": tryon_queue_full_error(e).detail})
+        except HTTPException as e:
+            yield sse("error", {"detail": e.detail})
+        except Exception as e:
+            print(f"Unexpected error in streamed try-on: {str(e)}")
+            yield sse("error", {"detail": f"Virtual try-on processing failed: {str(e)}"})
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/tryon/jobs", response_model=TryOnJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_tryon_job(
+    user_image: UploadFile = File(...),
+    product_id: str = Form(...),
+    profile: str = Form(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a virtual try-on and return its job id immediately.
+
+    Poll `GET /api/tryon/jobs/{job_id}` for the result. A repeat of an earlier try-on
+    returns that try-on as an already completed job, with its result; it can be polled
+    like any other job.
+    """
+    inference_profile = get_inference_profile(profile, current_user)
+    product = await get_tryon_product(product_id)
+    content = await user_image.read()
+
+    cache_key = tryon_cache_key(content, product, current_user, inference_profile)
+    cached_record = await find_cached_tryon(cache_key, product, current_user)
+    if cached_record:
+        return TryOnJobResponse(
+            job_id=await JOB_QUEUE.add_completed(cached_record),
+            status="completed",
+            product_id=product_id,
+            created_at=cached_record.get("created_at", datetime.utcnow()),
+            result=tryon_record_to_response(cached_record)
+        )
+
+    # Fail fast instead of queueing work a replica without a loaded engine can't run
+    get_tryon_processor()
+
+    job_record = {
+        "user_id": current_user['_id'],
+        "product_id": ObjectId(product_id),
+        "product_name": product.get('name', 'Unknown'),
+        "product_category": product.get('category', 'Unknown'),
+        "original_image_url": "",
+        "result_image_url": "",
+        "processing_time": 0.0,
+        "created_at": datetime.utcnow(),
+    }
+
+    async def cache_job_result(job_id: str, fields: dict):
+        # Only Mongo-backed jobs are history records (TRYON_JOB_STORE=mongo)
+        if ObjectId.is_valid(job_id):
+            await remember_tryon(cache_key, {**job_record, **fields, "_id": ObjectId(job_id)})
+
+    try:
+        job_id = await JOB_QUEUE.submit(
+            job_record,
+            lambda on_start: run_tryon_pipeline(content, product, current_user, inference_profile, on_start),
+            on_complete=cache_job_result
+        )
+    except QueueFullError as e:
+        raise tryon_queue_full_error(e)
+
+    return TryOnJobResponse(
+        job_id=job_id,
+        status="queued",
+        product_id=product_id,
+        created_at=job_record["created_at"]
+    )
+
+
+@app.get("/api/tryon/jobs/{job_id}", response_model=TryOnJobResponse)
+async def get_tryon_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get the status of a queued try-on, including the result once completed."""
+    job = await JOB_QUEUE.get(job_id)
+    if not job or job.get("user_id") != current_user['_id']:
+        raise HTTPException(status_code=404, detail="Try-on job not found")
+
+    job_status = job.get("status", "queued")
+    return TryOnJobResponse(
+        job_id=job_id,
+        status=job_status,
+        product_id=str(job["product_id"]),
+        created_at=job.get("created_at", datetime.utcnow()),
+        error=job.get("error"),
+        result=tryon_record_to_response(job) if job_status == "completed" else None
+    )
+
+
+@app.post("/api/tryon/rack")
+async def process_rack_tryon(
+    user_image: UploadFile = File(...),
+    product_ids: List[str] = Form(...),
+    profile: str = Form(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Try several products on one photo ("try-on a rack").
+
+    The person image is uploaded, masked and encoded once and the garments reuse it.
+    Results stream back as newline-delimited JSON, one line per product as it finishes:
+    `{"index", "product_id", "status", "result" | "error"}`.
+    """
+    # Accept both repeated form fields and a single comma-separated value
+    product_ids = [pid.strip() for value in product_ids for pid in value.split(",") if pid.strip()]
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="No products provided")
+    if len(product_ids) > TRYON_RACK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {TRYON_RACK_MAX_ITEMS} products per rack")
+
+    inference_profile = get_inference_profile(profile, current_user)
+    products = [await get_tryon_product(pid) for pid in product_ids]
+    content = await user_image.read()
+
+    # Products this photo has already been tried with are answered from the result cache
+    person_hash = RESULT_CACHE.person_hash(content)
+    cache_keys = [RESULT_CACHE.make_key(current_user['_id'], person_hash, p, inference_profile) for p in products]
+    cached_records = [await find_cached_tryon(key, p, current_user) for key, p in zip(cache_keys, products)]
+    pending = [index for index, record in enumerate(cached_records) if record is None]
+
+    if pending:
+        processor = get_tryon_processor()
+        # Reject overload up front; the slot itself is reserved by INFERENCE_POOL.stream
+        # once the response body runs, and held until the rack finishes on its worker
+        try:
+            INFERENCE_POOL.check_capacity()
+        except QueueFullError as e:
+            raise tryon_queue_full_error(e)
+
+        start_time = time.time()
+        trace = TryOnTrace()
+        user_id_str = str(current_user['_id'])
+
+        # Download uncached garments concurrently over the shared client
+        with trace.span("garment_fetch"):
+            fetched = await asyncio.gather(*[
+                fetch_garment(processor, products[i], inference_profile.height, inference_profile.width) for i in pending
+            ])
+        garments = [
+            (garment, garment_key, products[i].get('tryon_type'))
+            for (garment_key, garment), i in zip(fetched, pending)
+        ]
+
+        original_url = upload_tryon_original(content, user_id_str)
+
+    async def stream_results():
+        for index, record in enumerate(cached_records):
+            if record is not None:
+                line = {"index": index, "product_id": product_ids[index], "status": "completed",
+                        "result": tryon_record_to_response(record)}
+                yield json.dumps(jsonable_encoder(line)) + "\n"
+        if not pending:
+            return
+
+        def fail_remaining(detail):
+            for index in pending:
+                if index not in streamed:
+                    line = {"index": index, "product_id": product_ids[index], "status": "failed", "error": detail}
+                    yield json.dumps(jsonable_encoder(line)) + "\n"
+
+        rack_report = {}
+        streamed = set()
+        try:
+            async for garment_index, result in INFERENCE_POOL.stream(
+                processor.iter_rack_tryon,
+                content,
+                garments,
+                num_inference_steps=inference_profile.num_inference_steps,
+                guidance_scale=inference_profile.guidance_scale,
+                height=inference_profile.height,
+                width=inference_profile.width,
+                scheduler=inference_profile.scheduler,
+                report=rack_report
+            ):
+                index = pending[garment_index]
+                product = products[index]
+                line = {"index": index, "product_id": product_ids[index]}
                 try:
-                    os.unlink(temp_file.name)
-                except:
-                    pass
+                    if result is None:
+                        raise HTTPException(status_code=500, detail="Virtual try-on processing failed")
+
+                    result_url, thumbnail_url = await upload_tryon_result(result, user_id_str, trace)
+                    tryon_record = await save_tryon_record(product, current_user, {
+                        "original_image_url": original_url,
+                        "result_image_url": result_url,
+                        "thumbnail_url": thumbnail_url,
+                        "processing_time": time.time() - start_time,
+                        "metadata": {
+                            "model_used": "CatVTON-Diffusion",
+                            "api_provider": "local",
+                            "profile": inference_profile._asdict(),
+                            "output": tryon_output_metadata(result),
+                            "rack_size": len(products)
+                        }
+                    })
+                    await remember_tryon(cache_keys[index], tryon_record)
+                    line.update(status="completed", result=tryon_record_to_response(tryon_record))
+                except HTTPException as e:
+                    line.update(status="failed", error=e.detail)
+
+                streamed.add(index)
+                yield json.dumps(jsonable_encoder(line)) + "\n"
+
+            # The person's stages are shared by every garment, so the rack only feeds the histograms
+            trace.extend(rack_report.get("stages", []))
+            trace.observe()
+        except QueueFullError as e:
+            # The pool filled up between the capacity check and the body starting
+            for line in fail_remaining(tryon_queue_full_error(e).detail):
+                yield line
+        except Exception as e:
+            # Close the stream with a line for every garment still waiting, rather than truncating it
+            print(f"Unexpected error in rack try-on: {str(e)}")
+            for line in fail_remaining(f"Virtual try-on processing failed: {str(e)}"):
+                yield line
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 
 @app.get("/api/tryon/history", response_model=TryOnHistoryResponse)
@@ -842,34 +1422,20 @@ async def get_tryon_history(
         TryOnHistoryResponse with list of try-on results
     """
     try:
+        # Queued, processing and failed jobs share the collection; only finished
+        # try-ons (and older records without a status) belong in the history
+        history_query = {"user_id": current_user['_id'], "status": {"$in": ["completed", None]}}
+
         # Get total count
-        total_count = await tryon_history_collection.count_documents(
-            {"user_id": current_user['_id']}
-        )
+        total_count = await tryon_history_collection.count_documents(history_query)
         
         # Get history items
-        cursor = tryon_history_collection.find(
-            {"user_id": current_user['_id']}
-        ).sort("created_at", -1).skip(skip).limit(limit)
+        cursor = tryon_history_collection.find(history_query).sort("created_at", -1).skip(skip).limit(limit)
         
         items = await cursor.to_list(length=limit)
         
         # Convert to response models
-        tryon_items = [
-            TryOnResponse(
-                id=str(item['_id']),
-                user_id=str(item['user_id']),
-                product_id=str(item['product_id']),
-                product_name=item.get('product_name', 'Unknown'),
-                product_category=item.get('product_category', 'Unknown'),
-                original_image_url=item.get('original_image_url', ''),
-                result_image_url=item.get('result_image_url', ''),
-                processing_time=item.get('processing_time', 0.0),
-                status=item.get('status', 'completed'),
-                created_at=item.get('created_at', datetime.utcnow())
-            )
-            for item in items
-        ]
+        tryon_items = [tryon_record_to_response(item) for item in items]
         
         return TryOnHistoryResponse(
             items=tryon_items,
@@ -958,20 +1524,13 @@ async def remove_product_background(
         temp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
         await remove_background(temp_input.name, temp_output.name)
         
-        # Upload to Supabase
-        supabase = get_supabase()
+        # Upload to storage
         output_path = f"products/no-bg/{uuid.uuid4()}.png"
         
         async with aiofiles.open(temp_output.name, 'rb') as f:
             output_content = await f.read()
         
-        supabase.storage.from_("user-images").upload(
-            output_path,
-            output_content,
-            {"content-type": "image/png"}
-        )
-        
-        result_url = supabase.storage.from_("user-images").get_public_url(output_path)
+        result_url = await get_storage().upload("user-images", output_path, output_content, "image/png")
         
         return {
             "message": "Background removed successfully",
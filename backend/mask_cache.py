@@ -0,0 +1,118 @@
+# Mask Cache
+# Content-addressed cache for the person-side masking results (pose keypoints,
+# rembg silhouette and the final try-on mask). Users usually try several products on
+# the same photo, so repeat requests can skip YOLO and rembg entirely.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+from disk_cache import DiskCacheBudget
+
+load_dotenv()
+
+MASK_CACHE_SIZE = int(os.getenv("MASK_CACHE_SIZE", 256))
+MASK_CACHE_DIR = os.getenv("MASK_CACHE_DIR")  # unset = memory only
+MASK_CACHE_DIR_MAX_MB = float(os.getenv("MASK_CACHE_DIR_MAX_MB", 1024))  # 0 = unbounded
+
+
+class MaskCache:
+    """
+    Thread-safe LRU of masking results keyed by a hash of the aligned person image.
+
+    Entries are dicts of NumPy arrays. The processor keeps two kinds per photo:
+    the model outputs, {"keypoints": (17, 2) float32, "silhouette": (H, W) uint8}
+    (each present only once computed), and one {"mask": (H, W) uint8} per try-on type.
+    """
+
+    def __init__(self, max_entries=MASK_CACHE_SIZE, disk_dir=MASK_CACHE_DIR, disk_max_mb=MASK_CACHE_DIR_MAX_MB):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_budget = None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.disk_budget = DiskCacheBudget(self.disk_dir, int(disk_max_mb * 1024 * 1024), ".npz")
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(pixels, height, width, variant=""):
+        """Hash the pixels of an aligned person image ((H, W, 3) uint8 array) together with the target resolution."""
+        pixels = np.ascontiguousarray(pixels)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{pixels.shape}|{pixels.dtype}|{height}x{width}|{variant}".encode())
+        h.update(pixels.data)
+        return h.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            if self.disk_budget:
+                self.disk_budget.touch(self._disk_path(key))
+            return entry
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with np.load(self._disk_path(key)) as data:
+                    entry = {name: data[name] for name in data.files}
+                self.disk_budget.touch(self._disk_path(key))
+                self._put_memory(key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry
+            except Exception as e:
+                print(f"⚠️ Mask cache entry unreadable: {e}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        self._put_memory(key, entry)
+        if self.disk_dir:
+            try:
+                arrays = {name: value for name, value in entry.items() if value is not None}
+                tmp_path = self._disk_path(key) + ".tmp.npz"
+                np.savez_compressed(tmp_path, **arrays)
+                os.replace(tmp_path, self._disk_path(key))
+                self.disk_budget.added(self._disk_path(key))
+            except Exception as e:
+                print(f"⚠️ Failed to persist mask cache entry: {e}")
+
+    def _put_memory(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+        if self.disk_budget:
+            stats.update(self.disk_budget.stats())
+        return stats
@@ -0,0 +1,426 @@
+# Person Masking
+# Builds the try-on mask from an aligned person photo as an explicit list of stages,
+# with one mask generator per product try-on type. Expensive inputs (YOLO pose
+# keypoints, rembg silhouette) are computed lazily, the first time a stage asks for
+# them, so generators and stages that don't need them cost nothing.
+
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from tryon_tracing import span
+
+load_dotenv()
+
+# Trim the pose mask to the rembg silhouette (one extra U2Net pass per new photo)
+MASK_SILHOUETTE_TRIM = os.getenv("MASK_SILHOUETTE_TRIM", "false").lower() in ("1", "true", "yes")
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")  # e.g. u2net_human_seg, isnet-general-use
+# Where pose/segmentation run: ultralytics + rembg, or exported models on ONNX Runtime (see onnx_masking.py)
+MASK_BACKEND = os.getenv("MASK_BACKEND", "ultralytics")
+YOLO_POSE_MODEL = os.getenv("YOLO_POSE_MODEL", "yolov8n-pose.pt")
+
+# COCO keypoint indices
+NOSE, L_EYE, R_EYE, L_EAR, R_EAR = 0, 1, 2, 3, 4
+L_SHOULDER, R_SHOULDER = 5, 6
+L_HIP, R_HIP, L_KNEE, R_KNEE, L_ANKLE, R_ANKLE = 11, 12, 13, 14, 15, 16
+
+# Morphology sizes, matching the previous PIL filters (MaxFilter sizes, GaussianBlur radius)
+POSE_DILATE_SIZE = 25
+FACE_DILATE_SIZE = 11
+SILHOUETTE_DILATE_SIZE = 15
+FEATHER_SIGMA = 7
+
+
+def dilate(mask, size):
+    """Square max filter (same as PIL's MaxFilter(size)) on a uint8 array."""
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+    return cv2.dilate(mask, kernel)
+
+
+def feather(mask, sigma):
+    """Gaussian blur of a uint8 array (PIL's GaussianBlur(radius) uses radius as sigma)."""
+    return cv2.GaussianBlur(mask, (0, 0), sigmaX=sigma, sigmaY=sigma, borderType=cv2.BORDER_REPLICATE)
+
+
+def fill_polygon(mask, points):
+    # Coordinates are truncated, as ImageDraw does, so edges land on the same pixels
+    cv2.fillPoly(mask, [np.asarray(points, dtype=np.float32).astype(np.int32)], 255)
+
+
+def fill_rectangle(mask, x0, y0, x1, y1):
+    """Fill [x0, x1] x [y0, y1] (inclusive, like ImageDraw.rectangle), clipped to the mask."""
+    h, w = mask.shape
+    x0, y0 = max(int(x0), 0), max(int(y0), 0)
+    x1, y1 = min(int(x1), w - 1), min(int(y1), h - 1)
+    if x1 >= x0 and y1 >= y0:
+        mask[y0:y1 + 1, x0:x1 + 1] = 255
+
+
+def detected(keypoints, indices):
+    """True if every keypoint in `indices` was detected (YOLO reports missing points as 0, 0)."""
+    return all(np.all(keypoints[i] > 0) for i in indices)
+
+
+class MaskModels:
+    """The pose model and rembg session, shared by all mask generators."""
+
+    backend = "ultralytics"
+
+    def __init__(self, pose_model=None, rembg_model=REMBG_MODEL):
+        self.pose_model = pose_model
+        self.rembg_model = rembg_model
+        self._rembg_session = None
+        self._rembg_lock = threading.Lock()
+        # Ultralytics predictors keep per-call state and aren't thread-safe
+        self._pose_lock = threading.Lock()
+
+    def detect_keypoints(self, image):
+        if not self.pose_model:
+            return None
+        try:
+            with self._pose_lock:
+                results = self.pose_model(image, verbose=False)
+            if results and len(results[0].keypoints) > 0:
+                return results[0].keypoints.xy.cpu().numpy()[0].astype(np.float32)
+        except Exception as e:
+            print(f"⚠️ Pose detection failed: {e}")
+        return None
+
+    def _get_rembg_session(self):
+        # One session per process; rembg.remove() would otherwise load the model per call
+        with self._rembg_lock:
+            if self._rembg_session is None:
+                from rembg import new_session
+                self._rembg_session = new_session(self.rembg_model)
+            return self._rembg_session
+
+    def segment(self, image):
+        try:
+            from rembg import remove
+            no_bg = remove(image, session=self._get_rembg_session())
+            print("✅ Generated Silhouette with Rembg")
+            return np.array(no_bg.split()[-1], dtype=np.uint8)  # Alpha channel
+        except Exception as e:
+            print(f"⚠️ Rembg failed: {e}")
+            return None
+
+
+def load_pose_model(path=YOLO_POSE_MODEL):
+    """YOLOv8-Pose through ultralytics, or None if it is unavailable."""
+    try:
+        from ultralytics import YOLO
+    except ImportError:
+        print("⚠️ ultralytics not found. Smart masking disabled.")
+        return None
+    try:
+        print("Loading YOLOv8-Pose for smart masking...")
+        return YOLO(path)
+    except Exception as e:
+        print(f"Failed to load YOLO: {e}")
+        return None
+
+
+def create_mask_models(backend=MASK_BACKEND):
+    if backend == "onnx":
+        from onnx_masking import OnnxMaskModels
+        return OnnxMaskModels()
+    if backend != "ultralytics":
+        raise ValueError(f"Unknown MASK_BACKEND '{backend}', expected 'ultralytics' or 'onnx'")
+    return MaskModels(load_pose_model())
+
+
+class MaskInputs:
+    """
+    Per-photo inputs shared by the mask stages.
+
+    `keypoints` and `silhouette` are computed on first access and reused, so they
+    only run if some stage needs them. Values from the mask cache can be passed in
+    to skip the models entirely.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, models, image, keypoints=_UNSET, silhouette=_UNSET):
+        self.models = models
+        self.image = image
+        self.width, self.height = image.size
+        # The cache stores "no person detected" as an empty array
+        if keypoints is not self._UNSET and keypoints is not None and len(keypoints) == 0:
+            keypoints = None
+        self._keypoints = keypoints
+        self._silhouette = silhouette
+
+    @property
+    def keypoints(self):
+        """(17, 2) array of pose keypoints for the first person, or None."""
+        if self._keypoints is self._UNSET:
+            with span("pose"):
+                self._keypoints = self.models.detect_keypoints(self.image)
+        return self._keypoints
+
+    @property
+    def silhouette(self):
+        """(H, W) uint8 alpha matte of the person, or None if rembg is unavailable."""
+        if self._silhouette is self._UNSET:
+            with span("rembg"):
+                self._silhouette = self.models.segment(self.image)
+        return self._silhouette
+
+    def computed(self):
+        """The inputs that were actually computed, for caching."""
+        entry = {}
+        if self._keypoints is not self._UNSET:
+            entry["keypoints"] = self._keypoints if self._keypoints is not None else np.zeros((0, 2), dtype=np.float32)
+        if self._silhouette is not self._UNSET and self._silhouette is not None:
+            entry["silhouette"] = self._silhouette
+        return entry
+
+
+class MaskJob:
+    """State passed from stage to stage. `mask` is an (H, W) uint8 array."""
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.mask = np.zeros((inputs.height, inputs.width), dtype=np.uint8)
+        self.has_pose = False
+
+
+class MaskGenerator(ABC):
+    """
+    Base mask generator.
+
+    Stages, in order:
+        structure: region drawn from pose keypoints (`draw`), or `fallback_box`
+        dilate:    expand the pose mask so it covers the old garment loosely
+        trim:      (opt-in) clip the mask to the rembg silhouette
+        feather:   blur the edges
+
+    Subclasses list the keypoints they cannot do without in `required_keypoints`
+    and implement `draw(job, keypoints)`.
+    """
+
+    tryon_type = None
+    required_keypoints = ()
+    fallback_box = (0.25, 0.20, 0.75, 0.60)  # x0, y0, x1, y1 as fractions of the image
+    dilate_size = POSE_DILATE_SIZE
+
+    def __init__(self, models, trim_with_silhouette=MASK_SILHOUETTE_TRIM):
+        self.models = models
+        self.trim_with_silhouette = trim_with_silhouette
+
+        self.stages = [self.structure_stage, self.dilate_stage]
+        if self.trim_with_silhouette:
+            self.stages.append(self.trim_stage)
+        self.stages.append(self.feather_stage)
+
+    @property
+    def variant(self):
+        """Distinguishes cached masks built by different generators or stage settings."""
+        trim = f"|trim:{self.models.rembg_model}" if self.trim_with_silhouette else ""
+        return f"{self.tryon_type}|{self.models.backend}{trim}"
+
+    def __call__(self, image, keypoints=MaskInputs._UNSET, silhouette=MaskInputs._UNSET):
+        """Run all stages on an aligned PIL image. Returns (mask as an (H, W) uint8 array, inputs)."""
+        inputs = MaskInputs(self.models, image, keypoints, silhouette)
+        job = MaskJob(inputs)
+        # Pose and rembg run lazily inside the stages and are timed as their own spans
+        with span("mask_filters"):
+            for stage in self.stages:
+                stage(job)
+        return job.mask, inputs
+
+    @abstractmethod
+    def draw(self, job, keypoints):
+        """Fill the try-on region on `job.mask` from the pose keypoints."""
+
+    # --- Stages ---
+
+    def structure_stage(self, job):
+        keypoints = job.inputs.keypoints
+        if keypoints is not None and len(keypoints) > max(self.required_keypoints) and detected(keypoints, self.required_keypoints):
+            self.draw(job, keypoints)
+            job.has_pose = True
+            print(f"✅ Generated {self.tryon_type} Mask with Pose")
+        else:
+            print(f"⚠️ Using Fallback Rectangle Mask ({self.tryon_type})")
+            w, h = job.inputs.width, job.inputs.height
+            x0, y0, x1, y1 = self.fallback_box
+            fill_rectangle(job.mask, w * x0, h * y0, w * x1, h * y1)
+
+    def dilate_stage(self, job):
+        # Only the pose mask is tight enough to need expanding over the old garment
+        if job.has_pose:
+            job.mask = dilate(job.mask, self.dilate_size)
+
+    def trim_stage(self, job):
+        silhouette = job.inputs.silhouette
+        if silhouette is None or not silhouette.any():
+            return
+        # Dilate the silhouette a little so loose clothing at its edge stays masked
+        job.mask = np.minimum(job.mask, dilate(silhouette, SILHOUETTE_DILATE_SIZE))
+
+    def feather_stage(self, job):
+        job.mask = feather(job.mask, FEATHER_SIGMA)
+
+
+def neck_top(keypoints):
+    """Highest row the mask may reach: between the shoulder line and the nose, so the face is never masked."""
+    neck_base_y = (keypoints[L_SHOULDER][1] + keypoints[R_SHOULDER][1]) / 2
+    nose = keypoints[NOSE] if keypoints[NOSE][1] > 0 else None
+
+    if nose is not None:
+        # Neck top is halfway between nose and shoulder line,
+        # but no higher than 80% of the way to the nose
+        top_y = (nose[1] + neck_base_y) / 2
+        safe_limit = nose[1] + (neck_base_y - nose[1]) * 0.2
+        return max(top_y, safe_limit)
+    # No nose: conservative fixed offset above the shoulders
+    return neck_base_y - 40
+
+
+def draw_torso(mask, keypoints):
+    """Torso trapezoid plus a neck strip up to `neck_top`."""
+    l_shoulder, r_shoulder = keypoints[L_SHOULDER], keypoints[R_SHOULDER]
+    fill_polygon(mask, [l_shoulder, r_shoulder, keypoints[R_HIP], keypoints[L_HIP]])
+
+    neck_base_x = (l_shoulder[0] + r_shoulder[0]) / 2
+    neck_base_y = (l_shoulder[1] + r_shoulder[1]) / 2
+    neck_width = abs(l_shoulder[0] - r_shoulder[0]) * 0.4
+    fill_rectangle(
+        mask,
+        neck_base_x - neck_width / 2,
+        neck_top(keypoints),
+        neck_base_x + neck_width / 2,
+        neck_base_y + 10  # slightly overlaps torso
+    )
+
+
+def draw_legs(mask, keypoints, height):
+    """
+    Waistband-to-hem region below the hips. Reaches the ankles when they are
+    detected, otherwise a little past the knees (or down the image if neither is).
+    """
+    hips = keypoints[[L_HIP, R_HIP]]
+    hip_width = abs(hips[0][0] - hips[1][0])
+    margin = hip_width * 0.3
+    waist_y = hips[:, 1].min() - hip_width * 0.35
+
+    if detected(keypoints, (L_ANKLE, R_ANKLE)):
+        legs, extra = keypoints[[L_ANKLE, R_ANKLE]], height * 0.03
+    elif detected(keypoints, (L_KNEE, R_KNEE)):
+        legs, extra = keypoints[[L_KNEE, R_KNEE]], height * 0.08
+    else:
+        legs, extra = np.array([[hips[:, 0].min(), height * 0.9], [hips[:, 0].max(), height * 0.9]]), 0.0
+    hem_y = min(legs[:, 1].max() + extra, height - 1)
+
+    fill_polygon(mask, [
+        (hips[:, 0].min() - margin, waist_y),
+        (hips[:, 0].max() + margin, waist_y),
+        (legs[:, 0].max() + margin, hem_y),
+        (legs[:, 0].min() - margin, hem_y),
+    ])
+
+
+class UpperBodyMask(MaskGenerator):
+    """Shirts, tops, jackets: torso and neck. Pose only."""
+
+    tryon_type = "Upper body"
+    required_keypoints = (L_SHOULDER, R_SHOULDER, L_HIP, R_HIP)
+
+    def draw(self, job, keypoints):
+        draw_torso(job.mask, keypoints)
+
+
+class LowerBodyMask(MaskGenerator):
+    """Trousers, skirts, shorts: waist to knees/ankles. Pose only."""
+
+    tryon_type = "Lower body"
+    required_keypoints = (L_HIP, R_HIP)
+    fallback_box = (0.25, 0.45, 0.75, 0.95)
+
+    def draw(self, job, keypoints):
+        draw_legs(job.mask, keypoints, job.inputs.height)
+
+
+class FullBodyMask(MaskGenerator):
+    """
+    Dresses, jumpsuits: the person's silhouette below the neck. The only generator
+    that needs rembg; without a silhouette it falls back to torso + legs from pose.
+    """
+
+    tryon_type = "Full body"
+    required_keypoints = (L_SHOULDER, R_SHOULDER, L_HIP, R_HIP)
+    fallback_box = (0.20, 0.20, 0.80, 0.95)
+
+    def draw(self, job, keypoints):
+        silhouette = job.inputs.silhouette
+        if silhouette is not None and silhouette.any():
+            top = max(int(neck_top(keypoints)), 0)
+            job.mask[top:] = np.where(silhouette[top:] >= 128, 255, 0).astype(np.uint8)
+        else:
+            draw_torso(job.mask, keypoints)
+            draw_legs(job.mask, keypoints, job.inputs.height)
+
+
+class FaceMask(MaskGenerator):
+    """
+    Earrings, necklaces and other accessories: the ears and the neck below the chin.
+    The eyes, nose, mouth and jaw are never masked. Needs only the head keypoints.
+    """
+
+    tryon_type = "Face"
+    required_keypoints = (NOSE,)
+    fallback_box = (0.35, 0.08, 0.65, 0.28)
+    dilate_size = FACE_DILATE_SIZE
+
+    def draw(self, job, keypoints):
+        nose = keypoints[NOSE]
+        if detected(keypoints, (L_EAR, R_EAR)):
+            head_width = abs(keypoints[L_EAR][0] - keypoints[R_EAR][0])
+        elif detected(keypoints, (L_EYE, R_EYE)):
+            head_width = abs(keypoints[L_EYE][0] - keypoints[R_EYE][0]) * 2
+        else:
+            head_width = job.inputs.width * 0.1
+        head_width = max(head_width, 1.0)
+
+        # Ears: a box around each detected ear, reaching outwards and down for the
+        # earring drop, and only slightly inwards so the cheek stays unmasked
+        size = head_width * 0.2
+        for ear in (L_EAR, R_EAR):
+            if not detected(keypoints, (ear,)):
+                continue
+            x, y = keypoints[ear]
+            outwards = 1 if x >= nose[0] else -1
+            inner_x, outer_x = x - outwards * size * 0.4, x + outwards * size
+            fill_rectangle(job.mask, min(inner_x, outer_x), y - size, max(inner_x, outer_x), y + size * 1.5)
+
+        # Neck: below the chin down to the shoulders, with the same nose-based limit
+        # as the upper-body neck strip
+        if detected(keypoints, (L_SHOULDER, R_SHOULDER)):
+            top_y = neck_top(keypoints)
+            bottom_y = (keypoints[L_SHOULDER][1] + keypoints[R_SHOULDER][1]) / 2
+        else:
+            top_y = nose[1] + head_width * 0.9
+            bottom_y = nose[1] + head_width * 1.4
+        fill_rectangle(job.mask, nose[0] - head_width * 0.4, top_y, nose[0] + head_width * 0.4, bottom_y)
+
+
+MASK_GENERATORS = {cls.tryon_type: cls for cls in (UpperBodyMask, LowerBodyMask, FullBodyMask, FaceMask)}
+DEFAULT_TRYON_TYPE = UpperBodyMask.tryon_type
+
+
+def normalize_tryon_type(tryon_type):
+    """Map a product's `tryon_type` onto a registered generator ("upper Body" -> "Upper body")."""
+    for name in MASK_GENERATORS:
+        if tryon_type and tryon_type.strip().lower() == name.lower():
+            return name
+    return DEFAULT_TRYON_TYPE
+
+
+def create_mask_generators(models, **kwargs):
+    """One generator instance per try-on type, all sharing `models`."""
+    return {name: cls(models, **kwargs) for name, cls in MASK_GENERATORS.items()}
@@ -0,0 +1,316 @@
+# Memory Budget
+# Peak-memory controls for the diffusion pipeline: tiled VAE encode/decode, chunked
+# attention and UNet/VAE offload. A mode is picked at load time from the configured
+# budget and an estimate of the peak for the largest request this node serves, and
+# the peak RSS of every request is measured so the estimate can be checked.
+
+import contextlib
+import os
+import threading
+from typing import NamedTuple
+
+import torch
+import torch.nn.functional as F
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_MEMORY_MODE = os.getenv("TRYON_MEMORY_MODE", "auto")  # auto, full, tiled, sliced, offload
+TRYON_MEMORY_BUDGET_MB = int(os.getenv("TRYON_MEMORY_BUDGET_MB", 0))  # 0 = no budget (auto picks "full")
+TRYON_MEMORY_ATTENTION_CHUNK = int(os.getenv("TRYON_MEMORY_ATTENTION_CHUNK", 1024))  # query tokens per chunk
+# Largest request the budget has to fit (default: the hq profile)
+TRYON_MEMORY_MAX_HEIGHT = int(os.getenv("TRYON_MEMORY_MAX_HEIGHT", 1024))
+TRYON_MEMORY_MAX_WIDTH = int(os.getenv("TRYON_MEMORY_MAX_WIDTH", 768))
+
+MB = 1024 * 1024
+
+
+class MemoryPlan(NamedTuple):
+    mode: str
+    vae_tiling: bool
+    attention_chunk: int  # 0 = unchunked
+    offload: bool
+
+
+# Ordered from fastest / most memory to slowest / least memory
+MEMORY_PLANS = {
+    "full": MemoryPlan("full", False, 0, False),
+    "tiled": MemoryPlan("tiled", True, 0, False),
+    "sliced": MemoryPlan("sliced", True, TRYON_MEMORY_ATTENTION_CHUNK, False),
+    "offload": MemoryPlan("offload", True, TRYON_MEMORY_ATTENTION_CHUNK, True),
+}
+
+
+class ChunkedAttnProcessor:
+    """
+    Attention through `scaled_dot_product_attention`, `chunk_size` query tokens at a
+    time. Even when SDPA falls back to the math kernel, the score matrix held at
+    once is chunk x keys instead of keys x keys.
+
+    Follows diffusers' AttnProcessor2_0.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+
+    def __call__(self, attn, hidden_states, encoder_hidden_states=None, attention_mask=None, temb=None, *args, **kwargs):
+        residual = hidden_states
+        if attn.spatial_norm is not None:
+            hidden_states = attn.spatial_norm(hidden_states, temb)
+
+        input_ndim = hidden_states.ndim
+        if input_ndim == 4:
+            batch_size, channel, height, width = hidden_states.shape
+            hidden_states = hidden_states.view(batch_size, channel, height * width).transpose(1, 2)
+
+        batch_size, sequence_length, _ = (
+            hidden_states.shape if encoder_hidden_states is None else encoder_hidden_states.shape
+        )
+        if attention_mask is not None:
+            attention_mask = attn.prepare_attention_mask(attention_mask, sequence_length, batch_size)
+            attention_mask = attention_mask.view(batch_size, attn.heads, -1, attention_mask.shape[-1])
+
+        if attn.group_norm is not None:
+            hidden_states = attn.group_norm(hidden_states.transpose(1, 2)).transpose(1, 2)
+
+        query = attn.to_q(hidden_states)
+        if encoder_hidden_states is None:
+            encoder_hidden_states = hidden_states
+        elif attn.norm_cross:
+            encoder_hidden_states = attn.norm_encoder_hidden_states(encoder_hidden_states)
+        key = attn.to_k(encoder_hidden_states)
+        value = attn.to_v(encoder_hidden_states)
+
+        head_dim = key.shape[-1] // attn.heads
+        query = query.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+        key = key.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+        value = value.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+
+        chunks = []
+        for start in range(0, query.shape[2], self.chunk_size):
+            end = start + self.chunk_size
+            mask = attention_mask
+            # The mask's query axis is usually 1 (broadcast over every query); only a
+            # per-query mask is cut to the chunk
+            if mask is not None and mask.shape[2] > 1:
+                mask = mask[:, :, start:end]
+            chunks.append(F.scaled_dot_product_attention(
+                query[:, :, start:end], key, value, attn_mask=mask, dropout_p=0.0, is_causal=False
+            ))
+        hidden_states = torch.cat(chunks, dim=2)
+
+        hidden_states = hidden_states.transpose(1, 2).reshape(batch_size, -1, attn.heads * head_dim).to(query.dtype)
+        hidden_states = attn.to_out[0](hidden_states)  # linear proj
+        hidden_states = attn.to_out[1](hidden_states)  # dropout
+
+        if input_ndim == 4:
+            hidden_states = hidden_states.transpose(-1, -2).reshape(batch_size, channel, height, width)
+        if attn.residual_connection:
+            hidden_states = hidden_states + residual
+        return hidden_states / attn.rescale_output_factor
+
+
+def apply_attention_chunking(unet, chunk_size):
+    """
+    Swap the UNet's real attention processors for ChunkedAttnProcessor.
+
+    diffusers' `set_attention_slice` would replace every processor, including
+    CatVTON's skipped cross-attention, so those are kept. Returns the number of
+    processors replaced.
+    """
+    processors = {}
+    replaced = 0
+    for name, processor in unet.attn_processors.items():
+        if "Skip" in type(processor).__name__:
+            processors[name] = processor
+        else:
+            processors[name] = ChunkedAttnProcessor(chunk_size)
+            replaced += 1
+    unet.set_attn_processor(processors)
+    return replaced
+
+
+def module_mb(module):
+    return sum(p.numel() * p.element_size() for p in module.parameters()) / MB
+
+
+def estimate_peak_mb(plan, pipeline, height, width, concurrency=1, guidance=True, device_type="cpu"):
+    """
+    Rough upper bound on peak memory for `concurrency` requests at height x width.
+
+    Counts weights, the UNet's activations at its highest resolution (with a
+    materialized attention score matrix, as in SDPA's math fallback) and the VAE
+    decoder's full-resolution activations. Compare against the measured peak RSS
+    in /admin/tryon/stats and adjust TRYON_MEMORY_BUDGET_MB accordingly.
+    """
+    bytes_per = torch.finfo(pipeline.weight_dtype).bits // 8
+    unet_mb, vae_mb = module_mb(pipeline.unet), module_mb(pipeline.vae)
+    # With offload only one of the two is on the device at a time (no saving on CPU)
+    weights = max(unet_mb, vae_mb) if plan.offload and device_type == "cuda" else unet_mb + vae_mb
+
+    batch = concurrency * (2 if guidance else 1)
+    tokens = (height // 8) * (width // 8) * 2  # person + garment latents, concatenated
+    heads = 8
+    query_tokens = min(plan.attention_chunk, tokens) if plan.attention_chunk else tokens
+    attention = batch * heads * query_tokens * tokens * bytes_per / MB
+    unet_activations = batch * tokens * 320 * bytes_per * 20 / MB  # resnet/skip buffers at 320 channels
+
+    vae_h = min(height, 512) if plan.vae_tiling else height
+    vae_w = min(width, 512) if plan.vae_tiling else width
+    vae_activations = concurrency * vae_h * vae_w * 128 * bytes_per * 6 / MB
+
+    return weights + max(attention + unet_activations, vae_activations)
+
+
+def select_memory_plan(pipeline, device_type, mode=TRYON_MEMORY_MODE, budget_mb=TRYON_MEMORY_BUDGET_MB,
+                       height=TRYON_MEMORY_MAX_HEIGHT, width=TRYON_MEMORY_MAX_WIDTH, concurrency=1):
+    """
+    Resolve TRYON_MEMORY_MODE. `auto` picks the fastest plan whose estimated peak fits
+    the budget (offload is only considered on CUDA, where it frees device memory).
+
+    Returns (plan, estimated_peak_mb).
+    """
+    if mode != "auto":
+        if mode not in MEMORY_PLANS:
+            raise ValueError(f"Unknown TRYON_MEMORY_MODE '{mode}', expected auto or one of {list(MEMORY_PLANS)}")
+        plan = MEMORY_PLANS[mode]
+        return plan, estimate_peak_mb(plan, pipeline, height, width, concurrency, device_type=device_type)
+
+    candidates = [p for p in MEMORY_PLANS.values() if device_type == "cuda" or not p.offload]
+    estimate = None
+    for plan in candidates:
+        estimate = estimate_peak_mb(plan, pipeline, height, width, concurrency, device_type=device_type)
+        if budget_mb <= 0 or estimate <= budget_mb:
+            return plan, estimate
+
+    print(f"⚠️ No memory mode fits {budget_mb} MB (estimated {estimate:.0f} MB); using '{plan.mode}'")
+    return plan, estimate
+
+
+class ComponentOffloader:
+    """
+    Keeps the UNet and VAE on the CPU and moves each to the device only while it is
+    in use. Reference-counted, so concurrent workers never move a module out from
+    under each other.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self._users = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def use(self, module):
+        with self._lock:
+            if self._users.get(id(module), 0) == 0:
+                module.to(self.device)
+            self._users[id(module)] = self._users.get(id(module), 0) + 1
+        try:
+            yield module
+        finally:
+            with self._lock:
+                self._users[id(module)] -= 1
+                if self._users[id(module)] == 0:
+                    module.to("cpu")
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+
+
+def apply_memory_plan(pipeline, sampler, plan, device):
+    """Apply a MemoryPlan to the pipeline/sampler."""
+    if plan.vae_tiling:
+        pipeline.vae.enable_tiling()
+    if plan.attention_chunk:
+        apply_attention_chunking(pipeline.unet, plan.attention_chunk)
+    if plan.offload and device.type == "cuda":
+        pipeline.unet.to("cpu")
+        pipeline.vae.to("cpu")
+        torch.cuda.empty_cache()
+        sampler.offloader = ComponentOffloader(device)
+
+
+def current_rss_mb():
+    """Resident set size of this process (Linux /proc; falls back to the lifetime peak elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+def process_memory_mb():
+    """
+    RSS, PSS and private memory of this process (Linux only, else None).
+
+    Forked inference workers share the model weights, so their RSS each counts the
+    weights in full; PSS splits shared pages between the processes and `private`
+    is what the process adds on its own.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and line[0].isupper())
+    except OSError:
+        return None
+    kb = {name: int(value.split()[0]) for name, value in fields.items() if value.strip().endswith("kB")}
+    return {
+        "rss_mb": round(kb.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "private_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+class PeakMemoryMonitor:
+    """
+    Samples the process RSS on a background thread while the block runs.
+
+    RSS is process-wide, so with several workers the peak includes memory used by
+    concurrent requests; `concurrent` reports how many were running.
+    """
+
+    _active = 0
+    _active_lock = threading.Lock()
+
+    def __init__(self, device=None, interval=0.02):
+        self.device = device
+        self.interval = interval
+        self.start_mb = self.peak_mb = 0.0
+        self.concurrent = 1
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        with PeakMemoryMonitor._active_lock:
+            PeakMemoryMonitor._active += 1
+            self.concurrent = PeakMemoryMonitor._active
+        self.start_mb = self.peak_mb = current_rss_mb()
+        if self.device is not None and self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        self._thread = threading.Thread(target=self._sample, name="rss-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        with PeakMemoryMonitor._active_lock:
+            self.concurrent = max(self.concurrent, PeakMemoryMonitor._active)
+            PeakMemoryMonitor._active -= 1
+        return False
+
+    def result(self):
+        report = {
+            "start_rss_mb": round(self.start_mb, 1),
+            "peak_rss_mb": round(self.peak_mb, 1),
+            "concurrent": self.concurrent,
+        }
+        if self.device is not None and self.device.type == "cuda":
+            report["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated(self.device) / MB, 1)
+        return report
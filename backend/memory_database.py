@@ -0,0 +1,275 @@
+# In-Memory Database
+# Process-local stand-in for the motor database (DATABASE_BACKEND=memory), so the API
+# can be run, tested and load-tested without MongoDB. Implements the part of the
+# async collection API the backend uses: find / find_one / count_documents with
+# equality and comparison queries, cursors with sort / skip / limit, insert, update
+# ($set, $unset, $inc, $push, upsert), replace, delete and no-op indexes.
+
+import copy
+from typing import NamedTuple
+
+from bson import ObjectId
+
+
+class InsertOneResult(NamedTuple):
+    inserted_id: object
+
+
+class UpdateResult(NamedTuple):
+    matched_count: int
+    modified_count: int
+    upserted_id: object = None
+
+
+class DeleteResult(NamedTuple):
+    deleted_count: int
+
+
+def _get(doc, key):
+    """Value at a dotted key path, or None."""
+    value = doc
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _compare(value, operator, operand):
+    if operator == "$eq":
+        return _equals(value, operand)
+    if operator == "$ne":
+        return not _equals(value, operand)
+    if operator == "$in":
+        return any(_equals(value, item) for item in operand)
+    if operator == "$nin":
+        return not any(_equals(value, item) for item in operand)
+    if operator == "$exists":
+        return (value is not None) == bool(operand)
+    if value is None:
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    raise NotImplementedError(f"Query operator {operator} is not supported by the in-memory database")
+
+
+def _equals(value, expected):
+    # Like MongoDB, a scalar matches an array field that contains it
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            value = _get(doc, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif not _equals(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _set(doc, key, value):
+    *parents, last = key.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _unset(doc, key):
+    *parents, last = key.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def apply_update(doc, update):
+    """Apply an update document in place."""
+    for operator, fields in update.items():
+        for key, value in fields.items():
+            if operator == "$set":
+                _set(doc, key, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset(doc, key)
+            elif operator == "$inc":
+                _set(doc, key, (_get(doc, key) or 0) + value)
+            elif operator == "$push":
+                current = _get(doc, key)
+                _set(doc, key, (current or []) + [copy.deepcopy(value)])
+            else:
+                raise NotImplementedError(f"Update operator {operator} is not supported by the in-memory database")
+
+
+def _sort_key(value):
+    # None sorts first, as in MongoDB; otherwise compare values of the same type
+    return (value is not None, value if value is not None else 0)
+
+
+class InMemoryCursor:
+    def __init__(self, docs):
+        self._docs = docs
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _results(self):
+        docs = list(self._docs)
+        # Stable sorts, least significant key first
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [copy.deepcopy(doc) for doc in docs]
+
+    async def to_list(self, length=None):
+        docs = self._results()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results():
+            yield doc
+
+
+class InMemoryCollection:
+    """
+    Documents are kept in insertion order and copied on the way in and out, so
+    callers never share state with the store. Every method runs without awaiting,
+    so each call is atomic on the event loop.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._docs = {}
+
+    def _matching(self, query):
+        return [doc for doc in self._docs.values() if matches(doc, query)]
+
+    def _first(self, query):
+        # Fast path for the common lookup by _id
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self._docs.get(query["_id"])
+            return doc
+        return next((doc for doc in self._docs.values() if matches(doc, query)), None)
+
+    async def find_one(self, query=None):
+        doc = self._first(query)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def find(self, query=None):
+        return InMemoryCursor(self._matching(query))
+
+    async def count_documents(self, query):
+        return len(self._matching(query))
+
+    async def insert_one(self, document):
+        # Like pymongo, the caller's document gets the generated _id
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._docs:
+            raise ValueError(f"Duplicate _id {document['_id']} in {self.name}")
+        self._docs[document["_id"]] = copy.deepcopy(document)
+        return InsertOneResult(document["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self._first(query)
+        if doc is None:
+            if not upsert:
+                return UpdateResult(0, 0)
+            doc = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+            doc.setdefault("_id", ObjectId())
+            apply_update(doc, update)
+            self._docs[doc["_id"]] = doc
+            return UpdateResult(0, 0, doc["_id"])
+        before = copy.deepcopy(doc)
+        apply_update(doc, update)
+        return UpdateResult(1, int(doc != before))
+
+    async def update_many(self, query, update):
+        docs = self._matching(query)
+        modified = 0
+        for doc in docs:
+            before = copy.deepcopy(doc)
+            apply_update(doc, update)
+            modified += int(doc != before)
+        return UpdateResult(len(docs), modified)
+
+    async def replace_one(self, query, replacement, upsert=False):
+        doc = self._first(query)
+        if doc is None:
+            if not upsert:
+                return UpdateResult(0, 0)
+            _id = replacement.get("_id", query.get("_id", ObjectId()))
+            self._docs[_id] = {**copy.deepcopy(replacement), "_id": _id}
+            return UpdateResult(0, 0, _id)
+        self._docs[doc["_id"]] = {**copy.deepcopy(replacement), "_id": doc["_id"]}
+        return UpdateResult(1, 1)
+
+    async def delete_one(self, query):
+        doc = self._first(query)
+        if doc is None:
+            return DeleteResult(0)
+        del self._docs[doc["_id"]]
+        return DeleteResult(1)
+
+    async def delete_many(self, query):
+        docs = self._matching(query)
+        for doc in docs:
+            del self._docs[doc["_id"]]
+        return DeleteResult(len(docs))
+
+    async def create_index(self, keys, **kwargs):
+        # Lookups scan the documents; TTL expiry (expireAfterSeconds) is not emulated
+        return keys if isinstance(keys, str) else "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    async def index_information(self):
+        return {}
+
+
+class InMemoryDatabase:
+    def __init__(self, name):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
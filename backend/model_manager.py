@@ -0,0 +1,193 @@
+# Model Lifecycle Manager
+# Decides when the try-on engine is loaded (eagerly, in the background, on first use,
+# or never) so the API can start answering requests before the diffusion models are
+# in memory, and auth-only replicas never pay for them.
+
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_ENGINE_MODE = os.getenv("TRYON_ENGINE_MODE", "background")  # eager, background, lazy, disabled
+TRYON_WARMUP = os.getenv("TRYON_WARMUP", "false").lower() in ("1", "true", "yes")
+TRYON_WARMUP_HEIGHT = int(os.getenv("TRYON_WARMUP_HEIGHT", 768))
+TRYON_WARMUP_WIDTH = int(os.getenv("TRYON_WARMUP_WIDTH", 576))
+TRYON_WARMUP_STEPS = int(os.getenv("TRYON_WARMUP_STEPS", 2))
+
+ENGINE_MODES = ("eager", "background", "lazy", "disabled")
+
+
+class EngineUnavailableError(Exception):
+    """Raised when the try-on engine is disabled, still loading, or failed to load."""
+
+    def __init__(self, state, message):
+        super().__init__(message)
+        self.state = state
+
+
+def warmup_inputs(height, width):
+    """Synthetic person/garment pair, enough to exercise every stage of the pipeline."""
+    from PIL import Image, ImageDraw
+
+    person = Image.new("RGB", (width, height), (200, 200, 200))
+    draw = ImageDraw.Draw(person)
+    draw.ellipse([width * 0.4, height * 0.05, width * 0.6, height * 0.2], fill=(220, 180, 150))
+    draw.rectangle([width * 0.3, height * 0.2, width * 0.7, height * 0.6], fill=(40, 60, 120))
+    draw.rectangle([width * 0.35, height * 0.6, width * 0.65, height * 0.95], fill=(30, 30, 30))
+
+    garment = Image.new("RGB", (width, height), (255, 255, 255))
+    ImageDraw.Draw(garment).rectangle([width * 0.2, height * 0.15, width * 0.8, height * 0.85], fill=(180, 30, 30))
+    return person, garment
+
+
+class ModelManager:
+    """
+    Owns the single try-on processor instance and its loading state.
+
+    States: not_loaded -> loading -> warming_up -> ready, or failed / disabled.
+
+    Modes:
+        eager:      load during `start()` (blocks startup, the previous behaviour)
+        background: `start()` loads on a background thread; the API serves meanwhile
+        lazy:       load on first `request_load()` / `get()`
+        disabled:   never load; try-on routes report the engine as unavailable
+    """
+
+    def __init__(
+        self,
+        factory,
+        mode=TRYON_ENGINE_MODE,
+        warmup=TRYON_WARMUP,
+        warmup_height=TRYON_WARMUP_HEIGHT,
+        warmup_width=TRYON_WARMUP_WIDTH,
+        warmup_steps=TRYON_WARMUP_STEPS
+    ):
+        if mode not in ENGINE_MODES:
+            raise ValueError(f"Unknown TRYON_ENGINE_MODE '{mode}', expected one of {ENGINE_MODES}")
+
+        self.factory = factory
+        self.mode = mode
+        self.warmup = warmup
+        self.warmup_height = warmup_height
+        self.warmup_width = warmup_width
+        self.warmup_steps = warmup_steps
+
+        self.state = "disabled" if mode == "disabled" else "not_loaded"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._processor = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def processor(self):
+        """The loaded processor, or None if it is not ready."""
+        return self._processor if self.ready else None
+
+    def start(self):
+        """Called at application startup."""
+        if self.mode == "eager":
+            self._load()
+        elif self.mode == "background":
+            self.request_load()
+
+    def request_load(self):
+        """Start loading on a background thread if nothing has started yet."""
+        with self._lock:
+            if self.state != "not_loaded":
+                return
+            self.state = "loading"
+        threading.Thread(target=self._load, name="tryon-model-loader", daemon=True).start()
+
+    def _load(self):
+        with self._lock:
+            if self.state in ("ready", "warming_up", "disabled"):
+                return
+            self.state = "loading"
+
+        processor = None
+        try:
+            start = time.time()
+            processor = self.factory()
+            self.load_seconds = time.time() - start
+
+            if self.warmup:
+                self.state = "warming_up"
+                self._warmup(processor)
+
+            self._processor = processor
+            self.state = "ready"
+            print(f"✅ Try-on engine ready (load {self.load_seconds:.1f}s)")
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            print(f"❌ Try-on engine failed to load: {e}")
+            if processor is not None:
+                # e.g. the warmup failed: don't leave its threads and worker processes running
+                try:
+                    processor.shutdown()
+                except Exception as shutdown_error:
+                    print(f"⚠️ Failed to shut down the try-on engine: {shutdown_error}")
+        finally:
+            self._loaded.set()
+
+    def _warmup(self, processor):
+        print(f"Warming up try-on engine at {self.warmup_height}x{self.warmup_width}...")
+        start = time.time()
+        person, garment = warmup_inputs(self.warmup_height, self.warmup_width)
+        result = processor.run_virtual_tryon(
+            person,
+            garment,
+            num_inference_steps=self.warmup_steps,
+            height=self.warmup_height,
+            width=self.warmup_width
+        )
+        # run_virtual_tryon reports errors by returning None; an engine that can't
+        # render the warmup image isn't ready
+        if result is None:
+            raise RuntimeError("Warmup try-on failed")
+        self.warmup_seconds = time.time() - start
+
+    def get(self, wait=False, timeout=None):
+        """
+        Return the processor, raising EngineUnavailableError if it is not ready.
+
+        With `wait=True` (worker threads, scripts) this blocks until loading
+        finishes, triggering a load first in lazy mode.
+        """
+        if self.ready:
+            return self._processor
+        if self.state == "disabled":
+            raise EngineUnavailableError("disabled", "Try-on engine is disabled on this server")
+
+        self.request_load()
+        if wait:
+            self._loaded.wait(timeout)
+            if self.ready:
+                return self._processor
+
+        if self.state == "failed":
+            raise EngineUnavailableError("failed", f"Try-on engine failed to load: {self.error}")
+        raise EngineUnavailableError(self.state, "Try-on engine is loading, please retry shortly")
+
+    def shutdown(self):
+        """Stop the processor's background threads and worker processes, if it has any."""
+        if self._processor is not None:
+            self._processor.shutdown()
+
+    def status(self):
+        return {
+            "mode": self.mode,
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
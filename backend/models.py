@@ -178,6 +178,7 @@ class TryOnResponse(BaseModel):
     product_category: str
     original_image_url: str
     result_image_url: str
+    thumbnail_url: Optional[str] = None
     processing_time: float
     status: str  # 'processing', 'completed', 'failed'
     created_at: datetime
@@ -185,6 +186,14 @@ class TryOnResponse(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+class TryOnJobResponse(BaseModel):
+    job_id: str
+    status: str  # 'queued', 'processing', 'completed', 'failed'
+    product_id: str
+    created_at: datetime
+    error: Optional[str] = None
+    result: Optional[TryOnResponse] = None
+
 class TryOnHistoryResponse(BaseModel):
     items: List[TryOnResponse]
     total_count: int
@@ -0,0 +1,185 @@
+# ONNX Runtime Masking Backend
+# Runs the pose (YOLOv8n-pose) and segmentation (U2Net) models as exported ONNX graphs
+# on ONNX Runtime, for CPU-only nodes. Sessions are created once per process with a
+# configurable thread count, and models can be INT8-quantized on first use.
+#
+# Export the models once (writes to ONNX_MODEL_DIR):
+#   python onnx_masking.py                 # FP32
+#   python onnx_masking.py --quantize      # FP32 + INT8 copies
+
+import os
+import threading
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from masking import MaskModels
+
+load_dotenv()
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models")
+ONNX_POSE_MODEL = os.getenv("ONNX_POSE_MODEL", os.path.join(ONNX_MODEL_DIR, "yolov8n-pose.onnx"))
+ONNX_SEG_MODEL = os.getenv("ONNX_SEG_MODEL", os.path.join(ONNX_MODEL_DIR, "u2net.onnx"))
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes")
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))  # 0 = ONNX Runtime default (all cores)
+ONNX_POSE_CONFIDENCE = float(os.getenv("ONNX_POSE_CONFIDENCE", 0.25))
+
+POSE_INPUT_SIZE = 640
+SEG_INPUT_SIZE = 320
+# Ultralytics zeroes keypoints below this visibility; we do the same so both backends agree
+KEYPOINT_VISIBILITY = 0.5
+
+
+def quantized_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+def quantize_model(model_path):
+    """Write a dynamically INT8-quantized copy next to `model_path` (once) and return its path."""
+    output_path = quantized_path(model_path)
+    if not os.path.exists(output_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"Quantizing {model_path} to INT8...")
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    return output_path
+
+
+def create_session(model_path, quantize=ONNX_QUANTIZE, intra_op_threads=ONNX_INTRA_OP_THREADS):
+    import onnxruntime as ort
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"ONNX model not found: {model_path} (run `python onnx_masking.py` to export it)")
+    if quantize:
+        model_path = quantize_model(model_path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    print(f"Loading ONNX model {model_path}...")
+    return ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def letterbox(image, size=POSE_INPUT_SIZE):
+    """Resize keeping aspect ratio and pad to size x size (as ultralytics does). Returns (array, scale, (left, top))."""
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    left, top = int(round((size - new_w) / 2 - 0.1)), int(round((size - new_h) / 2 - 0.1))
+    padded = np.full((size, size, 3), 114, dtype=np.uint8)
+    padded[top:top + new_h, left:left + new_w] = resized
+    return padded, scale, (left, top)
+
+
+class OnnxMaskModels(MaskModels):
+    """
+    Drop-in replacement for MaskModels backed by ONNX Runtime.
+
+    Each session is created on first use and shared by all threads
+    (InferenceSession.run is thread-safe).
+    """
+
+    def __init__(
+        self,
+        pose_model_path=ONNX_POSE_MODEL,
+        seg_model_path=ONNX_SEG_MODEL,
+        quantize=ONNX_QUANTIZE,
+        intra_op_threads=ONNX_INTRA_OP_THREADS,
+        pose_confidence=ONNX_POSE_CONFIDENCE
+    ):
+        super().__init__(pose_model=None, rembg_model=f"onnx:{os.path.basename(seg_model_path)}")
+        self.pose_model_path = pose_model_path
+        self.seg_model_path = seg_model_path
+        self.quantize = quantize
+        self.intra_op_threads = intra_op_threads
+        self.pose_confidence = pose_confidence
+        self.backend = "onnx-int8" if quantize else "onnx"
+
+        self._sessions = {}
+        self._session_lock = threading.Lock()
+
+    def _session(self, model_path):
+        with self._session_lock:
+            if model_path not in self._sessions:
+                self._sessions[model_path] = create_session(model_path, self.quantize, self.intra_op_threads)
+            return self._sessions[model_path]
+
+    def detect_keypoints(self, image):
+        try:
+            session = self._session(self.pose_model_path)
+            padded, scale, (left, top) = letterbox(np.asarray(image.convert("RGB")))
+            blob = padded.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+
+            # Output [1, 56, anchors]: box (cx, cy, w, h), person score, 17 x (x, y, visibility)
+            predictions = session.run(None, {session.get_inputs()[0].name: blob})[0][0].T
+            best = int(np.argmax(predictions[:, 4]))
+            if predictions[best, 4] < self.pose_confidence:
+                return None
+
+            # Highest-scoring person, which is what results[0] is after NMS in ultralytics
+            keypoints = predictions[best, 5:].reshape(17, 3)
+            xy = (keypoints[:, :2] - (left, top)) / scale
+            xy[keypoints[:, 2] < KEYPOINT_VISIBILITY] = 0
+            return xy.astype(np.float32)
+        except Exception as e:
+            print(f"⚠️ Pose detection failed: {e}")
+            return None
+
+    def segment(self, image):
+        try:
+            session = self._session(self.seg_model_path)
+            rgb = np.asarray(image.convert("RGB"))
+            h, w = rgb.shape[:2]
+
+            # U2Net preprocessing, as in rembg
+            x = cv2.resize(rgb, (SEG_INPUT_SIZE, SEG_INPUT_SIZE), interpolation=cv2.INTER_LANCZOS4).astype(np.float32)
+            x = x / max(float(x.max()), 1e-6)
+            x = (x - (0.485, 0.456, 0.406)) / (0.229, 0.224, 0.225)
+            blob = x.transpose(2, 0, 1)[None].astype(np.float32)
+
+            prediction = session.run(None, {session.get_inputs()[0].name: blob})[0][0, 0]
+            low, high = prediction.min(), prediction.max()
+            prediction = (prediction - low) / max(high - low, 1e-6)
+            alpha = cv2.resize((prediction * 255).astype(np.uint8), (w, h), interpolation=cv2.INTER_LANCZOS4)
+            print("✅ Generated Silhouette with ONNX Runtime")
+            return alpha
+        except Exception as e:
+            print(f"⚠️ ONNX segmentation failed: {e}")
+            return None
+
+
+def export_models(model_dir=ONNX_MODEL_DIR, quantize=False):
+    """Export YOLOv8n-pose to ONNX and copy rembg's U2Net graph into `model_dir`."""
+    import shutil
+
+    os.makedirs(model_dir, exist_ok=True)
+
+    from ultralytics import YOLO
+    exported = YOLO("yolov8n-pose.pt").export(format="onnx", imgsz=POSE_INPUT_SIZE, dynamic=False, simplify=True)
+    pose_path = os.path.join(model_dir, "yolov8n-pose.onnx")
+    shutil.move(exported, pose_path)
+
+    # rembg downloads its ONNX graph on first use, to U2NET_HOME (default ~/.u2net)
+    from rembg import new_session
+    new_session("u2net")
+    u2net_home = os.getenv("U2NET_HOME", os.path.expanduser(os.path.join("~", ".u2net")))
+    seg_path = os.path.join(model_dir, "u2net.onnx")
+    shutil.copyfile(os.path.join(u2net_home, "u2net.onnx"), seg_path)
+
+    for path in (pose_path, seg_path):
+        print(f"✅ Exported {path}")
+        if quantize:
+            print(f"✅ Quantized {quantize_model(path)}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the masking models to ONNX")
+    parser.add_argument("--dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--quantize", action="store_true", help="Also write INT8-quantized copies")
+    args = parser.parse_args()
+    export_models(args.dir, args.quantize)
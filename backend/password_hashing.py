@@ -0,0 +1,64 @@
+# Password Hashing
+# bcrypt is deliberately slow (~0.25 s per hash at cost 12), so the async handlers hash
+# and verify passwords on a bounded thread pool instead of the event loop. bcrypt
+# releases the GIL while hashing, so the pool also uses AUTH_MAX_WORKERS cores at once;
+# requests beyond that wait their turn without blocking anything else.
+# BCRYPT_ROUNDS is the cost for new hashes. A stored hash with a different cost is
+# replaced with one at the current cost the next time its user logs in.
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+AUTH_MAX_WORKERS = int(os.getenv("AUTH_MAX_WORKERS", min(4, os.cpu_count() or 1)))
+
+# min/max pin the accepted cost, so needs_update() flags hashes made at any other cost
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """Async facade over `pwd_context`, running every bcrypt call on its own thread pool."""
+
+    def __init__(self, context=pwd_context, max_workers=AUTH_MAX_WORKERS):
+        self.context = context
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth")
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args))
+
+    async def hash(self, password):
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, hashed):
+        return await self._run(self.context.verify, password, hashed)
+
+    async def verify_and_update(self, password, hashed):
+        """Return (valid, new_hash); new_hash is set when the stored hash should be replaced."""
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_hasher = None
+
+
+def get_password_hasher():
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher()
+    return _hasher
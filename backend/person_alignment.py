@@ -0,0 +1,39 @@
+# Person Alignment
+# Resizes the person photo to the model resolution once and hands the same pixels to
+# the masker (PIL image / uint8 array) and to the pipeline (normalized tensor). The
+# tensor matches VaeImageProcessor.preprocess exactly, and the image is what its
+# postprocess round-trip used to reconstruct, without the extra full-size passes.
+
+from typing import NamedTuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+class AlignedPerson(NamedTuple):
+    image: Image.Image    # height x width RGB, as seen by the pose/segmentation models
+    array: np.ndarray     # (H, W, 3) uint8, the same pixels (mask cache key)
+    tensor: torch.Tensor  # [1, 3, H, W] float32 in [-1, 1], as encoded by the VAE
+
+
+def align_person(image, height, width):
+    """
+    Resize an RGB PIL image to height x width (LANCZOS, like VaeImageProcessor) and
+    build its array and tensor forms.
+    """
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    array = np.asarray(image)
+    # Same operations, in the same order, as VaeImageProcessor.preprocess, so the
+    # tensor is bit-identical to what the pipeline used to get
+    normalized = torch.from_numpy((array.astype(np.float32) / 255.0).transpose(2, 0, 1)).unsqueeze(0)
+    return AlignedPerson(image, array, 2.0 * normalized - 1.0)
+
+
+def mask_to_tensor(mask):
+    """
+    (H, W) uint8 mask -> [1, 1, H, W] float32 of 0/1, as the binarizing mask
+    VaeImageProcessor would produce (x / 255 >= 0.5).
+    """
+    return torch.from_numpy((mask >= 128).astype(np.float32))[None, None]
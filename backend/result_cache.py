@@ -0,0 +1,136 @@
+# Try-On Result Cache
+# The pipeline runs with a fixed seed, so the same person photo, garment image, try-on
+# type, resolution and inference parameters always produce the same result. Completed
+# try-ons are recorded in MongoDB under a hash of those inputs, and a repeat request
+# returns the stored history record instead of running the model again.
+
+import hashlib
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_RESULT_CACHE = os.getenv("TRYON_RESULT_CACHE", "true").lower() in ("1", "true", "yes")
+TRYON_RESULT_CACHE_TTL_DAYS = int(os.getenv("TRYON_RESULT_CACHE_TTL_DAYS", 30))  # 0 = keep until invalidated
+
+
+class TryOnResultCache:
+    """
+    Entries are keyed per user, so a hit only ever returns the user's own history.
+
+    Each entry stores the history record id and the fields needed to recreate the
+    record if the user has since deleted it from their history.
+    """
+
+    def __init__(self, collection, enabled=TRYON_RESULT_CACHE, ttl_days=TRYON_RESULT_CACHE_TTL_DAYS):
+        self.collection = collection
+        self.enabled = enabled
+        self.ttl_days = ttl_days
+        self.hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self):
+        if not self.enabled:
+            return
+        try:
+            await self.collection.create_index("product_id")
+            await self._ensure_ttl_index()
+        except Exception as e:
+            print(f"⚠️ Failed to create try-on result cache indexes: {e}")
+
+    async def _ensure_ttl_index(self):
+        # create_index raises IndexOptionsConflict when the TTL index exists with another
+        # expireAfterSeconds, so a changed TRYON_RESULT_CACHE_TTL_DAYS is applied with collMod
+        ttl_seconds = self.ttl_days * 86400
+        existing = None
+        for name, info in (await self.collection.index_information()).items():
+            if info.get("key") == [("created_at", 1)] and "expireAfterSeconds" in info:
+                existing = (name, info["expireAfterSeconds"])
+
+        if existing is None:
+            if ttl_seconds > 0:
+                await self.collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+        elif ttl_seconds <= 0:
+            await self.collection.drop_index(existing[0])
+            print("Try-on result cache TTL index dropped (entries now kept until invalidated)")
+        elif existing[1] != ttl_seconds:
+            await self.collection.database.command(
+                "collMod", self.collection.name,
+                index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": ttl_seconds}
+            )
+            print(f"Try-on result cache TTL changed to {self.ttl_days} days")
+
+    @staticmethod
+    def person_hash(content):
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def make_key(user_id, person_hash, product, profile):
+        """
+        Everything that changes the output: the photo, the garment image (its URL changes
+        with every upload, so it doubles as the image version), the try-on type (which
+        picks the mask) and the inference parameters.
+        """
+        inputs = "|".join(str(part) for part in (
+            user_id,
+            person_hash,
+            product["_id"],
+            product.get("image_url"),
+            product.get("tryon_type"),
+            f"{profile.height}x{profile.width}",
+            profile.num_inference_steps,
+            profile.guidance_scale,
+            profile.scheduler,
+        ))
+        return hashlib.sha256(inputs.encode()).hexdigest()
+
+    async def get(self, key):
+        if not self.enabled:
+            return None
+        entry = await self.collection.find_one({"_id": key})
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, key, record):
+        """Remember a saved history record under `key`."""
+        if not self.enabled:
+            return
+        await self.collection.replace_one({"_id": key}, {
+            "product_id": record["product_id"],
+            "tryon_id": record["_id"],
+            "fields": {
+                "original_image_url": record.get("original_image_url"),
+                "result_image_url": record.get("result_image_url"),
+                "thumbnail_url": record.get("thumbnail_url"),
+                "processing_time": record.get("processing_time", 0.0),
+                "metadata": record.get("metadata", {}),
+            },
+            "created_at": datetime.utcnow(),
+        }, upsert=True)
+
+    async def forget_original(self, url):
+        """Clear an original-photo URL whose upload failed from the cached fields."""
+        if not self.enabled:
+            return
+        await self.collection.update_many({"fields.original_image_url": url}, {"$set": {"fields.original_image_url": None}})
+
+    async def invalidate_product(self, product_id):
+        """Drop every entry for a product (e.g. after its image is replaced)."""
+        if not self.enabled:
+            return
+        if ObjectId.is_valid(product_id):
+            await self.collection.delete_many({"product_id": ObjectId(product_id)})
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_days": self.ttl_days,
+        }
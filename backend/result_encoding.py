@@ -0,0 +1,78 @@
+# Result Encoding
+# Encodes try-on results for storage: the full image as JPEG or WebP (PNG only when
+# asked for) and a small thumbnail for the history list. Encoding runs on the
+# inference worker that produced the image, never on the event loop.
+
+import io
+import os
+from typing import NamedTuple
+
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_OUTPUT_FORMAT = os.getenv("TRYON_OUTPUT_FORMAT", "jpeg").lower()  # jpeg, webp, png
+TRYON_OUTPUT_QUALITY = int(os.getenv("TRYON_OUTPUT_QUALITY", 90))
+TRYON_THUMBNAIL_SIZE = int(os.getenv("TRYON_THUMBNAIL_SIZE", 256))  # longest side, px
+TRYON_THUMBNAIL_QUALITY = int(os.getenv("TRYON_THUMBNAIL_QUALITY", 75))
+
+# format -> (PIL format, content type, file extension)
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "png": ("PNG", "image/png", "png"),
+}
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    content_type: str
+    extension: str
+
+
+class EncodedResult(NamedTuple):
+    image: EncodedImage
+    thumbnail: EncodedImage
+
+
+def encode_image(image, output_format=TRYON_OUTPUT_FORMAT, quality=TRYON_OUTPUT_QUALITY):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown TRYON_OUTPUT_FORMAT '{output_format}', expected one of {list(OUTPUT_FORMATS)}")
+    pil_format, content_type, extension = OUTPUT_FORMATS[output_format]
+
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(buffer, format=pil_format)
+    else:
+        image.convert("RGB").save(buffer, format=pil_format, quality=quality)
+    return EncodedImage(buffer.getvalue(), content_type, extension)
+
+
+def make_thumbnail(image, size=TRYON_THUMBNAIL_SIZE):
+    thumbnail = image.copy()
+    thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return thumbnail
+
+
+def encode_result(
+    image,
+    output_format=TRYON_OUTPUT_FORMAT,
+    quality=TRYON_OUTPUT_QUALITY,
+    thumbnail_size=TRYON_THUMBNAIL_SIZE,
+    thumbnail_quality=TRYON_THUMBNAIL_QUALITY
+):
+    """Encode a result PIL image and its thumbnail, both in `output_format`."""
+    return EncodedResult(
+        encode_image(image, output_format, quality),
+        encode_image(make_thumbnail(image, thumbnail_size), output_format, thumbnail_quality),
+    )
+
+
+def sniff_image_type(data):
+    """(content_type, extension) of uploaded image bytes, from their magic number; JPEG if unknown."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png", "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    return "image/jpeg", "jpg"
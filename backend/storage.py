@@ -0,0 +1,148 @@
+# Async Storage Layer
+# Uploads go through a bounded thread pool so the blocking Supabase SDK never runs on
+# the event loop, and independent uploads can run concurrently. A local-filesystem
+# backend stands in for Supabase when testing offline.
+
+import asyncio
+import functools
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")  # supabase, local
+STORAGE_MAX_WORKERS = int(os.getenv("STORAGE_MAX_WORKERS", 4))
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "storage")
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL", "http://localhost:8000/storage")
+
+# Failed background uploads remembered for upload_failed()
+FAILED_UPLOADS_KEPT = 1024
+
+
+class StorageError(Exception):
+    """Raised when an upload fails."""
+
+
+class SupabaseStorageBackend:
+    def __init__(self):
+        from fast_supabase import get_supabase
+        self.client = get_supabase()
+
+    def upload(self, bucket, path, content, content_type):
+        self.client.storage.from_(bucket).upload(path, content, {"content-type": content_type})
+
+    def get_public_url(self, bucket, path):
+        return self.client.storage.from_(bucket).get_public_url(path)
+
+
+class LocalStorageBackend:
+    """Writes objects under `root/<bucket>/<path>`; URLs point at `base_url/<bucket>/<path>`."""
+
+    def __init__(self, root=LOCAL_STORAGE_DIR, base_url=LOCAL_STORAGE_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _file_path(self, bucket, path):
+        file_path = os.path.normpath(os.path.join(self.root, bucket, path))
+        if not file_path.startswith(os.path.normpath(self.root)):
+            raise StorageError(f"Invalid storage path: {path}")
+        return file_path
+
+    def upload(self, bucket, path, content, content_type):
+        file_path = self._file_path(bucket, path)
+        if os.path.exists(file_path):
+            raise StorageError(f"Object already exists: {bucket}/{path}")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(content)
+
+    def get_public_url(self, bucket, path):
+        return f"{self.base_url}/{bucket}/{path}"
+
+
+class AsyncStorage:
+    """
+    Async facade over a blocking storage backend.
+
+    `upload` waits for the object to be stored. `upload_in_background` returns the
+    public URL immediately and stores the object afterwards, for non-critical files
+    such as the user's original try-on photo. The URL may be saved before the upload
+    fails, so callers can pass `on_failure` and check `upload_failed` to clear it.
+    """
+
+    def __init__(self, backend, max_workers=STORAGE_MAX_WORKERS):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self._background = set()
+        self._failed_urls = OrderedDict()
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args))
+
+    async def upload(self, bucket, path, content, content_type):
+        """Store `content` and return its public URL."""
+        try:
+            await self._run(self.backend.upload, bucket, path, content, content_type)
+            return self.backend.get_public_url(bucket, path)
+        except StorageError:
+            raise
+        except Exception as e:
+            raise StorageError(str(e)) from e
+
+    def upload_in_background(self, bucket, path, content, content_type, on_failure=None):
+        """
+        Schedule an upload and return its public URL without waiting for it.
+
+        If the upload fails, `upload_failed(url)` turns true and `on_failure(url)`
+        (a coroutine function) is awaited.
+        """
+        url = self.backend.get_public_url(bucket, path)
+        task = asyncio.create_task(self._upload_logged(bucket, path, content, content_type, url, on_failure))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return url
+
+    async def _upload_logged(self, bucket, path, content, content_type, url, on_failure):
+        try:
+            await self.upload(bucket, path, content, content_type)
+        except StorageError as e:
+            print(f"Background upload of {bucket}/{path} failed: {e}")
+            self._failed_urls[url] = True
+            while len(self._failed_urls) > FAILED_UPLOADS_KEPT:
+                self._failed_urls.popitem(last=False)
+            if on_failure is not None:
+                try:
+                    await on_failure(url)
+                except Exception as cleanup_error:
+                    print(f"Cleanup after the failed upload of {bucket}/{path} failed: {cleanup_error}")
+
+    def upload_failed(self, url):
+        """True if a recent background upload to `url` failed."""
+        return url in self._failed_urls
+
+    async def drain(self):
+        """Wait for pending background uploads (e.g. on shutdown)."""
+        if self._background:
+            await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def create_storage_backend(kind=STORAGE_BACKEND):
+    if kind == "local":
+        return LocalStorageBackend()
+    return SupabaseStorageBackend()
+
+
+_storage = None
+
+def get_storage() -> AsyncStorage:
+    global _storage
+    if _storage is None:
+        _storage = AsyncStorage(create_storage_backend())
+    return _storage
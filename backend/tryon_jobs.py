@@ -0,0 +1,324 @@
+# Try-On Job Queue
+# Runs CatVTON inference on a dedicated, bounded worker pool so the API event loop
+# stays responsive while diffusion runs, and tracks job state in a pluggable store.
+
+import asyncio
+import functools
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_WORKERS = int(os.getenv("TRYON_WORKERS", 1))
+# 0 = run the engine in the API process; N = N forked worker processes sharing the weights (inference_processes.py)
+TRYON_WORKER_PROCESSES = int(os.getenv("TRYON_WORKER_PROCESSES", 0))
+TRYON_QUEUE_SIZE = int(os.getenv("TRYON_QUEUE_SIZE", 8))
+TRYON_JOB_STORE = os.getenv("TRYON_JOB_STORE", "mongo")  # mongo, memory
+
+# Each queue stamps its unfinished jobs this often; queued/processing jobs whose stamp
+# is older than JOB_STALE_AFTER lost their process (restart, crash) and are failed
+JOB_HEARTBEAT_SECONDS = 30
+JOB_STALE_AFTER = timedelta(seconds=3 * JOB_HEARTBEAT_SECONDS)
+INTERRUPTED_JOB_ERROR = "Interrupted by a server restart"
+
+
+class QueueFullError(Exception):
+    """Raised when the inference pool cannot accept another job."""
+
+
+class InferenceWorkerPool:
+    """
+    Thread pool dedicated to model inference.
+
+    Capacity is `max_workers` running jobs plus `max_pending` waiting ones.
+    Callers reserve a slot before doing any work so overload is rejected
+    up-front instead of piling requests onto the executor queue. With worker
+    processes, each thread just waits on one remote job, so there is one thread
+    per job the processes can run at once.
+    """
+
+    def __init__(self, max_workers=TRYON_WORKERS * max(1, TRYON_WORKER_PROCESSES), max_pending=TRYON_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tryon-worker")
+        self._in_flight = 0
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def check_capacity(self):
+        """Raise QueueFullError if a slot could not be reserved right now (without reserving one)."""
+        if self._in_flight >= self.capacity:
+            raise QueueFullError(f"Try-on queue is full ({self._in_flight}/{self.capacity})")
+
+    def reserve(self):
+        self.check_capacity()
+        self._in_flight += 1
+
+    def release(self):
+        self._in_flight = max(0, self._in_flight - 1)
+
+    @contextmanager
+    def slot(self):
+        self.reserve()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, fn, *args, on_start=None, **kwargs):
+        """
+        Run a blocking callable on an inference worker thread. `on_start`, if given, is
+        called on the event loop once a worker thread picks the call up.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        if on_start is None:
+            return await loop.run_in_executor(self.executor, call)
+
+        def started_call():
+            loop.call_soon_threadsafe(on_start)
+            return call()
+
+        return await loop.run_in_executor(self.executor, started_call)
+
+    async def stream(self, gen_fn, *args, **kwargs):
+        """
+        Run a blocking generator on an inference worker thread and yield its items
+        on the event loop as they are produced.
+
+        Reserves a slot itself (QueueFullError when full) and holds it until the
+        generator has actually finished on its thread, not just until the consumer
+        stops. `gen_fn` is called with a `cancel` threading.Event, set once the
+        consumer stops early (e.g. the client disconnected); it is also checked
+        between items, so an abandoned generator is not resumed.
+        """
+        self.reserve()
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        cancel = threading.Event()
+
+        def produce():
+            items = gen_fn(*args, cancel=cancel, **kwargs)
+            try:
+                for item in items:
+                    if cancel.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (None, e))
+            finally:
+                items.close()
+                loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+        try:
+            future = loop.run_in_executor(self.executor, produce)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(lambda _: self.release())
+
+        try:
+            while True:
+                item, error = await queue.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    break
+                yield item
+            await future
+        finally:
+            cancel.set()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InMemoryJobStore:
+    """Process-local job store, used for tests and single-node setups without MongoDB."""
+
+    def __init__(self):
+        self._jobs = {}
+
+    async def create(self, record):
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {**record, "_id": job_id}
+        return job_id
+
+    async def add_completed(self, record):
+        return await self.create({**record, "status": "completed"})
+
+    async def update(self, job_id, fields):
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    # Jobs can't outlive the process that holds them, so there is nothing to recover
+    async def heartbeat(self, job_ids):
+        pass
+
+    async def fail_interrupted(self, stale_before):
+        return 0
+
+
+class MongoJobStore:
+    """Stores jobs as `tryon_history` records, using their `status` field as the job state."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def create(self, record):
+        result = await self.collection.insert_one(dict(record))
+        return str(result.inserted_id)
+
+    async def add_completed(self, record):
+        # A completed try-on's history record already is its job
+        return str(record["_id"])
+
+    async def update(self, job_id, fields):
+        await self.collection.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+
+    async def get(self, job_id):
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.collection.find_one({"_id": ObjectId(job_id)})
+
+    async def heartbeat(self, job_ids):
+        await self.collection.update_many(
+            {"_id": {"$in": [ObjectId(job_id) for job_id in job_ids]}},
+            {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+
+    async def fail_interrupted(self, stale_before):
+        """Fail unfinished jobs nobody has stamped since `stale_before`; returns how many."""
+        result = await self.collection.update_many(
+            {
+                "status": {"$in": ["queued", "processing"]},
+                "$or": [{"heartbeat_at": {"$lt": stale_before}}, {"heartbeat_at": {"$exists": False}}],
+            },
+            {"$set": {"status": "failed", "error": INTERRUPTED_JOB_ERROR}}
+        )
+        return result.modified_count
+
+
+class TryOnJobQueue:
+    """
+    Accepts try-on jobs, returns their id immediately and runs them in the background.
+
+    Job state moves queued -> processing -> completed | failed. The job callable is an
+    async function taking an `on_start` callback and returning the fields to store on
+    completion; it is expected to push its blocking work onto `pool` with
+    `pool.run(..., on_start=on_start)`, which moves the job to processing.
+
+    Jobs only live as tasks in this process, so `start()` runs a heartbeat that stamps
+    them and fails other processes' jobs whose stamps stopped (see JOB_STALE_AFTER).
+    """
+
+    def __init__(self, store, pool):
+        self.store = store
+        self.pool = pool
+        self._tasks = set()
+        self._active = set()
+        self._heartbeat_task = None
+
+    async def start(self):
+        await self._fail_interrupted()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                if self._active:
+                    await self.store.heartbeat(list(self._active))
+            except Exception as e:
+                print(f"⚠️ Try-on job heartbeat failed: {e}")
+            await self._fail_interrupted()
+
+    async def _fail_interrupted(self):
+        try:
+            failed = await self.store.fail_interrupted(datetime.utcnow() - JOB_STALE_AFTER)
+            if failed:
+                print(f"⚠️ Marked {failed} interrupted try-on job(s) as failed")
+        except Exception as e:
+            print(f"⚠️ Failed to check for interrupted try-on jobs: {e}")
+
+    async def submit(self, record, job_fn, on_complete=None):
+        """
+        Store the job and start it. `on_complete(job_id, fields)`, if given, is awaited
+        after the job's result is stored.
+        """
+        self.pool.reserve()
+        try:
+            job_id = await self.store.create({**record, "status": "queued", "heartbeat_at": datetime.utcnow()})
+        except Exception:
+            self.pool.release()
+            raise
+
+        self._active.add(job_id)
+        task = asyncio.create_task(self._run(job_id, job_fn, on_complete))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    async def get(self, job_id):
+        return await self.store.get(job_id)
+
+    async def add_completed(self, record):
+        """
+        Register a try-on that finished without running a job (a result-cache hit) as a
+        completed job, so it can be polled like any other. Returns its job id.
+        """
+        return await self.store.add_completed(record)
+
+    async def _run(self, job_id, job_fn, on_complete=None):
+        started = []
+
+        def on_start():
+            started.append(asyncio.ensure_future(
+                self.store.update(job_id, {"status": "processing", "started_at": datetime.utcnow()})
+            ))
+
+        try:
+            try:
+                fields = await job_fn(on_start)
+            finally:
+                # The final state must not be overwritten by a late "processing" write
+                await asyncio.gather(*started, return_exceptions=True)
+            await self.store.update(job_id, {**fields, "status": "completed"})
+        except Exception as e:
+            print(f"❌ Try-on job {job_id} failed: {e}")
+            await self.store.update(job_id, {"status": "failed", "error": str(getattr(e, "detail", e))})
+            return
+        finally:
+            self._active.discard(job_id)
+            self.pool.release()
+
+        if on_complete is not None:
+            try:
+                await on_complete(job_id, fields)
+            except Exception as e:
+                print(f"⚠️ Try-on job {job_id} completion hook failed: {e}")
+
+
+def create_job_store(kind=TRYON_JOB_STORE):
+    if kind == "memory":
+        return InMemoryJobStore()
+    from database import tryon_history_collection
+    return MongoJobStore(tryon_history_collection)
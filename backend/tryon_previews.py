@@ -0,0 +1,46 @@
+# Try-On Previews
+# Cheap low-resolution previews of an in-progress diffusion run. Instead of running
+# the VAE decoder, latents are projected straight to RGB with a fixed linear map,
+# which costs a single small matmul per preview.
+
+import io
+import os
+
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_PREVIEW_EVERY = int(os.getenv("TRYON_PREVIEW_EVERY", 5))
+TRYON_PREVIEW_QUALITY = int(os.getenv("TRYON_PREVIEW_QUALITY", 70))
+
+# Approximate SD 1.x latent -> RGB projection (rows: latent channels, cols: R, G, B)
+LATENT_RGB_FACTORS = [
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+]
+
+
+def latent_preview(latents, upscale=2):
+    """
+    Project the first latent of a batch [B, 4, h, w] to an RGB PIL image.
+
+    The result is 1/8 of the output resolution, optionally upscaled.
+    """
+    import torch
+
+    factors = torch.tensor(LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device)
+    rgb = latents[0].float().permute(1, 2, 0) @ factors
+    rgb = ((rgb + 1.0) / 2.0).clamp(0, 1).mul(255).byte().cpu().numpy()
+    image = Image.fromarray(rgb)
+    if upscale > 1:
+        image = image.resize((image.width * upscale, image.height * upscale), Image.Resampling.BILINEAR)
+    return image
+
+
+def encode_preview(image, quality=TRYON_PREVIEW_QUALITY):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
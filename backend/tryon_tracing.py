@@ -0,0 +1,152 @@
+# Try-On Tracing
+# Per-stage timing for try-on requests. A TryOnTrace collects the request's spans
+# (garment fetch, decode, alignment, pose, rembg, mask filters, inference, encode,
+# uploads) for the per-stage breakdown stored in the history metadata, and observes
+# them into process-wide Prometheus-style histograms served at GET /metrics.
+#
+# Spans inside the engine are recorded with `span()` on the inference thread that
+# runs the request and handed back through the run's `report` dict, so they arrive
+# the same way from a worker thread or a forked worker process.
+
+import contextlib
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; stages range from a few ms (mask filters) to minutes (CPU inference)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    """Cumulative histogram with optional labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {values: list(data) for values, data in sorted(self._series.items())}
+        for values, data in series.items():
+            labels = "".join(f'{name}="{value}",' for name, value in zip(self.labels, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {data[-1]}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {data[-2]}")
+            lines.append(f"{self.name}_count{suffix} {data[-1]}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("tryon_stage_seconds", "Time spent in each try-on stage.", ("stage",))
+REQUEST_SECONDS = Histogram("tryon_request_seconds", "End-to-end processing time of completed try-ons.")
+
+
+def render_metrics():
+    """All try-on histograms, for GET /metrics."""
+    return "\n".join(h.render() for h in (STAGE_SECONDS, REQUEST_SECONDS)) + "\n"
+
+
+class TryOnTrace:
+    """
+    Spans of one try-on request, as (stage, ms) in the order they finished.
+
+    `span()` on a trace is not nested, so it is safe for concurrent coroutines of
+    the same request on the event loop.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, round(seconds * 1000.0, 2)))
+
+    def extend(self, spans):
+        """Add spans recorded elsewhere (e.g. `report["stages"]` from the engine)."""
+        self.spans.extend((stage, ms) for stage, ms in spans)
+
+    def breakdown(self):
+        """Total ms per stage, for the history metadata."""
+        totals = {}
+        for stage, ms in self.spans:
+            totals[stage] = round(totals.get(stage, 0.0) + ms, 2)
+        return totals
+
+    def observe(self, total_seconds=None):
+        """Record the spans (and the request's total time, if given) in the histograms."""
+        for stage, ms in self.spans:
+            STAGE_SECONDS.observe(ms / 1000.0, stage)
+        if total_seconds is not None:
+            REQUEST_SECONDS.observe(total_seconds)
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def collect_spans(report):
+    """
+    Record `span()`s on this thread for the block and append them to `report["stages"]`.
+
+    Does nothing if `report` is None.
+    """
+    if report is None:
+        yield
+        return
+    previous = getattr(_local, "trace", None), getattr(_local, "children", None)
+    trace = TryOnTrace()
+    _local.trace, _local.children = trace, []
+    try:
+        yield
+    finally:
+        _local.trace, _local.children = previous
+        report["stages"] = report.get("stages", []) + trace.spans
+
+
+@contextlib.contextmanager
+def span(stage):
+    """
+    Time a stage of the current request on this thread (see `collect_spans`).
+
+    Spans nest: an enclosing span records only its own time, so pose detection
+    inside the mask filters is not counted twice. Free when nothing is collecting.
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    children = _local.children
+    children.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        own = elapsed - children.pop()
+        if children:
+            children[-1] += elapsed
+        trace.add(stage, own)